@@ -0,0 +1,381 @@
+# batch.py
+
+# Runs the flood mapping workflow of train.py over many scenes.
+#
+#   python batch.py manifest.csv                          # all scenes, one at a time
+#   python batch.py manifest.csv --scene-workers 4        # 4 scenes at a time
+#   python batch.py manifest.csv --config settings.json   # override the settings below
+#   python batch.py manifest.csv --validate-only          # only check the headers
+#
+# The manifest is a CSV file with the columns name, s1, s2 and mask (paths relative to
+# the manifest), or a JSON list of objects with the same keys.
+#
+# Every scene runs through four stages: scan (feature statistics and training samples),
+# train, predict and postprocess. The outputs of every stage are cached under a key that
+# hashes the contents of the input files, the settings the stage depends on and the key
+# of the stage before it. A re-run reuses every stage whose key did not change, so e.g.
+# changing min_mapping_unit only re-runs postprocess, and changing the features re-runs
+# everything.
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from preprocessing.data_loader import read_geotiff_meta, get_tile_windows
+from preprocessing.statistics import save_statistics, load_statistics, feature_ranges
+from preprocessing.features import FeatureEngine
+from models.random_forest import train_random_forest
+from models.compiled_forest import compile_forest, save_compiled_forest
+from evaluation.metrics import ConfusionMatrix
+from profiling import PROFILER, stage
+from pipeline import (scan_scene, predict_scene, postprocess_scene, required_bands,
+                      DEFAULT_FEATURES, S1_BAND_INDEX, S2_BAND_INDEX)
+
+# The same settings as the constants in train.py's main
+DEFAULT_CONFIG = {
+    'tile_size': 1024,
+    'filter_size': 3,
+    'features': DEFAULT_FEATURES,
+    'speckle_filter': 'median',
+    'samples_per_class': 100000,
+    'holdout_block_size': 256,
+    'holdout_fraction': 0.2,
+    'seed': 42,
+    'clip_percentiles': [1.0, 99.0],
+    'predict_with_compiled': False,
+    'output_probability': False,
+    'output_cog': {'codec': 'deflate', 'predictor': 2},
+    'morphology_radius': 1,
+    'min_mapping_unit': 50,
+}
+
+# The settings every stage depends on (besides the stage before it)
+STAGE_SETTINGS = {
+    'scan': ('tile_size', 'filter_size', 'features', 'speckle_filter', 'samples_per_class',
+             'holdout_block_size', 'holdout_fraction', 'seed'),
+    'train': ('clip_percentiles',),
+    'predict': ('predict_with_compiled', 'output_probability', 'output_cog'),
+    'postprocess': ('morphology_radius', 'min_mapping_unit'),
+}
+
+
+def read_manifest(path):
+    """
+    Reads a manifest of scenes (CSV or JSON, see the top of this file).
+
+    Returns:
+        list: One dict per scene with the keys name, s1, s2 and mask (absolute paths).
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as f:
+        rows = json.load(f) if path.endswith('.json') else list(csv.DictReader(f))
+    scenes = []
+    for index, row in enumerate(rows):
+        scene = {'name': row.get('name') or f'scene_{index:04d}'}
+        for role in ('s1', 's2', 'mask'):
+            scene[role] = os.path.join(base, row[role].strip())
+        scenes.append(scene)
+    names = [scene['name'] for scene in scenes]
+    if len(set(names)) != len(names):
+        raise ValueError("Scene names in the manifest must be unique.")
+    return scenes
+
+
+def validate_scene(scene, features):
+    """
+    Checks a scene from the file headers only, without reading any pixels: the files
+    must exist, have the same size, CRS and geotransform (i.e. be co-registered), the
+    mask must have one band and the images the bands the features need.
+
+    Returns:
+        list: The problems found, empty if the scene is fine.
+    """
+    metas = {role: read_geotiff_meta(scene[role]) for role in ('s1', 's2', 'mask')}
+    problems = [f"cannot read {role} file {scene[role]}" for role, meta in metas.items() if meta is None]
+    if problems:
+        return problems
+
+    s1, s2, mask = metas['s1'], metas['s2'], metas['mask']
+    if len({(m['height'], m['width']) for m in metas.values()}) != 1:
+        problems.append("the files have different sizes: " + ", ".join(
+            f"{role} {m['height']}x{m['width']}" for role, m in metas.items()))
+    if len({m['crs'] for m in metas.values()}) != 1:
+        problems.append("the files have different CRSs")
+    if any(not m['transform'].almost_equals(s1['transform']) for m in metas.values()):
+        problems.append("the files have different geotransforms (not co-registered)")
+    if mask['count'] != 1:
+        problems.append(f"the mask has {mask['count']} bands instead of 1")
+
+    s1_bands, s2_bands = required_bands(features)
+    if s1['count'] <= max([S1_BAND_INDEX[b] for b in s1_bands], default=-1):
+        problems.append(f"the Sentinel-1 file has too few bands for the features {features}")
+    if s2['count'] <= max([S2_BAND_INDEX[b] for b in s2_bands], default=-1):
+        problems.append(f"the Sentinel-2 file has too few bands for the features {features}")
+    return problems
+
+
+def content_hash(path, cache_dir):
+    """
+    Returns the SHA-256 of a file's contents. Hashes are remembered per path, size and
+    modification time, so every version of a file is only read once.
+    """
+    info = os.stat(path)
+    memo = os.path.join(cache_dir, 'hashes',
+                        hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + '.json')
+    signature = [info.st_size, info.st_mtime_ns]
+    if os.path.exists(memo):
+        with open(memo) as f:
+            known = json.load(f)
+        if known['signature'] == signature:
+            return known['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 23), b''):
+            digest.update(chunk)
+    _write_json(memo, {'path': os.path.abspath(path), 'signature': signature, 'sha256': digest.hexdigest()})
+    return digest.hexdigest()
+
+
+def stage_key(stage, config, inputs):
+    """Hashes a stage name, the settings it depends on and its inputs into a cache key."""
+    settings = {name: config[name] for name in STAGE_SETTINGS[stage]}
+    text = json.dumps({'stage': stage, 'settings': settings, 'inputs': inputs}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+
+def _write_json(path, data):
+    # Written under a temporary name and renamed, so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary, path)
+
+
+class StageCache:
+    """
+    Stage outputs under cache_dir/<stage>/<key>/. A stage counts as done once its
+    stage.json is there, which is written last.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def directory(self, stage, key):
+        path = os.path.join(self.cache_dir, stage, key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def load(self, stage, key):
+        path = os.path.join(self.cache_dir, stage, key, 'stage.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, stage, key, result):
+        _write_json(os.path.join(self.cache_dir, stage, key, 'stage.json'), result)
+
+
+# --- Stages ---
+# Each stage takes the scene, the settings, its output directory and the results of
+# the stages before it, and returns a JSON-serializable dict of results.
+
+def _scan(scene, config, directory, previous, n_workers):
+    halo = config['filter_size'] // 2
+    tile_windows = get_tile_windows(scene['s1'], config['tile_size'], overlap=halo)
+    stats, train, holdout = scan_scene(
+        scene['s1'], scene['s2'], scene['mask'], tile_windows, config['features'],
+        config['filter_size'], config['speckle_filter'], config['samples_per_class'],
+        config['holdout_block_size'], config['holdout_fraction'], config['seed'], n_workers=n_workers)
+    save_statistics(stats, os.path.join(directory, 'feature_stats.json'))
+    X_train, y_train = train.sample()
+    X_holdout, y_holdout = holdout.sample()
+    np.savez(os.path.join(directory, 'samples.npz'), X_train=X_train, y_train=y_train,
+             X_holdout=X_holdout, y_holdout=y_holdout)
+    return {'tiles': len(tile_windows), 'pixels_per_class': {str(k): v for k, v in train.seen.items()}}
+
+
+def _ranges(config, scan_directory):
+    stats = load_statistics(os.path.join(scan_directory, 'feature_stats.json'))
+    return feature_ranges(stats, config['clip_percentiles'])
+
+
+def _train(scene, config, directory, previous, n_workers):
+    ranges = _ranges(config, previous['scan']['directory'])
+    engine = FeatureEngine(config['features'])
+    samples = np.load(os.path.join(previous['scan']['directory'], 'samples.npz'))
+    model = train_random_forest(engine.normalize(samples['X_train'], ranges), samples['y_train'])
+    with open(os.path.join(directory, 'model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    save_compiled_forest(compile_forest(model), os.path.join(directory, 'compiled'))
+
+    result = {'training_pixels': int(samples['y_train'].size)}
+    if samples['y_holdout'].size:
+        prediction = model.predict(engine.normalize(samples['X_holdout'], ranges))
+        result['holdout'] = ConfusionMatrix().update(samples['y_holdout'], prediction).metrics()
+    return result
+
+
+def _predict(scene, config, directory, previous, n_workers):
+    ranges = _ranges(config, previous['scan']['directory'])
+    model_directory = previous['train']['directory']
+    if config['predict_with_compiled']:
+        model = os.path.join(model_directory, 'compiled')
+    else:
+        with open(os.path.join(model_directory, 'model.pkl'), 'rb') as f:
+            model = pickle.load(f)
+    halo = config['filter_size'] // 2
+    tile_windows = get_tile_windows(scene['s1'], config['tile_size'], overlap=halo)
+    confusion = predict_scene(model, scene['s1'], scene['s2'], os.path.join(directory, 'prediction.tif'),
+                              read_geotiff_meta(scene['s1']), tile_windows, ranges, config['features'],
+                              config['filter_size'], config['speckle_filter'], config['output_probability'],
+                              n_workers=n_workers, mask_file=scene['mask'], cog=config['output_cog'])
+    return {'metrics': confusion.metrics(), 'confusion': confusion.to_dict()}
+
+
+def _postprocess(scene, config, directory, previous, n_workers):
+    report = postprocess_scene(
+        os.path.join(previous['predict']['directory'], 'prediction.tif'),
+        os.path.join(directory, 'prediction_clean.tif'), os.path.join(directory, 'flood_polygons.geojson'),
+        config['morphology_radius'], min_pixels=config['min_mapping_unit'],
+        fill_holes_below=config['min_mapping_unit'], probability=config['output_probability'],
+        tile_size=config['tile_size'], n_workers=n_workers)
+    return report
+
+
+STAGES = [('scan', _scan), ('train', _train), ('predict', _predict), ('postprocess', _postprocess)]
+
+# The files of every stage that are linked into the scene's output directory
+STAGE_OUTPUTS = {'scan': ['feature_stats.json'], 'train': [], 'predict': ['prediction.tif'],
+                 'postprocess': ['prediction_clean.tif', 'flood_polygons.geojson']}
+
+
+def _publish(source, target):
+    # Hard links cost nothing; fall back to a copy across file systems
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def run_scene(scene, config, cache_dir, output_dir, n_workers=None):
+    """
+    Runs all stages for one scene, reusing the cached ones.
+
+    Returns:
+        dict: The scene report: its status, per stage the cache key, whether it came
+        from the cache, its run time and its results, and the profile of the stages
+        run (see profiling.py).
+    """
+    report = {'name': scene['name'], 'status': 'ok', 'stages': {}}
+    start = time.perf_counter()
+    # Pool processes run many scenes; every report only profiles its own
+    PROFILER.clear()
+    try:
+        cache = StageCache(cache_dir)
+        inputs = {role: content_hash(scene[role], cache_dir) for role in ('s1', 's2', 'mask')}
+        previous = {}
+        for name, run in STAGES:
+            key = stage_key(name, config, inputs)
+            result = cache.load(name, key)
+            cached = result is not None
+            stage_start = time.perf_counter()
+            if not cached:
+                print(f"[{scene['name']}] Running stage '{name}'...")
+                with stage(f'batch_{name}'):
+                    result = run(scene, config, cache.directory(name, key), previous, n_workers)
+                cache.save(name, key, result)
+            else:
+                print(f"[{scene['name']}] Stage '{name}' is cached, skipping")
+            directory = os.path.join(cache_dir, name, key)
+            previous[name] = dict(result, directory=directory)
+            report['stages'][name] = {'key': key, 'cached': cached, 'result': result,
+                                      'seconds': time.perf_counter() - stage_start}
+            # The next stage depends on this one through its key
+            inputs = {name: key}
+
+        scene_output = os.path.join(output_dir, scene['name'])
+        os.makedirs(scene_output, exist_ok=True)
+        for name, files in STAGE_OUTPUTS.items():
+            for filename in files:
+                _publish(os.path.join(previous[name]['directory'], filename), os.path.join(scene_output, filename))
+    except Exception as e:
+        report['status'] = 'failed'
+        report['error'] = f"{type(e).__name__}: {e}"
+        report['traceback'] = traceback.format_exc()
+        print(f"[{scene['name']}] Failed: {report['error']}")
+    report['seconds'] = time.perf_counter() - start
+    report['profile'] = PROFILER.summary()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the flood mapping workflow over a manifest of scenes.")
+    parser.add_argument('manifest', help="CSV or JSON manifest with name, s1, s2 and mask of every scene.")
+    parser.add_argument('--config', help="JSON file overriding settings of DEFAULT_CONFIG.")
+    parser.add_argument('--output', default='results', help="Directory for the per-scene outputs and the report.")
+    parser.add_argument('--cache', default='cache', help="Directory of the stage cache.")
+    parser.add_argument('--scene-workers', type=int, default=1, help="Number of scenes processed at a time.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Tile worker processes per scene. Defaults to the CPU cores divided by --scene-workers.")
+    parser.add_argument('--validate-only', action='store_true', help="Only check the scenes' headers.")
+    args = parser.parse_args()
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_CONFIG)
+        if unknown:
+            parser.error(f"Unknown settings in {args.config}: {sorted(unknown)}")
+        config.update(overrides)
+
+    scenes = read_manifest(args.manifest)
+    print(f"--- Checking {len(scenes)} scenes ---")
+    reports, valid = [], []
+    for scene in scenes:
+        problems = validate_scene(scene, config['features'])
+        if problems:
+            print(f"[{scene['name']}] Skipped: " + "; ".join(problems))
+            reports.append({'name': scene['name'], 'status': 'invalid', 'problems': problems})
+        else:
+            valid.append(scene)
+    print(f"{len(valid)} of {len(scenes)} scenes are valid")
+
+    if not args.validate_only and valid:
+        n_workers = args.workers or max(1, (os.cpu_count() or 1) // args.scene_workers)
+        print(f"\n--- Processing {len(valid)} scenes, {args.scene_workers} at a time ---")
+        # The pool's processes are not daemonic, so every scene can still start its own tile pool
+        with ProcessPoolExecutor(max_workers=args.scene_workers) as executor:
+            futures = [executor.submit(run_scene, scene, config, args.cache, args.output, n_workers)
+                       for scene in valid]
+            for done, future in enumerate(as_completed(futures), 1):
+                report = future.result()
+                reports.append(report)
+                print(f"Finished {done}/{len(valid)} scenes ({report['name']}: {report['status']})")
+
+    os.makedirs(args.output, exist_ok=True)
+    report_file = os.path.join(args.output, 'batch_report.json')
+    order = {scene['name']: index for index, scene in enumerate(scenes)}
+    reports.sort(key=lambda report: order[report['name']])
+    _write_json(report_file, {'config': config, 'scenes': reports})
+    statuses = [report['status'] for report in reports]
+    print(f"\nDone: {statuses.count('ok')} ok, {statuses.count('failed')} failed, "
+          f"{statuses.count('invalid')} invalid. Report written to {report_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmark_cog.py
+
+# Compares the prediction map writers on a synthetic scene: the original plain striped
+# GeoTIFF against Cloud-Optimized GeoTIFFs (postprocessing/cog.py) with every codec,
+# with and without the horizontal differencing predictor. Reports the write time, the
+# file size and the time to read a 1/16 scale thumbnail.
+#
+#   python benchmark_cog.py                 # 8192 x 8192 scene
+#   python benchmark_cog.py --size 4096     # a quicker run
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from scipy import ndimage
+
+from postprocessing.cog import COGWriter, COG_CODECS
+
+
+def make_prediction_maps(size, seed=0):
+    """
+    Builds a size x size flood label map (0/1 water bodies with some speckle) and a
+    matching uint8 flood probability map (0-255), like predict_scene writes.
+    """
+    rng = np.random.default_rng(seed)
+    # Smooth noise at 1/8 resolution, upsampled, gives blob-shaped water bodies
+    coarse = ndimage.gaussian_filter(rng.random((size // 8, size // 8)), 4)
+    smooth = ndimage.zoom(coarse, 8, order=1)
+    smooth = (smooth - smooth.mean()) / smooth.std()
+    # Like a classifier's output: confident (near 0 or 255) except close to water edges
+    logit = smooth * 10 + rng.normal(0, 1, smooth.shape)
+    probability = np.rint(255 / (1 + np.exp(-logit))).astype(np.uint8)
+    labels = (probability > 127).astype(np.uint8)
+    return {'labels': labels, 'probability': probability}
+
+
+def write_tiles(dst, image, tile_size):
+    # Written tile by tile, like predict_scene
+    for row in range(0, image.shape[0], tile_size):
+        for col in range(0, image.shape[1], tile_size):
+            tile = image[row:row + tile_size, col:col + tile_size]
+            dst.write(tile, 1, window=Window(col, row, tile.shape[1], tile.shape[0]))
+
+
+def read_thumbnail(path, size):
+    start = time.perf_counter()
+    with rasterio.open(path) as src:
+        src.read(1, out_shape=(size // 16, size // 16))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the COG writer codecs against a plain GeoTIFF.")
+    parser.add_argument('--size', type=int, default=8192, help="Scene height and width in pixels.")
+    parser.add_argument('--tile-size', type=int, default=1024, help="Size of the tiles written.")
+    parser.add_argument('--codecs', nargs='+', default=list(COG_CODECS), help="Codecs to compare.")
+    args = parser.parse_args()
+
+    print(f"Building {args.size}x{args.size} synthetic prediction maps...")
+    maps = make_prediction_maps(args.size)
+    meta = {'driver': 'GTiff', 'dtype': 'uint8', 'count': 1, 'width': args.size, 'height': args.size,
+            'crs': 'EPSG:32633', 'transform': from_origin(500000, 4000000, 10, 10)}
+    raw_mb = args.size * args.size / 1e6
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'prediction.tif')
+        for name, image in maps.items():
+            print(f"\n{name} map ({raw_mb:.0f} MB uncompressed)")
+            print(f"{'writer':<26}{'seconds':>10}{'MB':>10}{'ratio':>8}{'thumbnail ms':>14}")
+
+            # The original path: a plain GeoTIFF with the input's metadata
+            start = time.perf_counter()
+            with rasterio.open(path, 'w', **meta) as dst:
+                write_tiles(dst, image, args.tile_size)
+            seconds = time.perf_counter() - start
+            mb = os.path.getsize(path) / 1e6
+            thumbnail = read_thumbnail(path, args.size) * 1000
+            print(f"{'plain GeoTIFF':<26}{seconds:>10.2f}{mb:>10.1f}{raw_mb / mb:>8.1f}{thumbnail:>14.1f}")
+
+            resampling = 'mode' if name == 'labels' else 'average'
+            for codec in args.codecs:
+                for predictor in ((None,) if codec == 'none' else (None, 2)):
+                    start = time.perf_counter()
+                    with COGWriter(path, meta, codec=codec, predictor=predictor, resampling=resampling) as dst:
+                        write_tiles(dst, image, args.tile_size)
+                    seconds = time.perf_counter() - start
+                    mb = os.path.getsize(path) / 1e6
+                    thumbnail = read_thumbnail(path, args.size) * 1000
+                    label = f"COG {codec}" + (f" predictor {predictor}" if predictor else "")
+                    print(f"{label:<26}{seconds:>10.2f}{mb:>10.1f}{raw_mb / mb:>8.1f}{thumbnail:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# benchmark_speckle.py
+
+# Compares the speckle filters in preprocessing/speckle.py with the original
+# scipy median_filter path on a synthetic SAR-like float32 image.
+#
+#   python benchmark_speckle.py                 # 10k x 10k image, 5x5 and 7x7 windows
+#   python benchmark_speckle.py --size 2000     # a quicker run
+
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy.ndimage import median_filter
+
+from preprocessing.speckle import speckle_filter, SPECKLE_FILTERS
+
+
+def make_sar_image(size, seed=0):
+    """
+    Builds a size x size float32 image of single-look speckle (exponential intensity)
+    over a few bright and dark rectangles, like water bodies next to land.
+    """
+    rng = np.random.default_rng(seed)
+    backscatter = np.full((size, size), 0.2, dtype=np.float32)
+    for _ in range(20):
+        row, col = rng.integers(0, size, 2)
+        height, width = rng.integers(size // 20, size // 5, 2)
+        backscatter[row:row + height, col:col + width] = rng.choice([0.02, 0.6])
+    image = rng.standard_exponential((size, size), dtype=np.float32)
+    image *= backscatter
+    return image
+
+
+def time_call(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the speckle filters against scipy median_filter.")
+    parser.add_argument('--size', type=int, default=10000, help="Image height and width in pixels.")
+    parser.add_argument('--windows', type=int, nargs='+', default=[5, 7], help="Filter window sizes.")
+    parser.add_argument('--threads', type=int, default=os.cpu_count(), help="Threads for the new filters.")
+    args = parser.parse_args()
+
+    print(f"Building a {args.size}x{args.size} float32 test image...")
+    image = make_sar_image(args.size)
+    megapixels = image.size / 1e6
+
+    print(f"\n{'filter':<28}{'window':>8}{'seconds':>10}{'MPix/s':>10}{'speed-up':>10}")
+    for window in args.windows:
+        # The original path: apply_speckle_filter called scipy's median_filter on the whole image
+        baseline, _ = time_call(lambda: median_filter(image, size=window))
+        print(f"{'scipy median_filter':<28}{window:>8}{baseline:>10.2f}{megapixels / baseline:>10.1f}{1:>10.1f}")
+
+        for method in SPECKLE_FILTERS:
+            seconds, _ = time_call(lambda: speckle_filter(image, method, window, n_threads=args.threads))
+            label = f"{method} ({args.threads} threads)"
+            print(f"{label:<28}{window:>8}{seconds:>10.2f}{megapixels / seconds:>10.1f}{baseline / seconds:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
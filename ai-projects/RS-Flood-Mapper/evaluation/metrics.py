@@ -1,7 +1,6 @@
 # evaluation/metrics.py
 
 import numpy as np
-from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
 
 def calculate_iou(y_true, y_pred, smooth=1e-6):
     """
@@ -21,28 +20,169 @@ def calculate_iou(y_true, y_pred, smooth=1e-6):
     return iou
 
 
-def print_evaluation_metrics(y_true, y_pred):
+class ConfusionMatrix:
+    """
+    A confusion matrix that is filled tile by tile.
+
+    Every update is a single bincount over the tile, and two matrices (e.g. from
+    different tiles or worker processes) merge by adding them up, so a whole scene can be
+    scored while it is being predicted, without another pass over the rasters. All
+    metrics are derived from the counts.
+
+    Args:
+        num_classes (int): Number of classes; labels are 0 .. num_classes - 1 (integer or
+            float arrays). Pixels with any other label in either array (e.g. a nodata value
+            of 255, -9999 or NaN) are ignored.
+        positive_class (int): The class the binary metrics (precision, recall, F1, IoU)
+            are reported for, like pos_label in scikit-learn. 1 = flood.
+    """
+
+    # Pixels per bincount call, to bound the temporary index array
+    CHUNK_PIXELS = 1 << 22
+
+    def __init__(self, num_classes=2, positive_class=1):
+        self.num_classes = num_classes
+        self.positive_class = positive_class
+        # matrix[i, j] = number of pixels of true class i predicted as class j
+        self.matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.ignored = 0
+
+    def update(self, y_true, y_pred):
+        """
+        Adds the pixels of a tile (arrays of any matching shape) to the matrix.
+        """
+        n = self.num_classes
+        y_true = np.asarray(y_true).ravel()
+        y_pred = np.asarray(y_pred).ravel()
+        if y_true.shape != y_pred.shape:
+            raise ValueError("y_true and y_pred must have the same number of pixels.")
+
+        counts = np.zeros((n + 1) * (n + 1), dtype=np.int64)
+        for start in range(0, y_true.size, self.CHUNK_PIXELS):
+            # Labels outside [0, n) all go to an extra row/column n, which is dropped below
+            index = self._class_index(y_true[start:start + self.CHUNK_PIXELS])
+            index *= n + 1
+            index += self._class_index(y_pred[start:start + self.CHUNK_PIXELS])
+            counts += np.bincount(index, minlength=counts.size)
+
+        counts = counts.reshape(n + 1, n + 1)
+        self.matrix += counts[:n, :n]
+        self.ignored += int(counts.sum() - counts[:n, :n].sum())
+        return self
+
+    def _class_index(self, labels):
+        # The labels as class indices, with every label that is not a class (negative or
+        # too large nodata values, NaN, fractions in float masks) mapped to n
+        n = self.num_classes
+        if labels.dtype.kind in 'bu':
+            valid = labels < n
+        elif labels.dtype.kind == 'i':
+            valid = (labels >= 0) & (labels < n)
+        else:
+            with np.errstate(invalid='ignore'):
+                valid = (labels >= 0) & (labels < n) & (labels == np.floor(labels))
+        return np.where(valid, labels, n).astype(np.intp, casting='unsafe')
+
+    def merge(self, other):
+        """
+        Adds another ConfusionMatrix (e.g. from another tile or worker) to this one.
+        """
+        if other.num_classes != self.num_classes:
+            raise ValueError("Cannot merge confusion matrices with different numbers of classes.")
+        self.matrix += other.matrix
+        self.ignored += other.ignored
+        return self
+
+    @property
+    def total(self):
+        return int(self.matrix.sum())
+
+    @property
+    def accuracy(self):
+        return int(np.trace(self.matrix)) / self.total if self.total else 0.0
+
+    @property
+    def kappa(self):
+        """Cohen's kappa: the agreement beyond what the class frequencies give by chance."""
+        if not self.total:
+            return 0.0
+        expected = int(self.matrix.sum(axis=0) @ self.matrix.sum(axis=1)) / self.total ** 2
+        return (self.accuracy - expected) / (1 - expected) if expected < 1 else 0.0
+
+    def per_class(self, smooth=1e-6):
+        """
+        Returns a dict of per-class metrics, by class: precision, recall, F1, IoU and
+        support (the number of pixels of the class). Like scikit-learn with
+        zero_division=0, precision and recall are 0 for classes that were never
+        predicted or never present. IoU uses the same smoothing as calculate_iou.
+        """
+        true_positives = np.diag(self.matrix).tolist()
+        actual = self.matrix.sum(axis=1).tolist()
+        predicted = self.matrix.sum(axis=0).tolist()
+        stats = {}
+        for c in range(self.num_classes):
+            tp = true_positives[c]
+            precision = tp / predicted[c] if predicted[c] else 0.0
+            recall = tp / actual[c] if actual[c] else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            iou = (tp + smooth) / (actual[c] + predicted[c] - tp + smooth)
+            stats[c] = {'precision': precision, 'recall': recall, 'f1': f1, 'iou': iou,
+                        'support': actual[c]}
+        return stats
+
+    def metrics(self):
+        """
+        Returns the overall metrics: accuracy, kappa, and the precision, recall, F1 and
+        IoU of the positive class.
+        """
+        positive = self.per_class()[self.positive_class]
+        return {'accuracy': self.accuracy, 'precision': positive['precision'],
+                'recall': positive['recall'], 'f1': positive['f1'], 'iou': positive['iou'],
+                'kappa': self.kappa}
+
+    def to_dict(self):
+        return {'num_classes': self.num_classes, 'positive_class': self.positive_class,
+                'matrix': self.matrix.tolist(), 'ignored': self.ignored}
+
+    @classmethod
+    def from_dict(cls, data):
+        matrix = cls(data['num_classes'], data['positive_class'])
+        matrix.matrix[...] = data['matrix']
+        matrix.ignored = data['ignored']
+        return matrix
+
+    def print_report(self):
+        """Prints the overall metrics, the per-class metrics and the matrix itself."""
+        metrics = self.metrics()
+        print("\n--- Model Evaluation ---")
+        print(f"Accuracy:  {metrics['accuracy']:.4f}")
+        print(f"Precision: {metrics['precision']:.4f}")
+        print(f"Recall:    {metrics['recall']:.4f}")
+        print(f"F1-Score:  {metrics['f1']:.4f}")
+        print(f"IoU Score: {metrics['iou']:.4f}")
+        print(f"Kappa:     {metrics['kappa']:.4f}")
+        print(f"\n{'class':<8}{'precision':>10}{'recall':>10}{'F1':>10}{'IoU':>10}{'support':>12}")
+        for c, stats in self.per_class().items():
+            print(f"{c:<8}{stats['precision']:>10.4f}{stats['recall']:>10.4f}{stats['f1']:>10.4f}"
+                  f"{stats['iou']:>10.4f}{stats['support']:>12}")
+        print(f"\nConfusion matrix (rows: true, columns: predicted):\n{self.matrix}")
+        if self.ignored:
+            print(f"{self.ignored} pixels with labels outside 0-{self.num_classes - 1} were ignored")
+        print("------------------------\n")
+
+
+def print_evaluation_metrics(y_true, y_pred, num_classes=2):
     """
     Calculates and prints a set of common evaluation metrics.
 
     Args:
-        y_true (numpy.ndarray): The ground truth labels (2D image).
-        y_pred (numpy.ndarray): The predicted labels (2D image).
+        y_true (numpy.ndarray): The ground truth labels (any shape, e.g. a 2D image).
+        y_pred (numpy.ndarray): The predicted labels, with the same shape.
+        num_classes (int): Number of classes.
+
+    Returns:
+        ConfusionMatrix: The filled confusion matrix.
     """
-    # Flatten the arrays to compute metrics
-    y_true_flat = y_true.flatten()
-    y_pred_flat = y_pred.flatten()
-
-    accuracy = accuracy_score(y_true_flat, y_pred_flat)
-    precision = precision_score(y_true_flat, y_pred_flat, zero_division=0)
-    recall = recall_score(y_true_flat, y_pred_flat, zero_division=0)
-    f1 = f1_score(y_true_flat, y_pred_flat, zero_division=0)
-    iou = calculate_iou(y_true_flat, y_pred_flat)
-
-    print("\n--- Model Evaluation ---")
-    print(f"Accuracy:  {accuracy:.4f}")
-    print(f"Precision: {precision:.4f}")
-    print(f"Recall:    {recall:.4f}")
-    print(f"F1-Score:  {f1:.4f}")
-    print(f"IoU Score: {iou:.4f}")
-    print("------------------------\n")
\ No newline at end of file
+    matrix = ConfusionMatrix(num_classes).update(y_true, y_pred)
+    matrix.print_report()
+    return matrix
@@ -0,0 +1,204 @@
+# models/compiled_forest.py
+
+# Compiles a trained scikit-learn RandomForestClassifier into a handful of flat NumPy
+# arrays and predicts with them.
+# All trees are stored back to back: node i splits on feature[i] at threshold[i] and
+# continues at left[i] or right[i]; leaves point to themselves. A block of pixels walks
+# all trees at once, one vectorized step per tree level. Saved forests are plain .npy
+# files that workers memory-map, so loading one is almost free.
+
+import json
+import os
+
+import numpy as np
+
+_ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing_go_to_left', 'roots', 'leaf_values', 'classes')
+
+
+class CompiledForest:
+    """
+    An array-backed Random Forest. Build one with compile_forest or load_compiled_forest.
+
+    It has the predict/predict_proba/classes_ interface of the scikit-learn model, so it
+    can be used with predict_rf_chunked and the pipeline in place of the original.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_go_to_left, roots, leaf_values,
+                 classes, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_go_to_left = missing_go_to_left
+        self.roots = roots
+        self.leaf_values = leaf_values
+        self.classes_ = classes
+        self.max_depth = max_depth
+        self.n_features_in_ = n_features
+        self.is_leaf = left == np.arange(left.size)
+
+    @property
+    def n_estimators(self):
+        return self.roots.size
+
+    def apply(self, X):
+        """
+        Returns the leaf index every sample reaches in every tree, shape (num_samples, num_trees).
+        """
+        # Like scikit-learn, compare float32 features with the float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        n_trees = self.roots.size
+        flat_X = X.ravel()
+
+        # One entry per (sample, tree) pair: where the sample's features start in flat_X,
+        # the pair's current node, and its position in the output
+        starts = np.repeat(np.arange(n_samples, dtype=np.int64) * n_features, n_trees)
+        nodes = np.tile(self.roots, n_samples)
+        positions = np.arange(n_samples * n_trees)
+        leaves = np.empty(n_samples * n_trees, dtype=np.int32)
+
+        # Every step moves all unfinished pairs one level down; pairs that reached a leaf
+        # are written out and dropped, so later (deeper) steps only touch the few left.
+        while positions.size:
+            done = self.is_leaf[nodes]
+            if done.any():
+                leaves[positions[done]] = nodes[done]
+                unfinished = ~done
+                starts, nodes, positions = starts[unfinished], nodes[unfinished], positions[unfinished]
+            if not positions.size:
+                break
+            values = flat_X[starts + self.feature[nodes]]
+            go_left = values <= self.threshold[nodes]
+            missing = np.isnan(values)
+            if missing.any():
+                go_left |= missing & self.missing_go_to_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return leaves.reshape(n_samples, n_trees)
+
+    def predict_proba(self, X, block_size=16384):
+        """
+        Predicts class probabilities, identical to RandomForestClassifier.predict_proba.
+
+        Args:
+            X (numpy.ndarray): Features, shape (num_samples, num_features).
+            block_size (int): Number of samples walked through the trees at a time.
+
+        Returns:
+            numpy.ndarray: Probabilities, shape (num_samples, num_classes).
+        """
+        proba = np.zeros((X.shape[0], self.classes_.size), dtype=np.float64)
+        for start in range(0, X.shape[0], block_size):
+            leaves = self.apply(X[start:start + block_size])
+            block = proba[start:start + block_size]
+            # Sum tree by tree, in the same order as scikit-learn, so the result is bit-identical
+            for tree in range(self.n_estimators):
+                block += self.leaf_values[leaves[:, tree]]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X, block_size=16384):
+        """
+        Predicts class labels, identical to RandomForestClassifier.predict.
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(X, block_size), axis=1), axis=0)
+
+
+def compile_forest(model):
+    """
+    Flattens a trained single-output RandomForestClassifier into a CompiledForest.
+
+    Args:
+        model (RandomForestClassifier): The trained model.
+
+    Returns:
+        CompiledForest: The compiled model.
+    """
+    print(f"Compiling Random Forest with {len(model.estimators_)} trees...")
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output forests can be compiled.")
+
+    parts = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'missing_go_to_left', 'leaf_values')}
+    roots = []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        nodes = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        # Leaves loop back onto themselves: both of their branches lead back to the leaf
+        parts['feature'].append(np.where(is_leaf, 0, tree.feature))
+        parts['threshold'].append(np.where(is_leaf, 0.0, tree.threshold))
+        parts['left'].append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        parts['right'].append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        missing_go_to_left = getattr(tree, 'missing_go_to_left', np.zeros(n_nodes, dtype=np.uint8))
+        parts['missing_go_to_left'].append(np.asarray(missing_go_to_left, dtype=bool))
+
+        # The same leaf values DecisionTreeClassifier.predict_proba returns. Older
+        # scikit-learn versions store class counts and normalize them at predict time.
+        values = tree.value[:, 0, :model.n_classes_]
+        sums = values.sum(axis=1)
+        if not np.allclose(sums, 1.0):
+            normalizer = sums[:, np.newaxis].copy()
+            normalizer[normalizer == 0.0] = 1.0
+            values = values / normalizer
+        parts['leaf_values'].append(values)
+
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=np.concatenate(parts['feature']).astype(np.int32),
+        threshold=np.concatenate(parts['threshold']).astype(np.float64),
+        left=np.concatenate(parts['left']).astype(np.int32),
+        right=np.concatenate(parts['right']).astype(np.int32),
+        missing_go_to_left=np.concatenate(parts['missing_go_to_left']),
+        roots=np.array(roots, dtype=np.int32),
+        leaf_values=np.concatenate(parts['leaf_values']).astype(np.float64),
+        classes=np.asarray(model.classes_),
+        max_depth=max_depth,
+        n_features=model.n_features_in_,
+    )
+
+
+def save_compiled_forest(forest, directory):
+    """
+    Saves a CompiledForest as one .npy file per array plus a small JSON header.
+
+    Args:
+        forest (CompiledForest): The compiled model.
+        directory (str): The directory to write (created if needed).
+    """
+    print(f"Saving compiled Random Forest to {directory}...")
+    os.makedirs(directory, exist_ok=True)
+    for name in _ARRAYS:
+        value = forest.classes_ if name == 'classes' else getattr(forest, name)
+        np.save(os.path.join(directory, f'{name}.npy'), value)
+    with open(os.path.join(directory, 'forest.json'), 'w') as f:
+        json.dump({'max_depth': forest.max_depth, 'n_features': forest.n_features_in_}, f)
+
+
+def load_compiled_forest(directory, mmap=True):
+    """
+    Loads a CompiledForest saved with save_compiled_forest.
+
+    Args:
+        directory (str): The directory the forest was saved to.
+        mmap (bool): Memory-map the arrays instead of reading them. Worker processes then
+            start instantly and share the model pages through the OS page cache.
+
+    Returns:
+        CompiledForest: The compiled model, or None if it could not be loaded.
+    """
+    try:
+        with open(os.path.join(directory, 'forest.json')) as f:
+            header = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+                  for name in _ARRAYS}
+    except Exception as e:
+        print(f"Error loading compiled forest from {directory}: {e}")
+        return None
+    return CompiledForest(max_depth=header['max_depth'], n_features=header['n_features'], **arrays)
@@ -1,8 +1,11 @@
 # models/random_forest.py
 
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 
 def prepare_data_for_rf(features, labels):
     """
@@ -47,7 +50,7 @@ def train_random_forest(X_train, y_train):
     model.fit(X_train, y_train)
     return model
 
-def predict_with_rf(model, features, original_shape):
+def predict_with_rf(model, features, original_shape, verbose=True):
     """
     Makes a prediction on the full dataset and reshapes it back to the image dimensions.
 
@@ -55,17 +58,95 @@ def predict_with_rf(model, features, original_shape):
         model (RandomForestClassifier): The trained model.
         features (numpy.ndarray): The full feature set (height, width, channels).
         original_shape (tuple): The original (height, width) of the image.
+        verbose (bool): Print a progress message. Turn off when predicting many tiles.
 
     Returns:
         numpy.ndarray: The prediction map with the original image shape.
     """
-    print("Making predictions with Random Forest...")
-    num_pixels = features.shape[0] * features.shape[1]
-    num_features = features.shape[2]
-    X_full = features.reshape(num_pixels, num_features)
-    
-    prediction_flat = model.predict(X_full)
-    
+    if verbose:
+        print("Making predictions with Random Forest...")
+    # Predicting in chunks keeps the model's per-pixel temporaries small
+    prediction_flat = predict_rf_chunked(model, features, verbose=False)
+
     # Reshape the flat prediction array back to the 2D image shape
     prediction_map = prediction_flat.reshape(original_shape)
-    return prediction_map
\ No newline at end of file
+    return prediction_map
+
+
+# Flood probabilities are stored as uint8, 0 = 0.0 and PROBABILITY_SCALE = 1.0
+PROBABILITY_SCALE = 255
+
+
+def quantize_probability(probability, out=None):
+    """
+    Quantizes probabilities in [0, 1] to uint8 values in [0, PROBABILITY_SCALE].
+    """
+    if out is None:
+        out = np.empty(probability.shape, dtype=np.uint8)
+    np.rint(probability * PROBABILITY_SCALE, out=out, casting='unsafe')
+    return out
+
+
+def predict_rf_chunked(model, features, chunk_pixels=262144, probability=False, flood_class=1,
+                       n_workers=1, out=None, verbose=True):
+    """
+    Predicts pixels in fixed-size chunks, optionally across a thread pool.
+
+    Only one chunk of model outputs exists at a time per worker, and results go straight
+    into a uint8 output array, which can be a slice of a larger array or a np.memmap so
+    results are written incrementally.
+
+    Args:
+        model (RandomForestClassifier): The trained model.
+        features (numpy.ndarray): Features with the channels on the last axis,
+            e.g. (height, width, channels) or (num_pixels, channels).
+        chunk_pixels (int): Number of pixels predicted per call to the model.
+        probability (bool): Output the flood probability, quantized to uint8 (see
+            quantize_probability), instead of hard labels.
+        flood_class (int): The label whose probability is output.
+        n_workers (int): Number of threads (None = all CPU cores). The tree traversal in
+            scikit-learn releases the GIL, so chunks really run in parallel.
+        out (numpy.ndarray, optional): A uint8 array with features.shape[:-1] to fill.
+        verbose (bool): Print a progress message.
+
+    Returns:
+        numpy.ndarray: uint8 labels or quantized probabilities, shaped like features.shape[:-1].
+    """
+    if verbose:
+        print(f"Predicting {'flood probability' if probability else 'labels'} in chunks of {chunk_pixels} pixels...")
+    X = features.reshape(-1, features.shape[-1])
+    if out is None:
+        out = np.empty(features.shape[:-1], dtype=np.uint8)
+    # reshape() of a non-contiguous out (e.g. a window of a larger array) would be a copy,
+    # so such an out is filled chunk by chunk through its indices instead
+    out_flat = out.reshape(-1) if out.flags.c_contiguous else None
+
+    n_workers = n_workers or os.cpu_count()
+    if n_workers > 1 and getattr(model, 'n_jobs', None) not in (None, 1):
+        # The chunks are already parallel; a shallow copy shares the trees with the caller's model
+        model = copy.copy(model)
+        model.n_jobs = 1
+    if probability:
+        flood_column = list(model.classes_).index(flood_class)
+
+    def predict_chunk(start):
+        stop = min(X.shape[0], start + chunk_pixels)
+        if probability:
+            result = quantize_probability(model.predict_proba(X[start:stop])[:, flood_column],
+                                          out=None if out_flat is None else out_flat[start:stop])
+        else:
+            result = model.predict(X[start:stop])
+        if out_flat is None:
+            out[np.unravel_index(np.arange(start, stop), out.shape)] = result
+        elif not probability:
+            out_flat[start:stop] = result
+
+    starts = range(0, X.shape[0], chunk_pixels)
+    if n_workers == 1 or len(starts) == 1:
+        for start in starts:
+            predict_chunk(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # list() re-raises any exception from the chunks
+            list(executor.map(predict_chunk, starts))
+    return out
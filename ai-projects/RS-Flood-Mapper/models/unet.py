@@ -3,6 +3,8 @@
 # Note: This is a simplified U-Net for demonstration.
 # A real-world implementation might be more complex.
 
+import time
+
 import tensorflow as tf
 from tensorflow.keras import layers, Model
 
@@ -55,4 +57,36 @@ def build_unet(input_shape=(256, 256, 12), num_classes=2):
     print("U-Net model built successfully.")
     model.summary()
     
-    return model
\ No newline at end of file
+    return model
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Prints how long every epoch took, e.g. to check the input pipeline keeps up."""
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        print(f"Epoch {epoch + 1} took {time.perf_counter() - self._start:.1f}s")
+
+
+def train_unet(model, train_dataset, epochs=10, validation_dataset=None, checkpoint_file=None):
+    """
+    Trains the U-Net on a tf.data pipeline, e.g. one from unet_dataset.make_dataset.
+
+    Args:
+        model (tensorflow.keras.Model): The compiled U-Net from build_unet.
+        train_dataset (tf.data.Dataset): Batches of (features, labels).
+        epochs (int): Number of passes over the training data.
+        validation_dataset (tf.data.Dataset, optional): Batches to validate on after every epoch.
+        checkpoint_file (str, optional): Save the weights with the best validation loss here.
+
+    Returns:
+        tensorflow.keras.callbacks.History: The training history.
+    """
+    print("Training U-Net model...")
+    callbacks = [EpochTimer()]
+    if checkpoint_file and validation_dataset is not None:
+        callbacks.append(tf.keras.callbacks.ModelCheckpoint(checkpoint_file, save_best_only=True,
+                                                            save_weights_only=True))
+    return model.fit(train_dataset, epochs=epochs, validation_data=validation_dataset,
+                     callbacks=callbacks)
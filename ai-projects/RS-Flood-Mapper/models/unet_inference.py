@@ -0,0 +1,261 @@
+# models/unet_inference.py
+
+# Sliding-window inference for the U-Net (or any patch model) over a whole scene.
+# The scene is cut into overlapping patch_size x patch_size patches, the patches are run
+# through the model in batches, and the softmax outputs are blended back together with
+# weights that fall off towards the patch borders, where the U-Net sees the least context.
+# A reader thread prepares the patches of the next row while the model runs, through a
+# bounded queue, and only patch_size rows of blended output are ever held in memory.
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+BLEND_WINDOWS = ('cosine', 'gaussian', 'uniform')
+
+# Border pixels still get a little weight, so pixels covered by one patch only (at the
+# scene edges) are not divided by zero
+_MIN_WEIGHT = 1e-3
+
+
+def blend_window(patch_size, kind='cosine', sigma=0.25):
+    """
+    Builds the 2D weights a patch's predictions are blended with.
+
+    Args:
+        patch_size (int): The patch height and width.
+        kind (str): 'cosine' (a Hann window), 'gaussian' or 'uniform' (plain averaging).
+        sigma (float): Standard deviation of the Gaussian, as a fraction of patch_size.
+
+    Returns:
+        numpy.ndarray: A (patch_size, patch_size) float32 array of weights.
+    """
+    position = (np.arange(patch_size) + 0.5) / patch_size
+    if kind == 'cosine':
+        weights = 0.5 - 0.5 * np.cos(2 * np.pi * position)
+    elif kind == 'gaussian':
+        weights = np.exp(-0.5 * ((position - 0.5) / sigma) ** 2)
+    elif kind == 'uniform':
+        weights = np.ones(patch_size)
+    else:
+        raise ValueError(f"Unknown blend window '{kind}', choose one of {BLEND_WINDOWS}.")
+    weights = np.maximum(weights, _MIN_WEIGHT)
+    return np.outer(weights, weights).astype(np.float32)
+
+
+def patch_origins(size, patch_size, stride):
+    """
+    Returns the start offsets of patches covering size pixels with the given stride.
+    The last patch is moved back to end exactly at the border, so no patch sticks out
+    (unless the image is smaller than one patch).
+    """
+    if size <= patch_size:
+        return [0]
+    origins = list(range(0, size - patch_size, stride))
+    origins.append(size - patch_size)
+    return origins
+
+
+class Throughput:
+    """
+    Counts the patches and pixels of a run and the time spent reading and in the model.
+    """
+
+    def __init__(self):
+        self.tiles = 0
+        self.patch_pixels = 0
+        self.scene_pixels = 0
+        self.read_seconds = 0.0
+        self.model_seconds = 0.0
+        self.wall_seconds = 0.0
+        self._start = time.perf_counter()
+
+    def stop(self):
+        self.wall_seconds = time.perf_counter() - self._start
+
+    @property
+    def tiles_per_second(self):
+        return self.tiles / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def pixels_per_second(self):
+        """Scene pixels per second, comparable with the Random Forest path."""
+        return self.scene_pixels / self.wall_seconds if self.wall_seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'tiles': self.tiles,
+            'patch_pixels': self.patch_pixels,
+            'scene_pixels': self.scene_pixels,
+            'read_seconds': self.read_seconds,
+            'model_seconds': self.model_seconds,
+            'wall_seconds': self.wall_seconds,
+            'tiles_per_second': self.tiles_per_second,
+            'pixels_per_second': self.pixels_per_second,
+        }
+
+    def print_summary(self):
+        print(f"Predicted {self.tiles} patches ({self.scene_pixels / 1e6:.1f} MPix scene) in "
+              f"{self.wall_seconds:.1f}s: {self.tiles_per_second:.1f} tiles/s, "
+              f"{self.pixels_per_second / 1e6:.2f} MPix/s "
+              f"(reading {self.read_seconds:.1f}s, model {self.model_seconds:.1f}s)")
+
+
+def _pad_to_patch(strip, patch_size):
+    # Scenes (or last strips) smaller than one patch are padded with their edge values
+    pad_rows = max(0, patch_size - strip.shape[0])
+    pad_cols = max(0, patch_size - strip.shape[1])
+    if pad_rows or pad_cols:
+        strip = np.pad(strip, ((0, pad_rows), (0, pad_cols), (0, 0)), mode='edge')
+    return strip
+
+
+def _read_patches(read_rows, height, width, patch_size, row_origins, col_origins, batch_size,
+                  batches, stop, throughput):
+    # Reader thread: puts (row_index, [col origins], batch) items on the queue, then None.
+    # An exception is passed through the queue, so the consumer can re-raise it.
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for row_index, row in enumerate(row_origins):
+            start = time.perf_counter()
+            strip = _pad_to_patch(read_rows(row, min(height, row + patch_size)), patch_size)
+            throughput.read_seconds += time.perf_counter() - start
+            for first in range(0, len(col_origins), batch_size):
+                cols = col_origins[first:first + batch_size]
+                batch = np.stack([strip[:patch_size, col:col + patch_size] for col in cols])
+                if not put((row_index, cols, batch)):
+                    return
+        put(None)
+    except Exception as e:
+        put(e)
+
+
+def iter_sliding_window(model, read_rows, height, width, patch_size=256, overlap=64, batch_size=8,
+                        window='cosine', queue_size=4, throughput=None):
+    """
+    Runs a patch model over a scene with overlapping patches and blends the outputs.
+
+    Args:
+        model: A Keras model (or anything with predict_on_batch) that maps a
+            (batch, patch_size, patch_size, channels) float32 array to per-class scores
+            of shape (batch, patch_size, patch_size, num_classes).
+        read_rows (callable): read_rows(row_start, row_stop) returns the model inputs of
+            those scene rows, as a (rows, width, channels) float32 array. It is called
+            from a separate reader thread, once per row of patches.
+        height, width (int): The scene size.
+        patch_size (int): The model's input patch size.
+        overlap (int): Number of pixels neighbouring patches share.
+        batch_size (int): Number of patches per model call.
+        window (str): The blend window, see blend_window.
+        queue_size (int): Maximum number of batches read ahead of the model.
+        throughput (Throughput, optional): Counters to update.
+
+    Yields:
+        tuple: (row_start, probabilities) for consecutive blocks of finished scene rows,
+        with probabilities of shape (rows, width, num_classes) in float32.
+    """
+    if not 0 <= overlap < patch_size:
+        raise ValueError("overlap must be at least 0 and smaller than patch_size.")
+    stride = patch_size - overlap
+    row_origins = patch_origins(height, patch_size, stride)
+    col_origins = patch_origins(width, patch_size, stride)
+    weights = blend_window(patch_size, window)
+    if throughput is None:
+        throughput = Throughput()
+
+    # Rolling accumulators for the patch_size rows starting at the current row origin
+    padded_width = max(width, patch_size)
+    accumulated = None
+    weight_sum = np.zeros((patch_size, padded_width), dtype=np.float32)
+
+    batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_patches, daemon=True,
+                              args=(read_rows, height, width, patch_size, row_origins, col_origins,
+                                    batch_size, batches, stop, throughput))
+    reader.start()
+    try:
+        current_row = 0
+        while True:
+            item = batches.get()
+            if isinstance(item, Exception):
+                raise item
+            row_index = len(row_origins) if item is None else item[0]
+
+            # Once the reader moves on to the next row of patches, the rows before its
+            # origin have received every patch that covers them
+            while current_row < row_index:
+                row = row_origins[current_row]
+                if current_row + 1 < len(row_origins):
+                    done = row_origins[current_row + 1] - row
+                else:
+                    done = min(height - row, patch_size)
+                yield row, accumulated[:done, :width] / weight_sum[:done, :width, np.newaxis]
+                # Shift the accumulators up to the next row origin
+                accumulated[:patch_size - done] = accumulated[done:]
+                accumulated[patch_size - done:] = 0
+                weight_sum[:patch_size - done] = weight_sum[done:]
+                weight_sum[patch_size - done:] = 0
+                current_row += 1
+            if item is None:
+                break
+
+            _, cols, batch = item
+            start = time.perf_counter()
+            scores = np.asarray(model.predict_on_batch(batch), dtype=np.float32)
+            throughput.model_seconds += time.perf_counter() - start
+            if accumulated is None:
+                accumulated = np.zeros((patch_size, padded_width, scores.shape[-1]), dtype=np.float32)
+            for col, patch_scores in zip(cols, scores):
+                patch_scores *= weights[..., np.newaxis]
+                accumulated[:, col:col + patch_size] += patch_scores
+                weight_sum[:, col:col + patch_size] += weights
+            throughput.tiles += len(cols)
+            throughput.patch_pixels += len(cols) * patch_size * patch_size
+        throughput.scene_pixels += height * width
+    finally:
+        stop.set()
+        reader.join()
+        throughput.stop()
+
+
+def predict_unet_array(model, features, patch_size=256, overlap=64, batch_size=8, window='cosine',
+                       queue_size=4, verbose=True):
+    """
+    Predicts a feature cube that is already in memory with sliding-window blending.
+
+    Args:
+        model: The trained U-Net (see iter_sliding_window).
+        features (numpy.ndarray): The (height, width, channels) feature cube.
+        patch_size, overlap, batch_size, window, queue_size: See iter_sliding_window.
+        verbose (bool): Print the throughput.
+
+    Returns:
+        numpy.ndarray: The blended (height, width, num_classes) class probabilities.
+    """
+    height, width = features.shape[:2]
+    throughput = Throughput()
+
+    def read_rows(start, stop):
+        return np.asarray(features[start:stop], dtype=np.float32)
+
+    blocks = iter_sliding_window(model, read_rows, height, width, patch_size, overlap, batch_size,
+                                 window, queue_size, throughput)
+    probabilities = None
+    for row, block in blocks:
+        if probabilities is None:
+            probabilities = np.empty((height, width, block.shape[-1]), dtype=np.float32)
+        probabilities[row:row + block.shape[0]] = block
+    if verbose:
+        throughput.print_summary()
+    return probabilities
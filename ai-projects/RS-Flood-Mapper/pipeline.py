@@ -0,0 +1,434 @@
+# pipeline.py
+
+# Tile-parallel flood mapping pipeline.
+# Every worker process reads its own tiles straight from the GeoTIFFs, so only small
+# results (training samples, predicted tiles) travel back to the main process, and
+# peak memory depends on the tile size and the number of workers, not on the scene size.
+
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import rasterio
+
+from rasterio.windows import Window
+
+from preprocessing.data_loader import read_tile
+from preprocessing.preprocessor import apply_speckle_filter
+from preprocessing.features import FeatureEngine
+from preprocessing.statistics import StreamingStats, merge_statistics
+from preprocessing.sampling import StratifiedSampler, spatial_holdout_mask
+from models.random_forest import predict_rf_chunked, quantize_probability, PROBABILITY_SCALE
+from models.compiled_forest import load_compiled_forest
+from models.unet_inference import iter_sliding_window, Throughput
+from evaluation.metrics import ConfusionMatrix
+from postprocessing.morphology import morphological_filter, MORPHOLOGY_OPERATIONS
+from postprocessing.components import sieve
+from postprocessing.vectorize import polygonize
+from postprocessing.cog import open_prediction_writer
+from profiling import PROFILER, stage
+
+# Where the named input bands live in the Sentinel files (0-based band indices).
+# As in calculate_ndwi, Green is index 1 and NIR index 7 of the Sentinel-2 file. Adjust if needed.
+# Only the bands the requested features need are ever read.
+S1_BAND_INDEX = {'vv': 0, 'vh': 1}
+S2_BAND_INDEX = {'blue': 0, 'green': 1, 'red': 2, 'nir': 7, 'swir1': 10}
+
+# The original feature set: S1, NDWI and the first 3 Sentinel-2 bands.
+# Any name from preprocessing/features.py (e.g. 'mndwi', 'ndvi', 'vv_vh_ratio', 'vv_db')
+# or from the band indexes above can be added.
+DEFAULT_FEATURES = ['vv', 'ndwi', 'blue', 'green', 'red']
+
+
+def required_bands(features):
+    """
+    Returns the ([S1 band names], [S2 band names]) the given features need.
+    Their positions in the files are in S1_BAND_INDEX and S2_BAND_INDEX.
+    """
+    engine = FeatureEngine(features)
+    unknown = [b for b in engine.required_bands if b not in S1_BAND_INDEX and b not in S2_BAND_INDEX]
+    if unknown:
+        raise ValueError(f"Unknown input bands {unknown}, add them to S1_BAND_INDEX or S2_BAND_INDEX.")
+    s1_bands = [b for b in engine.required_bands if b in S1_BAND_INDEX]
+    s2_bands = [b for b in engine.required_bands if b in S2_BAND_INDEX]
+    return s1_bands, s2_bands
+
+
+def read_feature_bands(s1_file, s2_file, window, read_window, features, filter_size=3,
+                       speckle_method='median'):
+    """
+    Reads the input bands one tile of features needs and speckle filters the SAR bands.
+
+    Args:
+        s1_file, s2_file (str): Paths to the co-registered input GeoTIFFs.
+        window, read_window (Window): The tile, as planned by get_tile_windows, with a
+            halo of at least filter_size // 2 pixels.
+        features (list): The feature names the bands are for.
+        filter_size (int): The size of the speckle filter window.
+        speckle_method (str): The speckle filter, see preprocessing/speckle.py.
+
+    Returns:
+        dict: Band name -> 2D array, cropped to the core window of the tile.
+    """
+    s1_bands, s2_bands = required_bands(features)
+    bands = {}
+    if s1_bands:
+        with stage('load', file='s1'):
+            s1_tile = read_tile(s1_file, window, read_window, bands=[S1_BAND_INDEX[b] for b in s1_bands])
+        rows, cols = s1_tile.core
+        s1_data = s1_tile.data.reshape(-1, *s1_tile.data.shape[-2:])
+        with stage('filter', method=speckle_method):
+            for name, band in zip(s1_bands, s1_data):
+                # The halo around the tile lets the speckle filter see real neighbours at the tile
+                # edges, so cropping afterwards gives the same values as filtering the full scene.
+                # One thread per tile: the process pool already keeps every core busy.
+                bands[name] = apply_speckle_filter(band, filter_size, verbose=False,
+                                                   method=speckle_method, n_threads=1)[rows, cols]
+    if s2_bands:
+        # Optical bands need no halo
+        with stage('load', file='s2'):
+            s2_tile = read_tile(s2_file, window, bands=[S2_BAND_INDEX[b] for b in s2_bands])
+        s2_data = s2_tile.data.reshape(-1, *s2_tile.data.shape[-2:])
+        bands.update(zip(s2_bands, s2_data))
+    return bands
+
+
+# --- Worker side ---
+# State shared by every task of a pool, set once per worker by the pool initializer
+# so the model and settings are not pickled again for every tile.
+# Every task returns the stages it recorded (see profiling.py) along with its result.
+_worker = {}
+
+
+def _init_worker(config, model=None, ranges=None):
+    # A forked worker starts with a copy of the main process's records
+    PROFILER.clear()
+    _worker['config'] = config
+    _worker['ranges'] = ranges
+    _worker['engine'] = FeatureEngine(config['features'])
+    _worker['cube'] = None
+    if isinstance(model, str):
+        # A compiled forest directory: every worker memory-maps the same files
+        directory, model = model, load_compiled_forest(model)
+        if model is None:
+            raise RuntimeError(f"Worker could not load the compiled forest from {directory}.")
+    if model is not None:
+        # The pool already spreads the work over all cores
+        if hasattr(model, 'n_jobs'):
+            model.n_jobs = 1
+        _worker['model'] = model
+
+
+def _compute_tile_features(window, read_window, ranges=None):
+    config = _worker['config']
+    bands = read_feature_bands(config['s1_file'], config['s2_file'], window, read_window,
+                               config['features'], config['filter_size'], config['speckle_method'])
+
+    # Every worker keeps one feature cube and refills it for all tiles of the same shape
+    engine = _worker['engine']
+    shape = (int(window.height), int(window.width), len(engine.features))
+    if _worker['cube'] is None or _worker['cube'].shape != shape:
+        _worker['cube'] = np.empty(shape, dtype=np.float32)
+    # Band math (NDWI etc.), stacking into the cube and normalization are one fused pass
+    with stage('features', normalized=ranges is not None):
+        return engine.compute(bands, ranges=ranges, out=_worker['cube'])
+
+
+def _scan_tile(task):
+    index, window, read_window = task
+    config = _worker['config']
+    features = _compute_tile_features(window, read_window)
+
+    with stage('load', file='mask'):
+        labels = read_tile(config['mask_file'], window).data
+
+    with stage('sample'):
+        stats = {}
+        for position, name in enumerate(config['features']):
+            stats[name] = StreamingStats(config['relative_accuracy']).update(features[..., position])
+
+        # Pixels in held-out spatial blocks go to a separate evaluation sample
+        held_out = spatial_holdout_mask(int(window.row_off), int(window.col_off), *labels.shape,
+                                        config['holdout_block_size'], config['holdout_fraction'],
+                                        config['seed'])
+
+        # Seeding from the tile index keeps the sample independent of which worker ran the tile
+        rng = np.random.default_rng([config['seed'], index])
+        train = StratifiedSampler(config['samples_per_class']).update(features[~held_out], labels[~held_out], rng)
+        holdout = StratifiedSampler(config['samples_per_class']).update(features[held_out], labels[held_out], rng)
+    return stats, train, holdout, PROFILER.drain()
+
+
+def _score_tile(mask_file, window, prediction, probability):
+    # The confusion matrix of one predicted tile against the ground truth mask
+    with stage('load', file='mask'):
+        labels = read_tile(mask_file, window).data
+    with stage('evaluate'):
+        if probability:
+            prediction = prediction > PROBABILITY_SCALE // 2
+        return ConfusionMatrix().update(labels, prediction)
+
+
+def _predict_tile(task):
+    _, window, read_window = task
+    config = _worker['config']
+    features = _compute_tile_features(window, read_window, _worker['ranges'])
+    # One thread per tile: the process pool already keeps every core busy
+    with stage('predict'):
+        prediction = predict_rf_chunked(_worker['model'], features, n_workers=1, verbose=False,
+                                        probability=config['probability'])
+    matrix = None
+    if config['mask_file'] is not None:
+        matrix = _score_tile(config['mask_file'], window, prediction, config['probability'])
+    return window, prediction, matrix, PROFILER.drain()
+
+
+# --- Main process side ---
+
+def _tasks(tile_windows):
+    return [(index, window, read_window) for index, (window, read_window) in enumerate(tile_windows)]
+
+
+def _make_config(s1_file, s2_file, mask_file=None, features=None, filter_size=3,
+                 speckle_method='median', samples_per_class=100000, holdout_block_size=256,
+                 holdout_fraction=0.2, seed=42, relative_accuracy=0.01, probability=False):
+    return {
+        'features': list(features or DEFAULT_FEATURES),
+        's1_file': s1_file,
+        's2_file': s2_file,
+        'mask_file': mask_file,
+        'filter_size': filter_size,
+        'speckle_method': speckle_method,
+        'samples_per_class': samples_per_class,
+        'holdout_block_size': holdout_block_size,
+        'holdout_fraction': holdout_fraction,
+        'seed': seed,
+        'relative_accuracy': relative_accuracy,
+        'probability': probability,
+    }
+
+
+def _cog_options(cog, probability):
+    # Overviews of labels keep the most common class, of probabilities their average
+    if cog is None:
+        return None
+    return dict({'resampling': 'average' if probability else 'mode'}, **cog)
+
+
+def scan_scene(s1_file, s2_file, mask_file, tile_windows, features=None, filter_size=3,
+               speckle_method='median', samples_per_class=100000, holdout_block_size=256,
+               holdout_fraction=0.2, seed=42, relative_accuracy=0.01, n_workers=None):
+    """
+    Runs the first pass over a scene across a process pool: collects scene-wide
+    statistics of every feature and draws class-balanced training and hold-out samples.
+
+    Args:
+        s1_file, s2_file, mask_file (str): Paths to the co-registered input GeoTIFFs.
+        tile_windows (list): The tiling from get_tile_windows, with a halo of at least
+            filter_size // 2 pixels.
+        features (list, optional): Feature names, see DEFAULT_FEATURES.
+        filter_size (int): The size of the speckle filter window.
+        speckle_method (str): The speckle filter, see preprocessing/speckle.py.
+        samples_per_class (int): Maximum number of pixels per class in each sample.
+        holdout_block_size (int): Size of the spatial hold-out blocks in pixels.
+        holdout_fraction (float): Fraction of the blocks held out for evaluation.
+        seed (int): Seed for the samples and the hold-out blocks.
+        relative_accuracy (float): Relative error of the percentiles in the statistics.
+        n_workers (int, optional): Number of worker processes. Defaults to all CPU cores.
+
+    Returns:
+        tuple: (stats, train, holdout) with a StreamingStats per feature name and two
+        StratifiedSamplers holding raw (un-normalized) float32 features.
+    """
+    config = _make_config(s1_file, s2_file, mask_file, features, filter_size, speckle_method,
+                          samples_per_class, holdout_block_size, holdout_fraction, seed,
+                          relative_accuracy)
+    stats = {}
+    train = StratifiedSampler(samples_per_class)
+    holdout = StratifiedSampler(samples_per_class)
+    with Pool(n_workers or os.cpu_count(), initializer=_init_worker, initargs=(config,)) as pool:
+        # Samplers and statistics merge the same in any order, so tiles can finish in any order
+        for tile_stats, tile_train, tile_holdout, records in pool.imap_unordered(_scan_tile, _tasks(tile_windows)):
+            merge_statistics(stats, tile_stats)
+            train.merge(tile_train)
+            holdout.merge(tile_holdout)
+            PROFILER.merge(records)
+    return stats, train, holdout
+
+
+def predict_scene(model, s1_file, s2_file, output_file, meta, tile_windows, ranges,
+                  features=None, filter_size=3, speckle_method='median', probability=False,
+                  n_workers=None, mask_file=None, cog=None):
+    """
+    Predicts a scene tile by tile across a process pool, writing every predicted tile
+    into the output GeoTIFF as soon as it is finished. With a mask_file, every tile is
+    also scored against the ground truth while it is in memory.
+
+    Args:
+        model (RandomForestClassifier or str): The trained model, or the directory of a
+            forest saved with models.compiled_forest.save_compiled_forest, which every
+            worker then memory-maps instead of unpickling its own copy of the model.
+            Raises ValueError if that directory does not hold a loadable forest.
+        s1_file, s2_file (str): Paths to the co-registered input GeoTIFFs.
+        output_file (str): Path of the prediction GeoTIFF to write.
+        meta (dict): Metadata for the output file (e.g. from the Sentinel-1 input).
+        tile_windows (list): The tiling from get_tile_windows.
+        ranges (dict): The scene-wide feature ranges, from statistics.feature_ranges.
+        features (list, optional): Feature names, the same as the model was trained on.
+        filter_size (int): The size of the speckle filter window.
+        speckle_method (str): The speckle filter, see preprocessing/speckle.py.
+        probability (bool): Write the flood probability quantized to uint8 (0-255, see
+            models.random_forest.quantize_probability) instead of labels.
+        n_workers (int, optional): Number of worker processes. Defaults to all CPU cores.
+        mask_file (str, optional): The ground truth GeoTIFF to score the prediction against.
+        cog (dict, optional): Write a Cloud-Optimized GeoTIFF with these COGWriter
+            arguments (e.g. {'codec': 'zstd', 'predictor': 2}) instead of a plain GeoTIFF.
+
+    Returns:
+        ConfusionMatrix: The merged confusion matrix of all tiles, or None without a mask_file.
+    """
+    if isinstance(model, str) and load_compiled_forest(model) is None:
+        # Checked here, as a worker without a model would only fail on its first tile
+        raise ValueError(f"Could not load a compiled forest from {model}.")
+    config = _make_config(s1_file, s2_file, mask_file, features=features, filter_size=filter_size,
+                          speckle_method=speckle_method, probability=probability)
+    matrix = ConfusionMatrix() if mask_file is not None else None
+    meta = dict(meta, dtype=rasterio.uint8, count=1)
+    initargs = (config, model, ranges)
+
+    start = time.perf_counter()
+    with open_prediction_writer(output_file, meta, _cog_options(cog, probability)) as dst, \
+            Pool(n_workers or os.cpu_count(), initializer=_init_worker, initargs=initargs) as pool:
+        results = pool.imap_unordered(_predict_tile, _tasks(tile_windows))
+        for done, (window, prediction, tile_matrix, records) in enumerate(results, 1):
+            with stage('write'):
+                dst.write(prediction, 1, window=window)
+            if matrix is not None:
+                matrix.merge(tile_matrix)
+            PROFILER.merge(records)
+            if done % 50 == 0 or done == len(tile_windows):
+                print(f"Predicted {done}/{len(tile_windows)} tiles")
+
+    seconds = time.perf_counter() - start
+    pixels = meta['height'] * meta['width']
+    print(f"Predicted {len(tile_windows)} tiles in {seconds:.1f}s: {len(tile_windows) / seconds:.1f} tiles/s, "
+          f"{pixels / seconds / 1e6:.2f} MPix/s")
+    return matrix
+
+
+def predict_scene_unet(model, s1_file, s2_file, output_file, meta, ranges, features=None,
+                       filter_size=3, speckle_method='median', patch_size=None, overlap=64,
+                       batch_size=8, window='cosine', probability=False, queue_size=4,
+                       mask_file=None, cog=None):
+    """
+    Predicts a scene with the U-Net, using overlapping patches whose softmax outputs are
+    blended together (see models/unet_inference.py), and writes the result as it goes.
+
+    A reader thread computes the features of one row of patches at a time while the
+    model runs on the previous one, so memory stays at a few rows of patches.
+
+    Args:
+        model (tensorflow.keras.Model): The trained U-Net. Its input channels must match
+            the features, e.g. build_unet(input_shape=(256, 256, len(features))).
+        s1_file, s2_file (str): Paths to the co-registered input GeoTIFFs.
+        output_file (str): Path of the prediction GeoTIFF to write.
+        meta (dict): Metadata for the output file (e.g. from the Sentinel-1 input).
+        ranges (dict): The scene-wide feature ranges, from statistics.feature_ranges.
+        features (list, optional): Feature names, in the order of the model's channels.
+        filter_size (int): The size of the speckle filter window.
+        speckle_method (str): The speckle filter, see preprocessing/speckle.py.
+        patch_size (int, optional): Patch size. Defaults to the model's input size.
+        overlap (int): Number of pixels neighbouring patches share.
+        batch_size (int): Number of patches per model call.
+        window (str): 'cosine', 'gaussian' or 'uniform' blending.
+        probability (bool): Write the flood probability quantized to uint8 (0-255)
+            instead of labels, like predict_scene.
+        queue_size (int): Maximum number of patch batches read ahead of the model.
+        mask_file (str, optional): The ground truth GeoTIFF to score the prediction against.
+        cog (dict, optional): Write a Cloud-Optimized GeoTIFF with these COGWriter
+            arguments (e.g. {'codec': 'zstd', 'predictor': 2}) instead of a plain GeoTIFF.
+
+    Returns:
+        tuple: (throughput, matrix): the throughput counters as a dict (tiles/s, pixels/s,
+        time reading and in the model) and the ConfusionMatrix, or None without a mask_file.
+    """
+    engine = FeatureEngine(features or DEFAULT_FEATURES)
+    height, width = meta['height'], meta['width']
+    input_shape = getattr(model, 'input_shape', (None, None, None, None))
+    patch_size = patch_size or input_shape[1]
+    if input_shape[-1] is not None and input_shape[-1] != len(engine.features):
+        raise ValueError(f"The model expects {input_shape[-1]} input channels, "
+                         f"but {len(engine.features)} features were requested.")
+    halo = filter_size // 2
+
+    def read_rows(start, stop):
+        # Full-width strips, with a halo of rows for the speckle filter
+        strip = Window(0, start, width, stop - start)
+        read_window = Window(0, max(0, start - halo), width, min(height, stop + halo) - max(0, start - halo))
+        bands = read_feature_bands(s1_file, s2_file, strip, read_window, engine.features,
+                                   filter_size, speckle_method)
+        return engine.compute(bands, ranges=ranges)
+
+    throughput = Throughput()
+    matrix = ConfusionMatrix() if mask_file is not None else None
+    meta = dict(meta, dtype=rasterio.uint8, count=1)
+    with open_prediction_writer(output_file, meta, _cog_options(cog, probability)) as dst:
+        blocks = iter_sliding_window(model, read_rows, height, width, patch_size, overlap,
+                                     batch_size, window, queue_size, throughput)
+        for row, probabilities in blocks:
+            if probability:
+                prediction = quantize_probability(probabilities[..., 1])
+            else:
+                prediction = np.argmax(probabilities, axis=-1).astype(np.uint8)
+            rows = Window(0, row, width, prediction.shape[0])
+            with stage('write'):
+                dst.write(prediction, 1, window=rows)
+            if matrix is not None:
+                matrix.merge(_score_tile(mask_file, rows, prediction, probability))
+    throughput.print_summary()
+    return throughput.to_dict(), matrix
+
+
+def postprocess_scene(prediction_file, output_file, polygons_file=None, radius=1,
+                      operations=MORPHOLOGY_OPERATIONS, min_pixels=50, fill_holes_below=50,
+                      probability=False, tile_size=1024, n_workers=None):
+    """
+    Cleans up a predicted flood map: morphological opening/closing, then the minimum
+    mapping unit (small flood patches removed, small dry holes filled), then optionally
+    polygons. Every stage runs tile by tile across a process pool.
+
+    Args:
+        prediction_file (str): The map written by predict_scene or predict_scene_unet.
+        output_file (str): Path of the cleaned 0/1 flood map to write.
+        polygons_file (str, optional): Path of a GeoJSON file with one polygon per water body.
+        radius (int): Radius of the morphological structuring element; 0 skips this stage.
+        operations (tuple): 'open' and/or 'close', applied in order.
+        min_pixels (int): The minimum mapping unit in pixels.
+        fill_holes_below (int): Dry holes smaller than this many pixels become flood.
+        probability (bool): The prediction holds uint8 probabilities instead of labels.
+        tile_size (int): The requested tile size, see get_tile_windows.
+        n_workers (int, optional): Number of worker processes. Defaults to all CPU cores.
+
+    Returns:
+        dict: What the minimum mapping unit removed and filled, see postprocessing.components.sieve.
+    """
+    threshold = PROBABILITY_SCALE // 2 if probability else 0
+    sieve_input = prediction_file
+    if radius:
+        sieve_input = output_file + '.morphology.tif'
+        with stage('morphology'):
+            morphological_filter(prediction_file, sieve_input, radius, operations, threshold=threshold,
+                                 tile_size=tile_size, n_workers=n_workers)
+        # The filtered map is 0/1 from here on
+        threshold = 0
+    with stage('sieve'):
+        report = sieve(sieve_input, output_file, min_pixels, fill_holes_below, threshold,
+                       tile_size=tile_size, n_workers=n_workers)
+    if sieve_input != prediction_file:
+        os.remove(sieve_input)
+    if polygons_file:
+        with stage('polygonize'):
+            report['polygons'] = polygonize(output_file, polygons_file, tile_size=tile_size,
+                                            n_workers=n_workers)
+    return report
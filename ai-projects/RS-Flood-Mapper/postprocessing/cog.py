@@ -0,0 +1,265 @@
+# postprocessing/cog.py
+
+# A Cloud-Optimized GeoTIFF writer for prediction maps.
+# Tiles are written as they arrive into a temporary tiled GeoTIFF, and every tile is
+# also reduced by 2, 4, 8, ... into one temporary file per overview level, so the
+# overviews are finished when the last tile is. Closing the writer assembles both into
+# a COG with GDAL's COG driver (through a VRT that declares the finished levels as
+# overviews), in a single streaming copy that does the compression.
+# A viewer can then fetch a thumbnail from the small overview at the start of the file
+# instead of reading the full resolution data.
+
+import math
+import os
+import shutil
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.windows import Window
+
+from profiling import stage
+
+COG_CODECS = ('deflate', 'zstd', 'lzw', 'none')
+OVERVIEW_RESAMPLING = ('nearest', 'average', 'mode')
+
+# GDAL's names for the dtypes of the VRT
+_GDAL_TYPES = {'uint8': 'Byte', 'int8': 'Int8', 'uint16': 'UInt16', 'int16': 'Int16',
+               'uint32': 'UInt32', 'int32': 'Int32', 'float32': 'Float32', 'float64': 'Float64'}
+
+# The COG driver's names for the TIFF predictors: 2 = horizontal differencing (integers),
+# 3 = floating point
+_PREDICTORS = {None: 'NO', 1: 'NO', 2: 'STANDARD', 3: 'FLOATING_POINT'}
+
+
+def overview_factors(height, width, blocksize=512):
+    """
+    Returns the overview factors (2, 4, 8, ...) GDAL's COG driver would create: levels
+    are added until one fits into a single block.
+    """
+    factors = []
+    factor = 2
+    while max(height, width) / (factor // 2) > blocksize:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def reduce_block(block, resampling='nearest', nodata=None):
+    """
+    Halves a (bands, height, width) block, rounding odd sizes up like GDAL.
+
+    Args:
+        block (numpy.ndarray): The block to reduce.
+        resampling (str): 'nearest' (the top-left pixel of every 2x2 cell), 'average'
+            (for probabilities) or 'mode' (for class labels).
+        nodata (number, optional): Pixels with this value are left out of averages and modes.
+
+    Returns:
+        numpy.ndarray: The (bands, ceil(height / 2), ceil(width / 2)) block.
+    """
+    if resampling == 'nearest':
+        return np.ascontiguousarray(block[:, ::2, ::2])
+
+    bands, height, width = block.shape
+    padded = block
+    if height % 2 or width % 2:
+        padded = np.zeros((bands, height + height % 2, width + width % 2), dtype=block.dtype)
+        padded[:, :height, :width] = block
+    valid = np.zeros(padded.shape, dtype=bool)
+    valid[:, :height, :width] = True if nodata is None else block != nodata
+
+    # The four pixels of every 2x2 cell, as strided views
+    cells = [(padded[:, i::2, j::2], valid[:, i::2, j::2]) for i in (0, 1) for j in (0, 1)]
+    counts = sum(cell_valid.astype(np.uint8) for _, cell_valid in cells)
+    fill = 0 if nodata is None else nodata
+    if resampling == 'average':
+        sums = np.zeros(counts.shape, dtype=np.float64)
+        for values, cell_valid in cells:
+            sums += np.where(cell_valid, values, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reduced = sums / counts
+        if np.issubdtype(block.dtype, np.integer):
+            reduced = np.rint(reduced)
+        return np.where(counts > 0, reduced, fill).astype(block.dtype)
+    if resampling == 'mode':
+        # Label maps have few distinct values, so count each of them in turn
+        if block.dtype == np.uint8:
+            present = np.flatnonzero(np.bincount(block.ravel(), minlength=256)).astype(np.uint8)
+        else:
+            present = np.unique(block)
+        best = np.full(counts.shape, fill, dtype=block.dtype)
+        best_count = np.zeros(counts.shape, dtype=np.uint8)
+        for value in present:
+            count = sum(((values == value) & cell_valid).view(np.uint8) for values, cell_valid in cells)
+            better = count > best_count
+            best[better], best_count[better] = value, count[better]
+        return best
+    raise ValueError(f"Unknown overview resampling '{resampling}', choose one of {OVERVIEW_RESAMPLING}.")
+
+
+class COGWriter:
+    """
+    Writes a raster tile by tile into a Cloud-Optimized GeoTIFF with internal overviews.
+
+    It has the write/close interface of a rasterio dataset opened with 'w', so it can
+    stand in for one. Overviews are built incrementally as long as every written window
+    starts on a multiple of the overview factor (e.g. block-aligned tiles from
+    get_tile_windows); otherwise GDAL builds them from the full data when closing.
+
+    Args:
+        output_file (str): Path of the COG to write.
+        meta (dict): Metadata of the raster (e.g. from the input file, with dtype/count set).
+        codec (str): 'deflate', 'zstd', 'lzw' or 'none'.
+        predictor (int, optional): TIFF predictor: 2 (horizontal differencing, for
+            integers) or 3 (floating point). None uses no predictor.
+        level (int, optional): Compression level of deflate (1-9) or zstd (1-22).
+        blocksize (int): Size of the internal tiles.
+        resampling (str): How overviews are computed: 'nearest', 'average' or 'mode'.
+    """
+
+    def __init__(self, output_file, meta, codec='deflate', predictor=None, level=None,
+                 blocksize=512, resampling='nearest'):
+        if codec not in COG_CODECS:
+            raise ValueError(f"Unknown codec '{codec}', choose one of {COG_CODECS}.")
+        if resampling not in OVERVIEW_RESAMPLING:
+            raise ValueError(f"Unknown overview resampling '{resampling}', choose one of {OVERVIEW_RESAMPLING}.")
+        self.output_file = output_file
+        self.codec = codec
+        self.predictor = predictor
+        self.level = level
+        self.blocksize = blocksize
+        self.resampling = resampling
+        self.height, self.width = meta['height'], meta['width']
+        self.nodata = meta.get('nodata')
+        self.factors = overview_factors(self.height, self.width, blocksize)
+        self.incremental = True
+
+        # The temporary files are uncompressed: they are written and read once
+        self._parts = output_file + '.parts'
+        os.makedirs(self._parts, exist_ok=True)
+        part_meta = {key: value for key, value in meta.items()
+                     if key in ('dtype', 'count', 'nodata', 'crs', 'transform', 'width', 'height')}
+        part_meta.update(driver='GTiff', tiled=True, blockxsize=blocksize, blockysize=blocksize)
+        self.meta = part_meta
+        self._full = rasterio.open(self._part_path(1), 'w', **part_meta)
+        # As rasterio objects, whatever form the meta gave them in
+        part_meta.update(crs=self._full.crs, transform=self._full.transform)
+        self._levels = []
+        for factor in self.factors:
+            level_meta = dict(part_meta, height=math.ceil(self.height / factor),
+                              width=math.ceil(self.width / factor),
+                              transform=part_meta['transform'] * part_meta['transform'].scale(factor))
+            self._levels.append(rasterio.open(self._part_path(factor), 'w', **level_meta))
+
+    def _part_path(self, factor):
+        return os.path.join(self._parts, f'level_{factor}.tif')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_parts()
+            shutil.rmtree(self._parts, ignore_errors=True)
+
+    def _aligned(self, row, col, height, width, factor):
+        return (row % factor == 0 and col % factor == 0
+                and (height % factor == 0 or row + height == self.height)
+                and (width % factor == 0 or col + width == self.width))
+
+    def write(self, array, indexes=1, window=None):
+        """
+        Writes a tile, like rasterio's DatasetWriter.write, and updates the overviews.
+        """
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        self._full.write(array, indexes, window=window)
+
+        block = array[np.newaxis] if array.ndim == 2 else array
+        row, col = int(window.row_off), int(window.col_off)
+        height, width = block.shape[-2:]
+        if not self.incremental:
+            return
+        if not all(self._aligned(row, col, height, width, factor) for factor in self.factors):
+            print("Tiles are not aligned to the overview factors, overviews will be built when closing.")
+            self.incremental = False
+            return
+        # Every level is reduced from the one before, like GDAL does
+        for factor, dataset in zip(self.factors, self._levels):
+            block = reduce_block(block, self.resampling, self.nodata)
+            dataset.write(block if array.ndim == 3 else block[0], indexes,
+                          window=Window(col // factor, row // factor, block.shape[-1], block.shape[-2]))
+
+    def _close_parts(self):
+        for dataset in [self._full] + self._levels:
+            dataset.close()
+
+    def _write_vrt(self):
+        # A VRT of the full resolution data that declares the finished levels as its
+        # overviews, for the COG driver to copy as they are
+        path = os.path.join(self._parts, 'scene.vrt')
+        gdal_type = _GDAL_TYPES[np.dtype(self.meta['dtype']).name]
+        geotransform = ', '.join(repr(value) for value in self.meta['transform'].to_gdal())
+        lines = [f'<VRTDataset rasterXSize="{self.width}" rasterYSize="{self.height}">']
+        if self.meta.get('crs') is not None:
+            lines.append(f'  <SRS>{_escape(self.meta["crs"].to_wkt())}</SRS>')
+        lines.append(f'  <GeoTransform>{geotransform}</GeoTransform>')
+        for band in range(1, self.meta['count'] + 1):
+            lines.append(f'  <VRTRasterBand dataType="{gdal_type}" band="{band}">')
+            if self.nodata is not None:
+                lines.append(f'    <NoDataValue>{self.nodata}</NoDataValue>')
+            lines.append(f'    <SimpleSource><SourceFilename relativeToVRT="0">{_escape(self._part_path(1))}'
+                         f'</SourceFilename><SourceBand>{band}</SourceBand></SimpleSource>')
+            for factor in self.factors:
+                lines.append(f'    <Overview><SourceFilename relativeToVRT="0">{_escape(self._part_path(factor))}'
+                             f'</SourceFilename><SourceBand>{band}</SourceBand></Overview>')
+            lines.append('  </VRTRasterBand>')
+        lines.append('</VRTDataset>')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+        return path
+
+    def close(self):
+        """
+        Assembles the COG from the tiles and overviews written so far, and removes the
+        temporary files.
+        """
+        self._close_parts()
+        options = {
+            'COMPRESS': self.codec.upper(),
+            'PREDICTOR': _PREDICTORS[self.predictor],
+            'BLOCKSIZE': self.blocksize,
+            'BIGTIFF': 'IF_SAFER',
+            'NUM_THREADS': 'ALL_CPUS',
+            'RESAMPLING': self.resampling.upper(),
+        }
+        if self.level is not None:
+            options['LEVEL'] = self.level
+        try:
+            if self.incremental:
+                source = self._write_vrt()
+                options['OVERVIEWS'] = 'FORCE_USE_EXISTING'
+            else:
+                source = self._part_path(1)
+                options['OVERVIEWS'] = 'AUTO'
+            with stage('write', file=self.output_file, codec=self.codec):
+                rasterio.shutil.copy(source, self.output_file, driver='COG', **options)
+        finally:
+            shutil.rmtree(self._parts, ignore_errors=True)
+
+
+def _escape(text):
+    return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def open_prediction_writer(output_file, meta, cog=None):
+    """
+    Opens the output of a prediction: a plain GeoTIFF, or with cog (a dict of COGWriter
+    arguments, e.g. {'codec': 'zstd', 'predictor': 2}) a Cloud-Optimized GeoTIFF.
+    """
+    if cog is None:
+        return rasterio.open(output_file, 'w', **meta)
+    return COGWriter(output_file, meta, **cog)
@@ -0,0 +1,285 @@
+# postprocessing/components.py
+
+# Scene-wide connected components of a flood map, computed tile by tile.
+# Every worker labels the components inside its own tile with scipy and sends back only
+# their sizes, bounding boxes, a seed pixel of each, and the labels along the tile's
+# four edges. The main process joins labels that touch across tile seams with a
+# union-find, which gives every pixel a scene-wide component while no process ever
+# holds more than one tile of pixels. A second parallel pass then applies the result
+# tile by tile, e.g. to remove flood patches below the minimum mapping unit.
+
+import os
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+import rasterio
+from scipy import ndimage
+
+from preprocessing.data_loader import get_tile_windows, read_tile
+
+# Every component piece found in a tile gets a scene-wide id: local label - 1 + the
+# tile's offset. Pieces joined across seams share a root id, the component.
+# tile_windows: the tiles, in the order of the offsets
+# offsets:      per tile, the id of its first piece
+# components:   per piece id, the root id of its component
+# areas:        per root id, the component size in pixels (0 for non-root ids)
+# pieces:       per root id, the number of pieces (1 = the component lies in one tile)
+# bounds:       per piece id, its (row_min, col_min, row_max, col_max) in the scene, inclusive
+# seeds:        per piece id, the (row, col) of one of its pixels in the scene
+ComponentMap = namedtuple('ComponentMap', ['tile_windows', 'offsets', 'components', 'areas',
+                                           'pieces', 'bounds', 'seeds'])
+
+
+class UnionFind:
+    """
+    Disjoint sets over the ids 0 .. size - 1, with path compression.
+    The smallest id of a set is its root, so the result does not depend on the order of unions.
+    """
+
+    def __init__(self, size):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def roots(self):
+        """Returns the root of every id, resolved with vectorized pointer jumping."""
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return parent
+            parent = grandparent
+
+
+def connectivity_structure(connectivity):
+    """Returns the scipy structure for 4- or 8-connected components."""
+    if connectivity == 4:
+        return ndimage.generate_binary_structure(2, 1)
+    if connectivity == 8:
+        return ndimage.generate_binary_structure(2, 2)
+    raise ValueError("connectivity must be 4 or 8.")
+
+
+def label_tile(input_file, window, threshold=0, background=False, connectivity=8):
+    """
+    Labels the components of one tile of a flood map.
+
+    Args:
+        input_file (str): The single band flood map.
+        window (Window): The tile.
+        threshold (int): Pixels above this value are flood.
+        background (bool): Label the dry land (e.g. holes in water bodies) instead.
+        connectivity (int): 4 or 8.
+
+    Returns:
+        tuple: (mask, labels, count): the boolean mask of the labelled class, the int32
+        labels (0 outside the mask) and the number of components.
+    """
+    mask = read_tile(input_file, window).data > threshold
+    if background:
+        mask = ~mask
+    labels, count = ndimage.label(mask, connectivity_structure(connectivity))
+    return mask, labels, count
+
+
+# --- Worker side ---
+_worker = {}
+
+
+def _init_worker(config):
+    _worker.update(config)
+
+
+def _scan_tile(task):
+    index, window = task
+    _, labels, count = label_tile(_worker['input_file'], window, _worker['threshold'],
+                                  _worker['background'], _worker['connectivity'])
+    row_off, col_off = int(window.row_off), int(window.col_off)
+    flat = labels.ravel()
+    areas = np.bincount(flat, minlength=count + 1)[1:]
+
+    # The first pixel of every label, in raster order
+    values, first = np.unique(flat, return_index=True)
+    first = first[values > 0]
+    seeds = np.column_stack((first // labels.shape[1] + row_off, first % labels.shape[1] + col_off))
+
+    bounds = np.array([(rows.start, cols.start, rows.stop - 1, cols.stop - 1)
+                       for rows, cols in ndimage.find_objects(labels)], dtype=np.int64).reshape(-1, 4)
+    bounds += (row_off, col_off, row_off, col_off)
+
+    edges = {'top': labels[0].copy(), 'bottom': labels[-1].copy(),
+             'left': labels[:, 0].copy(), 'right': labels[:, -1].copy()}
+    return index, count, areas, bounds, seeds, edges
+
+
+def _seam_pairs(a, b, connectivity):
+    # Labels on both sides of a seam that touch: a[i] touches b[i], and with
+    # 8-connectivity also b[i - 1] and b[i + 1]
+    pairs = []
+    for shift in ((0,) if connectivity == 4 else (-1, 0, 1)):
+        if shift >= 0:
+            x, y = a[:a.size - shift], b[shift:]
+        else:
+            x, y = a[-shift:], b[:b.size + shift]
+        touching = (x > 0) & (y > 0)
+        pairs.append(np.column_stack((x[touching], y[touching])))
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def _seams(tile_windows, edges):
+    # Yields (tile a, tile b, labels along a's side, labels along b's side, diagonal)
+    # for all neighbouring tiles of a regular tiling
+    starts = {(int(w.row_off), int(w.col_off)): i for i, w in enumerate(tile_windows)}
+    ends = {(int(w.row_off), int(w.col_off + w.width)): i for i, w in enumerate(tile_windows)}
+    for a, window in enumerate(tile_windows):
+        row, col = int(window.row_off), int(window.col_off)
+        bottom, right = row + int(window.height), col + int(window.width)
+        if (row, right) in starts:
+            yield a, starts[row, right], edges[a]['right'], edges[starts[row, right]]['left'], False
+        if (bottom, col) in starts:
+            yield a, starts[bottom, col], edges[a]['bottom'], edges[starts[bottom, col]]['top'], False
+        if (bottom, right) in starts:
+            b = starts[bottom, right]
+            yield a, b, edges[a]['bottom'][-1:], edges[b]['top'][:1], True
+        if (bottom, col) in ends:
+            b = ends[bottom, col]
+            yield a, b, edges[a]['bottom'][:1], edges[b]['top'][-1:], True
+
+
+def find_components(input_file, threshold=0, background=False, connectivity=8, tile_size=1024,
+                    n_workers=None):
+    """
+    Finds the scene-wide connected components of a flood map, tile by tile across a
+    process pool, stitching the pieces in different tiles together with a union-find.
+
+    Args:
+        input_file (str): The single band flood map.
+        threshold (int): Pixels above this value are flood.
+        background (bool): Find the components of the dry land instead.
+        connectivity (int): 4 or 8.
+        tile_size (int): The requested tile size, see get_tile_windows.
+        n_workers (int, optional): Number of worker processes. Defaults to all CPU cores.
+
+    Returns:
+        ComponentMap: The components, see ComponentMap.
+    """
+    config = {'input_file': input_file, 'threshold': threshold, 'background': background,
+              'connectivity': connectivity}
+    tile_windows = [window for window, _ in get_tile_windows(input_file, tile_size)]
+
+    results = [None] * len(tile_windows)
+    with Pool(n_workers or os.cpu_count(), initializer=_init_worker, initargs=(config,)) as pool:
+        for result in pool.imap_unordered(_scan_tile, enumerate(tile_windows)):
+            results[result[0]] = result
+
+    counts = np.array([result[1] for result in results], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    areas = np.concatenate([result[2] for result in results])
+    bounds = np.concatenate([result[3] for result in results])
+    seeds = np.concatenate([result[4] for result in results])
+    edges = [result[5] for result in results]
+
+    # Only the labels along the seams are compared; everything else stays in the tiles
+    union_find = UnionFind(int(counts.sum()))
+    for a, b, a_edge, b_edge, diagonal in _seams(tile_windows, edges):
+        if diagonal and connectivity == 4:
+            continue
+        # Diagonal neighbours share a single corner pixel
+        for label_a, label_b in _seam_pairs(a_edge, b_edge, 4 if diagonal else connectivity):
+            union_find.union(label_a - 1 + offsets[a], label_b - 1 + offsets[b])
+
+    components = union_find.roots()
+    size = components.size
+    return ComponentMap(
+        tile_windows=tile_windows,
+        offsets=offsets,
+        components=components,
+        areas=np.bincount(components, weights=areas, minlength=size).astype(np.int64),
+        pieces=np.bincount(components, minlength=size),
+        bounds=bounds,
+        seeds=seeds,
+    )
+
+
+def _sieve_tile(task):
+    index, window = task
+    threshold, connectivity = _worker['threshold'], _worker['connectivity']
+    mask, labels, _ = label_tile(_worker['input_file'], window, threshold, False, connectivity)
+    flood = _worker['flood']
+    ids = labels[mask] - 1 + flood['offsets'][index]
+    result = mask.copy()
+    result[mask] = ~flood['remove'][ids]
+
+    holes = _worker['holes']
+    if holes is not None:
+        # Dry land uses the complementary connectivity, like the holes of the flood components
+        dry, labels, _ = label_tile(_worker['input_file'], window, threshold, True, 12 - connectivity)
+        ids = labels[dry] - 1 + holes['offsets'][index]
+        result[dry] = holes['fill'][ids]
+    return window, result.astype(np.uint8)
+
+
+def sieve(input_file, output_file, min_pixels, fill_holes_below=0, threshold=0, connectivity=8,
+          tile_size=1024, n_workers=None):
+    """
+    Applies a minimum mapping unit to a flood map: removes flood components smaller than
+    min_pixels and, optionally, fills dry holes smaller than fill_holes_below. Component
+    sizes are scene-wide, so a water body split over several tiles is measured as a whole.
+
+    Args:
+        input_file (str): The single band flood map.
+        output_file (str): Path of the sieved 0/1 uint8 map to write.
+        min_pixels (int): The smallest flood component kept, in pixels.
+        fill_holes_below (int): Dry components smaller than this are turned into flood.
+            0 keeps all of them.
+        threshold (int): Pixels above this value are flood.
+        connectivity (int): 4 or 8, for the flood components.
+        tile_size (int): The requested tile size, see get_tile_windows.
+        n_workers (int, optional): Number of worker processes. Defaults to all CPU cores.
+
+    Returns:
+        dict: Number of flood components found and removed, and of holes filled.
+    """
+    print(f"Sieving {input_file}: removing flood components below {min_pixels} pixels...")
+    flood = find_components(input_file, threshold, False, connectivity, tile_size, n_workers)
+    flood_areas = flood.areas[flood.components]
+    is_root = flood.components == np.arange(flood.components.size)
+    report = {'components': int(is_root.sum()),
+              'removed': int((is_root & (flood_areas < min_pixels)).sum()),
+              'holes_filled': 0}
+
+    holes = None
+    if fill_holes_below:
+        dry = find_components(input_file, threshold, True, 12 - connectivity, tile_size, n_workers)
+        dry_areas = dry.areas[dry.components]
+        dry_roots = dry.components == np.arange(dry.components.size)
+        report['holes_filled'] = int((dry_roots & (dry_areas < fill_holes_below)).sum())
+        holes = {'offsets': dry.offsets, 'fill': dry_areas < fill_holes_below}
+
+    config = {'input_file': input_file, 'threshold': threshold, 'connectivity': connectivity,
+              'flood': {'offsets': flood.offsets, 'remove': flood_areas < min_pixels},
+              'holes': holes}
+    with rasterio.open(input_file) as src:
+        meta = dict(src.meta, dtype=rasterio.uint8, count=1, nodata=None)
+
+    with rasterio.open(output_file, 'w', **meta) as dst, \
+            Pool(n_workers or os.cpu_count(), initializer=_init_worker, initargs=(config,)) as pool:
+        for window, result in pool.imap_unordered(_sieve_tile, enumerate(flood.tile_windows)):
+            dst.write(result, 1, window=window)
+
+    print(f"Removed {report['removed']} of {report['components']} flood components, "
+          f"filled {report['holes_filled']} holes")
+    return report
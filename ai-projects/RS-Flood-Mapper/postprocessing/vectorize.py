@@ -0,0 +1,126 @@
+# postprocessing/vectorize.py
+
+# Turns a flood map into polygons, one per scene-wide flood component.
+# Components that lie inside a single tile are traced by the worker that labels that
+# tile. Components that cross tile seams (found by postprocessing/components.py) are
+# traced from a window around their bounding box instead, so every water body becomes
+# one polygon without dissolving seams afterwards. The polygons are streamed into a
+# GeoJSON file as they arrive.
+
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import rasterio
+from rasterio.features import shapes
+from rasterio.windows import Window, transform as window_transform
+
+from postprocessing.components import find_components, label_tile
+
+# --- Worker side ---
+_worker = {}
+
+
+def _init_worker(config):
+    _worker.update(config)
+
+
+def _feature(geometry, component):
+    pixels = int(_worker['areas'][component])
+    return {'type': 'Feature', 'geometry': geometry,
+            'properties': {'id': int(_worker['numbers'][component]), 'area_pixels': pixels,
+                           'area': pixels * _worker['pixel_area']}}
+
+
+def _trace_tile(task):
+    # Traces the components that lie entirely inside this tile
+    index, window = task
+    mask, labels, _ = label_tile(_worker['input_file'], window, _worker['threshold'], False,
+                                 _worker['connectivity'])
+    offset = _worker['offsets'][index]
+    components = np.zeros(labels.max() + 1, dtype=np.int64)
+    components[1:] = _worker['components'][offset:offset + components.size - 1]
+    inside = mask & (_worker['pieces'][components] == 1)[labels]
+    transform = window_transform(window, _worker['transform'])
+    return [_feature(geometry, components[int(label)])
+            for geometry, label in shapes(labels, mask=inside, connectivity=_worker['connectivity'],
+                                          transform=transform)]
+
+
+def _trace_component(task):
+    # Traces one component that crosses tile seams, from a window around its bounding box
+    component, (row_min, col_min, row_max, col_max), (seed_row, seed_col) = task
+    window = Window(col_min, row_min, col_max - col_min + 1, row_max - row_min + 1)
+    _, labels, _ = label_tile(_worker['input_file'], window, _worker['threshold'], False,
+                              _worker['connectivity'])
+    inside = labels == labels[seed_row - row_min, seed_col - col_min]
+    transform = window_transform(window, _worker['transform'])
+    return [_feature(geometry, component)
+            for geometry, _ in shapes(inside.astype(np.uint8), mask=inside,
+                                      connectivity=_worker['connectivity'], transform=transform)]
+
+
+def polygonize(input_file, output_file, threshold=0, connectivity=8, tile_size=1024, n_workers=None):
+    """
+    Writes the flood components of a flood map as GeoJSON polygons, one per component.
+
+    Memory stays at one tile per worker, except for components that cross tile seams:
+    those are traced from a window around their own bounding box.
+
+    Args:
+        input_file (str): The single band flood map (e.g. after sieve).
+        output_file (str): Path of the GeoJSON file to write.
+        threshold (int): Pixels above this value are flood.
+        connectivity (int): 4 or 8.
+        tile_size (int): The requested tile size, see get_tile_windows.
+        n_workers (int, optional): Number of worker processes. Defaults to all CPU cores.
+
+    Returns:
+        int: The number of polygons written.
+    """
+    print(f"Polygonizing {input_file} to {output_file}...")
+    found = find_components(input_file, threshold, False, connectivity, tile_size, n_workers)
+    is_root = found.components == np.arange(found.components.size)
+    with rasterio.open(input_file) as src:
+        transform, crs = src.transform, src.crs
+
+    # Components are numbered 1, 2, ... in the order of their root ids
+    numbers = np.cumsum(is_root)
+    config = {
+        'input_file': input_file, 'threshold': threshold, 'connectivity': connectivity,
+        'offsets': found.offsets, 'components': found.components, 'pieces': found.pieces,
+        'areas': found.areas, 'numbers': numbers, 'transform': transform,
+        'pixel_area': abs(transform.a * transform.e - transform.b * transform.d),
+    }
+
+    # Bounding boxes and a seed pixel of the components crossing seams
+    crossing = np.flatnonzero(is_root & (found.pieces > 1))
+    bounds = np.empty((found.components.size, 4), dtype=np.int64)
+    bounds[:, :2], bounds[:, 2:] = np.iinfo(np.int64).max, -1
+    np.minimum.at(bounds[:, 0], found.components, found.bounds[:, 0])
+    np.minimum.at(bounds[:, 1], found.components, found.bounds[:, 1])
+    np.maximum.at(bounds[:, 2], found.components, found.bounds[:, 2])
+    np.maximum.at(bounds[:, 3], found.components, found.bounds[:, 3])
+    seam_tasks = [(int(c), bounds[c].tolist(), found.seeds[c].tolist()) for c in crossing]
+
+    count = 0
+    with open(output_file, 'w') as f, \
+            Pool(n_workers or os.cpu_count(), initializer=_init_worker, initargs=(config,)) as pool:
+        f.write('{"type": "FeatureCollection",\n')
+        if crs is not None and crs.to_epsg() is not None:
+            # The pre-RFC 7946 way to name a projected CRS, still read by GDAL and QGIS
+            crs_name = f"urn:ogc:def:crs:EPSG::{crs.to_epsg()}"
+            f.write(f'"crs": {json.dumps({"type": "name", "properties": {"name": crs_name}})},\n')
+        f.write('"features": [\n')
+        results = [pool.imap_unordered(_trace_tile, enumerate(found.tile_windows)),
+                   pool.imap_unordered(_trace_component, seam_tasks)]
+        for features in (feature for result in results for feature in result):
+            for feature in features:
+                f.write(',\n' if count else '')
+                json.dump(feature, f)
+                count += 1
+        f.write('\n]}\n')
+
+    print(f"Wrote {count} polygons")
+    return count
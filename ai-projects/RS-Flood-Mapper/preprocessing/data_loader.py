@@ -1,14 +1,35 @@
 # preprocessing/data_loader.py
 
+import math
+from collections import namedtuple
+
 import rasterio
+from rasterio.windows import Window
 import numpy as np
 
-def load_geotiff(filepath):
+# A single tile read from a GeoTIFF.
+# data:        the pixels of read_window, (bands, height, width) or (height, width) for one band
+# window:      the core window this tile is responsible for (tiles never overlap here)
+# read_window: the window that was actually read, i.e. the core window plus the overlap halo
+# transform:   the affine georeferencing transform of `data` (i.e. of read_window)
+# core:        a (row_slice, col_slice) tuple that crops `data` back to `window`
+Tile = namedtuple('Tile', ['data', 'window', 'read_window', 'transform', 'core'])
+
+
+def _band_indexes(bands):
+    # Callers use 0-based band indices (like calculate_ndwi does), rasterio wants 1-based ones
+    if bands is None:
+        return None
+    return [int(b) + 1 for b in bands]
+
+
+def load_geotiff(filepath, bands=None):
     """
     Loads a GeoTIFF file into a NumPy array.
 
     Args:
         filepath (str): The path to the .tif file.
+        bands (list, optional): 0-based indices of the bands to read. Reads all bands if None.
 
     Returns:
         numpy.ndarray: The image data as a NumPy array.
@@ -16,7 +37,7 @@ def load_geotiff(filepath):
     """
     try:
         with rasterio.open(filepath) as src:
-            image = src.read()
+            image = src.read(_band_indexes(bands))
             meta = src.meta
             # If the image has a single band, return a 2D array
             if image.shape[0] == 1:
@@ -24,4 +45,135 @@ def load_geotiff(filepath):
             return image, meta
     except Exception as e:
         print(f"Error loading {filepath}: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+
+def read_geotiff_meta(filepath):
+    """
+    Reads only the metadata of a GeoTIFF file, without touching any pixel data.
+
+    Args:
+        filepath (str): The path to the .tif file.
+
+    Returns:
+        dict: The metadata of the GeoTIFF file, or None if it could not be opened.
+    """
+    try:
+        with rasterio.open(filepath) as src:
+            return src.meta
+    except Exception as e:
+        print(f"Error reading metadata of {filepath}: {e}")
+        return None
+
+
+def _aligned_tile_shape(block_shape, raster_shape, tile_size):
+    # Round the requested tile size up to a whole number of internal blocks,
+    # so every tile read touches complete blocks only (no block is decoded twice).
+    tile_shape = []
+    for block, full, size in zip(block_shape, raster_shape, (tile_size, tile_size)):
+        n_blocks = max(1, math.ceil(size / block))
+        tile_shape.append(min(full, n_blocks * block))
+    return tuple(tile_shape)
+
+
+def get_tile_windows(filepath, tile_size=512, overlap=0):
+    """
+    Plans a tiling of a GeoTIFF that is aligned to its internal block windows.
+
+    The tile size is rounded up to a whole number of blocks. For striped files,
+    where a block is one full-width row, this gives full-width strips instead.
+
+    Args:
+        filepath (str): The path to the .tif file.
+        tile_size (int): The requested tile height and width in pixels.
+        overlap (int): Number of halo pixels to add around each tile on every side.
+
+    Returns:
+        list: (window, read_window) pairs covering the whole raster.
+    """
+    with rasterio.open(filepath) as src:
+        height, width = src.height, src.width
+        block_shape = src.block_shapes[0]
+
+    tile_height, tile_width = _aligned_tile_shape(block_shape, (height, width), tile_size)
+
+    tile_windows = []
+    for row_off in range(0, height, tile_height):
+        for col_off in range(0, width, tile_width):
+            window = Window(col_off, row_off,
+                            min(tile_width, width - col_off),
+                            min(tile_height, height - row_off))
+
+            # Grow the window by the halo, clipped to the raster bounds
+            read_row = max(0, row_off - overlap)
+            read_col = max(0, col_off - overlap)
+            read_bottom = min(height, row_off + window.height + overlap)
+            read_right = min(width, col_off + window.width + overlap)
+            read_window = Window(read_col, read_row, read_right - read_col, read_bottom - read_row)
+
+            tile_windows.append((window, read_window))
+    return tile_windows
+
+
+def core_slices(window, read_window):
+    """
+    Returns the (row_slice, col_slice) that crops an array read with read_window back to window.
+    """
+    row_start = int(window.row_off - read_window.row_off)
+    col_start = int(window.col_off - read_window.col_off)
+    return (slice(row_start, row_start + int(window.height)),
+            slice(col_start, col_start + int(window.width)))
+
+
+def iter_geotiff_tiles(filepath, tile_size=512, overlap=0, bands=None, tile_windows=None):
+    """
+    Reads a GeoTIFF tile by tile, so only one tile is held in memory at a time.
+
+    Args:
+        filepath (str): The path to the .tif file.
+        tile_size (int): The requested tile height and width in pixels (see get_tile_windows).
+        overlap (int): Number of halo pixels to read around each tile on every side.
+        bands (list, optional): 0-based indices of the bands to read. Reads all bands if None.
+        tile_windows (list, optional): A tiling from get_tile_windows to use instead of planning
+            one from this file. Pass the same tiling to several co-registered files to walk
+            them in lockstep.
+
+    Yields:
+        Tile: The tile data together with its windows and georeferencing transform.
+    """
+    if tile_windows is None:
+        tile_windows = get_tile_windows(filepath, tile_size, overlap)
+
+    indexes = _band_indexes(bands)
+    with rasterio.open(filepath) as src:
+        for window, read_window in tile_windows:
+            yield _read_tile(src, window, read_window, indexes)
+
+
+def read_tile(filepath, window, read_window=None, bands=None):
+    """
+    Reads a single tile of a GeoTIFF, e.g. one planned by get_tile_windows.
+
+    Args:
+        filepath (str): The path to the .tif file.
+        window (Window): The core window of the tile.
+        read_window (Window, optional): The window to read, including any halo. Defaults to window.
+        bands (list, optional): 0-based indices of the bands to read. Reads all bands if None.
+
+    Returns:
+        Tile: The tile data together with its windows and georeferencing transform.
+    """
+    if read_window is None:
+        read_window = window
+    with rasterio.open(filepath) as src:
+        return _read_tile(src, window, read_window, _band_indexes(bands))
+
+
+def _read_tile(src, window, read_window, indexes):
+    data = src.read(indexes, window=read_window)
+    # Same convention as load_geotiff: single band tiles are 2D
+    if data.shape[0] == 1:
+        data = data[0]
+    return Tile(data, window, read_window,
+                src.window_transform(read_window),
+                core_slices(window, read_window))
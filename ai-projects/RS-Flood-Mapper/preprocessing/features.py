@@ -0,0 +1,195 @@
+# preprocessing/features.py
+
+# A declarative band-math feature engine.
+# Features are named (e.g. 'ndwi', 'vv_db') and described by an operation on input
+# bands. All requested features are computed in one pass over the bands, straight into
+# a single preallocated float32 feature cube of shape (height, width, num_features),
+# which is the layout the Random Forest wants. The pass walks the image in row chunks,
+# so the only scratch memory is one small float32 buffer of chunk_rows x width.
+
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+# op:     the name of an operation in _OPERATIONS
+# inputs: the names of the bands the operation reads, in order
+FeatureSpec = namedtuple('FeatureSpec', ['op', 'inputs'])
+
+# The built-in spectral indices. Any requested feature name that is not in here is
+# taken to be a plain input band (e.g. 'vv', 'red') and copied into the cube as is.
+FEATURE_LIBRARY = {
+    'ndwi': FeatureSpec('normalized_difference', ('green', 'nir')),   # McFeeters NDWI
+    'mndwi': FeatureSpec('normalized_difference', ('green', 'swir1')),  # Xu's modified NDWI
+    'ndvi': FeatureSpec('normalized_difference', ('nir', 'red')),
+    'vv_vh_ratio': FeatureSpec('ratio', ('vv', 'vh')),
+    'vv_db': FeatureSpec('db', ('vv',)),
+    'vh_db': FeatureSpec('db', ('vh',)),
+}
+
+# Intensities at or below this are mapped to -100 dB instead of -inf
+_DB_FLOOR = 1e-10
+
+
+def _normalized_difference(a, b, out, scratch):
+    # (a - b) / (a + b), with 0 where the sum is 0 (like calculate_ndwi)
+    np.subtract(a, b, out=out, dtype=np.float32)
+    np.add(a, b, out=scratch, dtype=np.float32)
+    np.divide(out, scratch, out=out, where=scratch != 0)
+    np.copyto(out, 0, where=scratch == 0)
+
+
+def _ratio(a, b, out, scratch):
+    # a / b, with 0 where b is 0
+    np.copyto(scratch, b, casting='unsafe')
+    np.divide(a, scratch, out=out, where=scratch != 0, dtype=np.float32)
+    np.copyto(out, 0, where=scratch == 0)
+
+
+def _db(a, out, scratch):
+    # Linear intensity to decibels: 10 * log10(a)
+    np.maximum(a, _DB_FLOOR, out=out, dtype=np.float32)
+    np.log10(out, out=out)
+    np.multiply(out, 10, out=out)
+
+
+def _band(a, out, scratch):
+    np.copyto(out, a, casting='unsafe')
+
+
+_OPERATIONS = {
+    'normalized_difference': _normalized_difference,
+    'ratio': _ratio,
+    'db': _db,
+    'band': _band,
+}
+
+
+class FeatureEngine:
+    """
+    Computes a list of named features from input bands into one float32 feature cube.
+
+    Args:
+        features (list): Feature names, in the order of the cube's last axis. Names in
+            FEATURE_LIBRARY (or in specs) are computed, any other name is a plain band.
+        specs (dict, optional): Extra or overriding FeatureSpecs, by feature name.
+    """
+
+    def __init__(self, features, specs=None):
+        library = dict(FEATURE_LIBRARY, **(specs or {}))
+        self.features = list(features)
+        self.specs = [library.get(name, FeatureSpec('band', (name,))) for name in self.features]
+        for spec in self.specs:
+            if spec.op not in _OPERATIONS:
+                raise ValueError(f"Unknown feature operation '{spec.op}'.")
+        self._memory = None
+
+    @property
+    def required_bands(self):
+        """The names of all input bands the features need, in first-use order."""
+        bands = []
+        for spec in self.specs:
+            bands.extend(band for band in spec.inputs if band not in bands)
+        return bands
+
+    def compute(self, bands, ranges=None, out=None, chunk_rows=256, profile_memory=False):
+        """
+        Computes all features in one chunked pass over the bands.
+
+        Args:
+            bands (dict): Band name -> 2D array, all with the same shape. Any dtype.
+            ranges (dict, optional): Feature name -> (min, max). If given, every feature is
+                normalized to [0, 1] (and clipped) in the same pass.
+            out (numpy.ndarray, optional): A preallocated (height, width, num_features)
+                float32 array to fill, e.g. to reuse one buffer for many tiles.
+            chunk_rows (int): Number of image rows computed at a time.
+            profile_memory (bool): Measure the temporary memory every feature allocates
+                (with tracemalloc, so it is slower). See memory_report.
+
+        Returns:
+            numpy.ndarray: The (height, width, num_features) float32 feature cube.
+        """
+        missing = [band for band in self.required_bands if band not in bands]
+        if missing:
+            raise ValueError(f"Missing input bands for the features: {missing}")
+
+        height, width = np.shape(bands[self.required_bands[0]])
+        if out is None:
+            out = np.empty((height, width, len(self.features)), dtype=np.float32)
+        elif out.shape != (height, width, len(self.features)) or out.dtype != np.float32:
+            raise ValueError("out must be a float32 array of shape (height, width, num_features).")
+        scratch = np.empty((min(chunk_rows, height), width), dtype=np.float32)
+
+        started_tracing = False
+        if profile_memory:
+            self._memory = {
+                'cube_bytes': out.nbytes,
+                'scratch_bytes': scratch.nbytes,
+                'features': {name: {'output_bytes': height * width * 4, 'temporary_bytes': 0}
+                             for name in self.features},
+            }
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+
+        try:
+            for start in range(0, height, chunk_rows):
+                stop = min(height, start + chunk_rows)
+                chunk_scratch = scratch[:stop - start]
+                for index, (name, spec) in enumerate(zip(self.features, self.specs)):
+                    if profile_memory:
+                        tracemalloc.reset_peak()
+                        before = tracemalloc.get_traced_memory()[0]
+
+                    inputs = [bands[band][start:stop] for band in spec.inputs]
+                    target = out[start:stop, :, index]
+                    _OPERATIONS[spec.op](*inputs, out=target, scratch=chunk_scratch)
+                    if ranges is not None:
+                        self._normalize(target, *ranges[name])
+
+                    if profile_memory:
+                        used = tracemalloc.get_traced_memory()[1] - before
+                        entry = self._memory['features'][name]
+                        entry['temporary_bytes'] = max(entry['temporary_bytes'], used)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        return out
+
+    @staticmethod
+    def _normalize(values, min_val, max_val):
+        # In place version of normalize_image(..., clip=True)
+        if max_val - min_val > 0:
+            values -= min_val
+            values *= 1.0 / (max_val - min_val)
+            np.clip(values, 0, 1, out=values)
+        else:
+            values.fill(0)
+
+    def normalize(self, features, ranges):
+        """
+        Normalizes (and clips) an array whose last axis holds the features, in place.
+        Use it e.g. on training samples of shape (num_pixels, num_features).
+        """
+        for index, name in enumerate(self.features):
+            self._normalize(features[..., index], *ranges[name])
+        return features
+
+    def memory_report(self):
+        """
+        Returns the memory measured by the last compute(..., profile_memory=True) call:
+        the size of the cube and of the scratch buffer, and per feature its share of the
+        cube ('output_bytes') and the peak temporary memory it allocated ('temporary_bytes').
+        """
+        return self._memory
+
+    def print_memory_report(self):
+        """Prints memory_report() as a table."""
+        if self._memory is None:
+            print("No memory report yet, call compute(..., profile_memory=True) first.")
+            return
+        print(f"Feature cube: {self._memory['cube_bytes'] / 1e6:.1f} MB, "
+              f"scratch buffer: {self._memory['scratch_bytes'] / 1e6:.2f} MB")
+        for name, entry in self._memory['features'].items():
+            print(f"  {name:<12} output {entry['output_bytes'] / 1e6:8.1f} MB, "
+                  f"temporaries {entry['temporary_bytes'] / 1e6:8.2f} MB")
@@ -0,0 +1,88 @@
+# preprocessing/preprocessor.py
+
+import numpy as np
+from preprocessing.speckle import speckle_filter
+
+def apply_speckle_filter(sar_image, filter_size=3, verbose=True, method='median', looks=1.0, n_threads=None):
+    """
+    Applies a speckle filter to a SAR image to reduce speckle noise.
+
+    Args:
+        sar_image (numpy.ndarray): The input SAR image (single band).
+        filter_size (int): The size of the filter window.
+        verbose (bool): Print a progress message. Turn off when filtering many tiles.
+        method (str): 'median' (the default), 'lee', 'refined_lee' or 'frost'.
+            See preprocessing/speckle.py.
+        looks (float): Equivalent number of looks of the image, used by the Lee filters.
+        n_threads (int, optional): Number of threads. Defaults to all CPU cores.
+
+    Returns:
+        numpy.ndarray: The filtered SAR image.
+    """
+    if verbose:
+        print(f"Applying {method} speckle filter with size {filter_size}...")
+    return speckle_filter(sar_image, method, filter_size, looks=looks, n_threads=n_threads)
+
+
+def normalize_image(image, min_val=None, max_val=None, clip=False, verbose=True):
+    """
+    Normalizes image pixel values to be between 0 and 1.
+
+    Args:
+        image (numpy.ndarray): The input image (can be multi-band).
+        min_val (float, optional): The value mapped to 0. Taken from the image if None.
+        max_val (float, optional): The value mapped to 1. Taken from the image if None.
+            Pass both when normalizing tiles, so every tile gets the same scaling.
+        clip (bool): Clip the result to [0, 1]. Needed when min_val/max_val are percentiles
+            (see preprocessing/statistics.py) rather than the true min/max.
+        verbose (bool): Print a progress message. Turn off when normalizing many tiles.
+
+    Returns:
+        numpy.ndarray: The normalized image.
+    """
+    if verbose:
+        print("Normalizing image to range [0, 1]...")
+    if min_val is None:
+        min_val = np.min(image)
+    if max_val is None:
+        max_val = np.max(image)
+
+    if max_val - min_val > 0:
+        normalized = (image - min_val) / (max_val - min_val)
+        if clip:
+            np.clip(normalized, 0, 1, out=normalized)
+        return normalized
+    else:
+        # Return a zero array if the image is flat
+        return np.zeros_like(image)
+
+def calculate_ndwi(s2_image, green_band_idx=1, nir_band_idx=7, verbose=True):
+    """
+    Calculates the Normalized Difference Water Index (NDWI).
+    NDWI = (Green - NIR) / (Green + NIR)
+    
+    Note: Band indices are based on common Sentinel-2 band ordering. Adjust if needed.
+    Band 3 (Green) -> index 1
+    Band 8 (NIR) -> index 7
+
+    Args:
+        s2_image (numpy.ndarray): Sentinel-2 image with shape (bands, height, width).
+        green_band_idx (int): The index for the Green band.
+        nir_band_idx (int): The index for the Near-Infrared (NIR) band.
+        verbose (bool): Print a progress message. Turn off when processing many tiles.
+
+    Returns:
+        numpy.ndarray: A 2D array representing the NDWI.
+    """
+    if verbose:
+        print("Calculating NDWI...")
+    green = s2_image[green_band_idx, :, :].astype(float)
+    nir = s2_image[nir_band_idx, :, :].astype(float)
+    
+    # Use np.errstate to avoid division by zero warnings
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndwi = (green - nir) / (green + nir)
+    
+    # Replace NaN or Inf values with 0
+    ndwi[~np.isfinite(ndwi)] = 0
+    return ndwi
\ No newline at end of file
@@ -0,0 +1,108 @@
+# preprocessing/sampling.py
+
+# Class-balanced pixel sampling for training, without flattening the full raster.
+# Every pixel gets a random key and, per class, only the pixels with the smallest keys
+# are kept (a "bottom-k" sample). This is a uniform random sample of each class, its
+# size is fixed, and samplers filled from different tiles or worker processes can be
+# merged in any order with the same result.
+
+import numpy as np
+
+
+class StratifiedSampler:
+    """
+    Keeps a uniform random sample of up to samples_per_class pixels of every class.
+
+    Args:
+        samples_per_class (int): The maximum number of samples kept per class.
+    """
+
+    def __init__(self, samples_per_class):
+        self.samples_per_class = samples_per_class
+        self.seen = {}    # class -> number of pixels offered to the sampler
+        self._keys = {}   # class -> random keys of the kept samples
+        self._X = {}      # class -> features of the kept samples
+
+    def _keep(self, label, keys, X):
+        if keys.size > self.samples_per_class:
+            smallest = np.argpartition(keys, self.samples_per_class)[:self.samples_per_class]
+            keys, X = keys[smallest], X[smallest]
+        self._keys[label], self._X[label] = keys, X
+
+    def update(self, X, y, rng):
+        """
+        Offers a batch of pixels (e.g. one tile) to the sampler.
+
+        Args:
+            X (numpy.ndarray): Features, shape (num_pixels, num_features).
+            y (numpy.ndarray): Labels, shape (num_pixels,).
+            rng (numpy.random.Generator): Source of the random keys. Seed it from the tile
+                (e.g. default_rng([seed, tile_index])) to make the sample reproducible.
+        """
+        keys = rng.random(y.shape[0])
+        for label in np.unique(y):
+            in_class = y == label
+            self._offer(label.item(), keys[in_class], X[in_class])
+        return self
+
+    def _offer(self, label, keys, X):
+        self.seen[label] = self.seen.get(label, 0) + keys.size
+        if label in self._keys:
+            keys = np.concatenate((self._keys[label], keys))
+            X = np.concatenate((self._X[label], X))
+        self._keep(label, keys, X)
+
+    def merge(self, other):
+        """
+        Merges another sampler (e.g. from another tile or worker) into this one.
+        """
+        for label, keys in other._keys.items():
+            self._offer(label, keys, other._X[label])
+            # _offer counted the kept samples only, count everything the other one saw
+            self.seen[label] += other.seen[label] - keys.size
+        return self
+
+    def sample(self):
+        """
+        Returns the sample as (X, y), shuffled.
+        """
+        if not self._keys:
+            return np.empty((0, 0)), np.empty(0, dtype=np.int64)
+        labels = sorted(self._keys)
+        keys = np.concatenate([self._keys[label] for label in labels])
+        X = np.concatenate([self._X[label] for label in labels])
+        y = np.concatenate([np.full(self._keys[label].size, label) for label in labels])
+        # The keys are random, so sorting by them shuffles the classes together
+        order = np.argsort(keys, kind='stable')
+        return X[order], y[order]
+
+
+def spatial_holdout_mask(row_off, col_off, height, width, block_size=256, holdout_fraction=0.2, seed=42):
+    """
+    Marks the pixels of a tile that fall in held-out spatial blocks.
+
+    The scene is divided into block_size x block_size blocks, and every block is held
+    out with probability holdout_fraction. Whether a block is held out depends only on
+    its position and the seed, so all tiles agree on it. Evaluating on whole held-out
+    blocks keeps neighbouring (and so nearly identical) pixels from ending up on both
+    sides of the train/test split, which would inflate the scores.
+
+    Args:
+        row_off, col_off (int): Position of the tile in the scene.
+        height, width (int): Size of the tile.
+        block_size (int): Size of the hold-out blocks in pixels.
+        holdout_fraction (float): Fraction of the blocks to hold out.
+        seed (int): Seed of the block assignment.
+
+    Returns:
+        numpy.ndarray: A (height, width) boolean mask, True for held-out pixels.
+    """
+    block_rows = np.arange(row_off, row_off + height) // block_size
+    block_cols = np.arange(col_off, col_off + width) // block_size
+
+    held_out = np.empty((block_rows[-1] - block_rows[0] + 1, block_cols[-1] - block_cols[0] + 1), dtype=bool)
+    for i, block_row in enumerate(range(block_rows[0], block_rows[-1] + 1)):
+        for j, block_col in enumerate(range(block_cols[0], block_cols[-1] + 1)):
+            held_out[i, j] = np.random.default_rng([seed, block_row, block_col]).random() < holdout_fraction
+
+    return held_out[np.ix_(block_rows - block_rows[0], block_cols - block_cols[0])]
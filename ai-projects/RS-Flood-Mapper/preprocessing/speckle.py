@@ -0,0 +1,211 @@
+# preprocessing/speckle.py
+
+# Speckle filters for SAR images: median, Lee, refined Lee and Frost.
+# The adaptive filters are built on local statistics (mean and variance of a moving
+# window) taken from an integral image, so their cost does not grow with the window
+# size. Images are filtered in row strips across a thread pool; NumPy releases the
+# GIL inside its array operations, so the strips really run in parallel.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import median_filter, correlate1d
+
+SPECKLE_FILTERS = ('median', 'lee', 'refined_lee', 'frost')
+
+# Frost damping values are snapped to this fixed log-spaced grid (and interpolated in
+# between), so every tile uses the same kernels and tiled results have no seams.
+_FROST_ALPHAS = np.geomspace(0.01, 10.0, 12)
+
+
+def _integral_image(image, radius):
+    # Mirror the borders like scipy.ndimage does by default ('reflect' = numpy 'symmetric'),
+    # then prepend a row and column of zeros so every window sum is four lookups.
+    padded = np.pad(image.astype(np.float64), radius, mode='symmetric')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    np.cumsum(padded, axis=0, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return integral
+
+
+def _rect_sum(integral, shape, radius, top, bottom, left, right):
+    # Sum over rows [i + top, i + bottom] and columns [j + left, j + right] around
+    # every pixel (i, j); offsets are relative to the pixel and within [-radius, radius].
+    height, width = shape
+    r0, r1 = radius + top, radius + bottom + 1
+    c0, c1 = radius + left, radius + right + 1
+    return (integral[r1:r1 + height, c1:c1 + width] - integral[r0:r0 + height, c1:c1 + width]
+            - integral[r1:r1 + height, c0:c0 + width] + integral[r0:r0 + height, c0:c0 + width])
+
+
+def _rect_stats(integral, integral_sq, shape, radius, top, bottom, left, right):
+    n = (bottom - top + 1) * (right - left + 1)
+    mean = _rect_sum(integral, shape, radius, top, bottom, left, right) / n
+    mean_sq = _rect_sum(integral_sq, shape, radius, top, bottom, left, right) / n
+    # Clamp tiny negative variances caused by floating point cancellation
+    return mean, np.maximum(mean_sq - mean * mean, 0)
+
+
+def local_statistics(image, size):
+    """
+    Computes the mean and variance of a size x size window around every pixel.
+
+    Args:
+        image (numpy.ndarray): A 2D image.
+        size (int): The (odd) window size.
+
+    Returns:
+        tuple: (mean, variance) arrays with the shape of the image, as float64.
+    """
+    radius = size // 2
+    image = np.asarray(image, dtype=np.float64)
+    integral = _integral_image(image, radius)
+    integral_sq = _integral_image(image * image, radius)
+    return _rect_stats(integral, integral_sq, image.shape, radius, -radius, radius, -radius, radius)
+
+
+def _lee_weights(mean, variance, looks):
+    # Lee's MMSE weight: 1 - Cu^2 / Ci^2, where Ci is the local coefficient of variation
+    # and Cu = 1 / sqrt(looks) the one expected from speckle alone.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ci2 = variance / (mean * mean)
+        weights = 1.0 - (1.0 / looks) / ci2
+    weights[~np.isfinite(weights)] = 0
+    return np.clip(weights, 0, 1, out=weights)
+
+
+def _lee(image, size, looks):
+    mean, variance = local_statistics(image, size)
+    return mean + _lee_weights(mean, variance, looks) * (image - mean)
+
+
+# The 8 edge-aligned half windows of the refined Lee filter, as (top, bottom, left, right)
+# fractions of the window radius: 4 half planes and 4 quadrants.
+_REFINED_WINDOWS = [
+    (-1, 0, -1, 1), (0, 1, -1, 1), (-1, 1, -1, 0), (-1, 1, 0, 1),
+    (-1, 0, -1, 0), (-1, 0, 0, 1), (0, 1, -1, 0), (0, 1, 0, 1),
+]
+
+
+def _refined_lee(image, size, looks):
+    # Like Lee's refined filter, the statistics come from the edge-aligned sub-window
+    # that stays on one side of an edge. Instead of Lee's gradient masks, the sub-window
+    # with the lowest variance is picked, which is fully vectorized and keeps edges sharp.
+    radius = size // 2
+    image = np.asarray(image, dtype=np.float64)
+    integral = _integral_image(image, radius)
+    integral_sq = _integral_image(image * image, radius)
+
+    best_mean = best_variance = None
+    for top, bottom, left, right in _REFINED_WINDOWS:
+        mean, variance = _rect_stats(integral, integral_sq, image.shape, radius,
+                                     top * radius, bottom * radius, left * radius, right * radius)
+        if best_mean is None:
+            best_mean, best_variance = mean, variance
+        else:
+            better = variance < best_variance
+            np.copyto(best_mean, mean, where=better)
+            np.copyto(best_variance, variance, where=better)
+    return best_mean + _lee_weights(best_mean, best_variance, looks) * (image - best_mean)
+
+
+def _exponential_filter(image, radius, alpha):
+    # exp(-alpha * (|dx| + |dy|)) is separable, so it runs as two 1D passes
+    kernel = np.exp(-alpha * np.abs(np.arange(-radius, radius + 1)))
+    kernel /= kernel.sum()
+    return correlate1d(correlate1d(image, kernel, axis=0, mode='reflect'), kernel, axis=1, mode='reflect')
+
+
+def _frost(image, size, damping):
+    # Frost's kernel exp(-damping * Ci^2 * distance) changes from pixel to pixel. With a
+    # city-block distance it is separable for a fixed damping, so the image is filtered
+    # with a small fixed set of kernels and every pixel interpolates between the two
+    # whose damping brackets its own.
+    radius = size // 2
+    image = np.asarray(image, dtype=np.float64)
+    mean, variance = local_statistics(image, size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = damping * variance / (mean * mean)
+    alpha[~np.isfinite(alpha)] = _FROST_ALPHAS[0]
+    np.clip(alpha, _FROST_ALPHAS[0], _FROST_ALPHAS[-1], out=alpha)
+
+    position = np.interp(np.log(alpha), np.log(_FROST_ALPHAS), np.arange(_FROST_ALPHAS.size))
+    lower = np.floor(position).astype(np.intp)
+    fraction = position - lower
+
+    # Only the kernels some pixel actually interpolates from are computed
+    used = np.bincount(lower.ravel(), minlength=_FROST_ALPHAS.size) > 0
+    used[1:] |= used[:-1]
+
+    result = np.zeros_like(image)
+    weight = np.empty_like(image)
+    for level in np.flatnonzero(used):
+        # Pixels take (1 - fraction) of their lower kernel and fraction of the next one
+        weight.fill(0)
+        np.copyto(weight, 1 - fraction, where=lower == level)
+        np.copyto(weight, fraction, where=lower + 1 == level)
+        weight *= _exponential_filter(image, radius, _FROST_ALPHAS[level])
+        result += weight
+    return result
+
+
+def _filter_block(image, method, size, looks, damping):
+    if method == 'median':
+        return median_filter(image, size=size)
+    if method == 'lee':
+        return _lee(image, size, looks)
+    if method == 'refined_lee':
+        return _refined_lee(image, size, looks)
+    if method == 'frost':
+        return _frost(image, size, damping)
+    raise ValueError(f"Unknown speckle filter '{method}', choose one of {SPECKLE_FILTERS}.")
+
+
+def speckle_filter(image, method='lee', size=5, looks=1.0, damping=2.0, n_threads=None, chunk_rows=512):
+    """
+    Filters speckle from a SAR image, in row strips across a thread pool.
+
+    Every strip is read with a halo of size // 2 rows, so the result is the same as
+    filtering the whole image at once.
+
+    Args:
+        image (numpy.ndarray): The input SAR image (single band, linear intensity).
+        method (str): One of 'median', 'lee', 'refined_lee' or 'frost'.
+        size (int): The size of the filter window, e.g. 5 or 7 (odd, except for 'median').
+        looks (float): Equivalent number of looks of the image (Lee filters).
+        damping (float): Damping factor of the Frost filter.
+        n_threads (int, optional): Number of threads. Defaults to all CPU cores.
+        chunk_rows (int): Number of rows per strip.
+
+    Returns:
+        numpy.ndarray: The filtered image, with the dtype of the input if it is a float.
+    """
+    if method not in SPECKLE_FILTERS:
+        raise ValueError(f"Unknown speckle filter '{method}', choose one of {SPECKLE_FILTERS}.")
+    if size % 2 == 0 and method != 'median':
+        raise ValueError("The speckle filter size must be odd.")
+
+    height = image.shape[0]
+    radius = size // 2
+    out_dtype = image.dtype if image.dtype.kind == 'f' else np.float64
+    if method == 'median':
+        out_dtype = image.dtype
+    result = np.empty(image.shape, dtype=out_dtype)
+
+    def run_strip(start):
+        stop = min(height, start + chunk_rows)
+        read_start, read_stop = max(0, start - radius), min(height, stop + radius)
+        filtered = _filter_block(image[read_start:read_stop], method, size, looks, damping)
+        result[start:stop] = filtered[start - read_start:stop - read_start]
+
+    n_threads = n_threads or os.cpu_count()
+    starts = range(0, height, chunk_rows)
+    if n_threads == 1 or len(starts) == 1:
+        for start in starts:
+            run_strip(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            # list() re-raises any exception from the strips
+            list(executor.map(run_strip, starts))
+    return result
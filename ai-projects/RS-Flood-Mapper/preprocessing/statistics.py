@@ -0,0 +1,244 @@
+# preprocessing/statistics.py
+
+# Streaming, mergeable image statistics.
+# A StreamingStats object is updated tile by tile and two of them can be merged, so
+# statistics of a whole scene (or of several scenes) can be collected across worker
+# processes without ever holding the full image in memory. Quantiles come from a
+# log-bucketed histogram sketch (the idea behind DDSketch): every quantile is exact
+# to within a fixed relative error, and the sketch size does not depend on the data size.
+
+import json
+import math
+
+import numpy as np
+
+# Values with a smaller magnitude than this are counted as zero by the sketch
+MIN_INDEXABLE = 1e-9
+
+
+def _add_buckets(buckets, offset, counts):
+    # buckets is an (offset, counts) pair: counts[i] belongs to bucket index offset + i
+    old_offset, old_counts = buckets
+    if old_counts.size == 0:
+        return offset, counts.astype(np.int64)
+    if counts.size == 0:
+        return buckets
+    new_offset = min(old_offset, offset)
+    new_end = max(old_offset + old_counts.size, offset + counts.size)
+    merged = np.zeros(new_end - new_offset, dtype=np.int64)
+    merged[old_offset - new_offset:old_offset - new_offset + old_counts.size] += old_counts
+    merged[offset - new_offset:offset - new_offset + counts.size] += counts
+    return new_offset, merged
+
+
+class StreamingStats:
+    """
+    Mergeable count/mean/std/min/max and quantile sketch of a stream of values.
+
+    Args:
+        relative_accuracy (float): Maximum relative error of the quantiles (0.01 = 1%).
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean (Welford / Chan et al.)
+        self.min = math.inf
+        self.max = -math.inf
+        self.zero_count = 0
+        self._positive = (0, np.zeros(0, dtype=np.int64))
+        self._negative = (0, np.zeros(0, dtype=np.int64))
+
+    @property
+    def std(self):
+        """The population standard deviation of the values seen so far."""
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def _bucketize(self, magnitudes):
+        indices = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        offset = int(indices.min())
+        return offset, np.bincount(indices - offset)
+
+    def update(self, values):
+        """
+        Adds an array of values (of any shape). NaN and infinite values are ignored.
+        """
+        values = np.asarray(values).ravel()
+        if values.dtype.kind == 'f':
+            values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+
+        # Merge the statistics of this batch like those of another accumulator
+        batch_mean = float(np.mean(values, dtype=np.float64))
+        batch_m2 = float(np.sum(np.square(values - batch_mean, dtype=np.float64)))
+        self._merge_moments(values.size, batch_mean, batch_m2)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > MIN_INDEXABLE]
+        negative = values[values < -MIN_INDEXABLE]
+        if positive.size:
+            self._positive = _add_buckets(self._positive, *self._bucketize(positive))
+        if negative.size:
+            self._negative = _add_buckets(self._negative, *self._bucketize(-negative))
+        self.zero_count += values.size - positive.size - negative.size
+        return self
+
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        """
+        Merges another StreamingStats (e.g. from another tile or worker) into this one.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can only merge statistics with the same relative accuracy.")
+        if other.count == 0:
+            return self
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zero_count += other.zero_count
+        self._positive = _add_buckets(self._positive, *other._positive)
+        self._negative = _add_buckets(self._negative, *other._negative)
+        return self
+
+    def _sorted_buckets(self):
+        # Representative value and count of every bucket, in ascending value order
+        def representatives(buckets):
+            offset, counts = buckets
+            indices = np.arange(offset, offset + counts.size)
+            return 2 * self._gamma ** indices / (self._gamma + 1), counts
+
+        pos_values, pos_counts = representatives(self._positive)
+        neg_values, neg_counts = representatives(self._negative)
+        values = np.concatenate((-neg_values[::-1], [0.0], pos_values))
+        counts = np.concatenate((neg_counts[::-1], [self.zero_count], pos_counts))
+        return values, counts
+
+    def quantile(self, q):
+        """
+        Returns the approximate q-quantile (0 <= q <= 1) of the values seen so far.
+        """
+        if self.count == 0:
+            return math.nan
+        values, counts = self._sorted_buckets()
+        rank = q * (self.count - 1)
+        position = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        value = float(values[min(position, values.size - 1)])
+        # The sketch never reports anything outside of the exact range
+        return min(max(value, self.min), self.max)
+
+    def clip_range(self, low=1.0, high=99.0):
+        """
+        Returns a (min, max) range clipped to the given percentiles, which is robust
+        against a few hot or dead pixels. Use it to normalize with normalize_image.
+        """
+        return self.quantile(low / 100), self.quantile(high / 100)
+
+    def histogram(self, bins=256, range=None):
+        """
+        Returns an approximate histogram as (counts, bin_edges), like numpy.histogram.
+
+        Args:
+            bins (int): Number of equal-width bins.
+            range (tuple, optional): (min, max) of the bins. Defaults to the exact value range.
+        """
+        values, counts = self._sorted_buckets()
+        if range is None:
+            range = (self.min, self.max)
+        values = np.clip(values, self.min, self.max)
+        return np.histogram(values, bins=bins, range=range, weights=counts)
+
+    def to_dict(self):
+        """Returns a JSON serializable dict of the statistics."""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.min,
+            'max': self.max,
+            'zero_count': self.zero_count,
+            'positive': {'offset': self._positive[0], 'counts': self._positive[1].tolist()},
+            'negative': {'offset': self._negative[0], 'counts': self._negative[1].tolist()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuilds statistics saved with to_dict."""
+        stats = cls(data['relative_accuracy'])
+        for key in ('count', 'mean', 'm2', 'min', 'max', 'zero_count'):
+            setattr(stats, key, data[key])
+        stats._positive = (data['positive']['offset'], np.array(data['positive']['counts'], dtype=np.int64))
+        stats._negative = (data['negative']['offset'], np.array(data['negative']['counts'], dtype=np.int64))
+        return stats
+
+
+def save_statistics(stats, filepath):
+    """
+    Saves a dict of named StreamingStats to a JSON file, e.g. to reuse them at inference time.
+
+    Args:
+        stats (dict): Feature name -> StreamingStats.
+        filepath (str): The path of the .json file to write.
+    """
+    print(f"Saving feature statistics to {filepath}...")
+    with open(filepath, 'w') as f:
+        json.dump({name: s.to_dict() for name, s in stats.items()}, f)
+
+
+def load_statistics(filepath):
+    """
+    Loads a dict of named StreamingStats saved with save_statistics.
+
+    Args:
+        filepath (str): The path of the .json file.
+
+    Returns:
+        dict: Feature name -> StreamingStats, or None if the file could not be read.
+    """
+    try:
+        with open(filepath) as f:
+            return {name: StreamingStats.from_dict(d) for name, d in json.load(f).items()}
+    except Exception as e:
+        print(f"Error loading statistics from {filepath}: {e}")
+        return None
+
+
+def merge_statistics(stats, other):
+    """
+    Merges a dict of named StreamingStats into another one, in place.
+    """
+    for name, s in other.items():
+        if name in stats:
+            stats[name].merge(s)
+        else:
+            stats[name] = s
+    return stats
+
+
+def feature_ranges(stats, percentiles=None):
+    """
+    Turns a dict of named StreamingStats into (min, max) normalization ranges.
+
+    Args:
+        stats (dict): Feature name -> StreamingStats.
+        percentiles (tuple, optional): (low, high) percentiles to clip to, e.g. (1, 99).
+            Uses the exact min/max if None.
+
+    Returns:
+        dict: Feature name -> (min, max).
+    """
+    if percentiles is None:
+        return {name: (s.min, s.max) for name, s in stats.items()}
+    return {name: s.clip_range(*percentiles) for name, s in stats.items()}
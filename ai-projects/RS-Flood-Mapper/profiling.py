@@ -0,0 +1,219 @@
+# profiling.py
+
+# Stage timing for the flood mapping workflow.
+# Code wraps its stages in `with stage('load'):` and every stage records its wall time,
+# CPU time, peak resident memory (RSS) and the bytes the process read and wrote while
+# it ran. Worker processes record their own stages and send them back with their
+# results (see pipeline.py), so a run's profile covers every process. The profile is
+# saved as JSON (every stage, plus a summary per stage name) and optionally as a
+# Chrome trace, which chrome://tracing or https://ui.perfetto.dev show as a timeline
+# with one row per process.
+#
+# Peak RSS and the byte counters come from /proc on Linux. On Linux the peak is reset
+# when a stage starts, so it is the stage's own peak; elsewhere it is the process's
+# peak so far and the byte counters are not available.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _read_proc(name):
+    try:
+        with open(f'/proc/self/{name}') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _io_counters():
+    # Bytes passed through read()/write() calls: files (including reads served from the
+    # page cache), but also pipes, e.g. the results a pool's workers send back
+    text = _read_proc('io')
+    if text is None:
+        return None
+    counters = dict(line.split(': ') for line in text.splitlines())
+    return int(counters['rchar']), int(counters['wchar'])
+
+
+def _peak_rss():
+    text = _read_proc('status')
+    if text is not None:
+        for line in text.splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def _reset_peak_rss():
+    # Linux 4.0+: sets the peak RSS back to the current RSS
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Profiler:
+    """
+    Records the stages of one process and collects those of its workers.
+
+    A stage is a dict with its name, process id, thread name, nesting depth, start time
+    (seconds since the epoch), 'wall_seconds', 'cpu_seconds', 'peak_rss_bytes',
+    'bytes_read', 'bytes_written' (None where not measurable) and the keyword
+    arguments given to stage().
+    """
+
+    def __init__(self):
+        self.records = []
+        self._open = []
+        self._lock = threading.Lock()
+        self._depth = threading.local()
+        self._can_reset = True
+
+    @contextmanager
+    def stage(self, name, **args):
+        """
+        Records the code inside the with block as a stage called name. Stages can be
+        nested; any keyword arguments (e.g. tile=3) are kept with the record.
+        """
+        record = {'name': name, 'pid': os.getpid(), 'thread': threading.current_thread().name,
+                  'depth': getattr(self._depth, 'value', 0), 'args': args}
+        with self._lock:
+            # The stages still running keep the peak so far before it is reset
+            peak = _peak_rss()
+            for running in self._open:
+                running['peak_rss_bytes'] = max(running['peak_rss_bytes'] or 0, peak or 0)
+            if self._can_reset:
+                self._can_reset = _reset_peak_rss()
+            record['peak_rss_bytes'] = _peak_rss()
+            self._open.append(record)
+        self._depth.value = record['depth'] + 1
+        io_start = _io_counters()
+        record['start'] = time.time()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            io_end = _io_counters()
+            if io_start is None or io_end is None:
+                record['bytes_read'] = record['bytes_written'] = None
+            else:
+                record['bytes_read'] = io_end[0] - io_start[0]
+                record['bytes_written'] = io_end[1] - io_start[1]
+            self._depth.value = record['depth']
+            with self._lock:
+                self._open.remove(record)
+                peak = _peak_rss()
+                if peak is not None:
+                    record['peak_rss_bytes'] = max(record['peak_rss_bytes'] or 0, peak)
+                self.records.append(record)
+
+    def clear(self):
+        """Forgets all records, e.g. in a worker that inherited its parent's profiler."""
+        self.records = []
+
+    def drain(self):
+        """Returns the records so far and forgets them, for a worker to send back."""
+        records, self.records = self.records, []
+        return records
+
+    def merge(self, records):
+        """Adds records drained in another process."""
+        self.records.extend(records)
+
+    def summary(self):
+        """
+        Returns the totals per stage name: 'count', 'wall_seconds', 'cpu_seconds',
+        'bytes_read', 'bytes_written' (sums over all processes), 'peak_rss_bytes' (the
+        highest of any one stage) and 'processes' (how many processes ran the stage).
+        """
+        totals = {}
+        for record in self.records:
+            entry = totals.setdefault(record['name'], {
+                'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_bytes': None,
+                'bytes_read': None, 'bytes_written': None, 'processes': set()})
+            entry['count'] += 1
+            entry['wall_seconds'] += record['wall_seconds']
+            entry['cpu_seconds'] += record['cpu_seconds']
+            entry['processes'].add(record['pid'])
+            for key in ('bytes_read', 'bytes_written'):
+                if record[key] is not None:
+                    entry[key] = (entry[key] or 0) + record[key]
+            if record['peak_rss_bytes'] is not None:
+                entry['peak_rss_bytes'] = max(entry['peak_rss_bytes'] or 0, record['peak_rss_bytes'])
+        for entry in totals.values():
+            entry['processes'] = len(entry['processes'])
+        return totals
+
+    def to_dict(self):
+        return {'summary': self.summary(), 'stages': self.records}
+
+    def save(self, filepath):
+        """Saves the summary and every stage as JSON."""
+        print(f"Saving profile to {filepath}...")
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def save_chrome_trace(self, filepath):
+        """
+        Saves the stages in the Chrome trace event format, for chrome://tracing or
+        https://ui.perfetto.dev.
+        """
+        print(f"Saving Chrome trace to {filepath}...")
+        origin = min((record['start'] for record in self.records), default=0)
+        main_pid = os.getpid()
+        events = []
+        for pid in dict.fromkeys(record['pid'] for record in self.records):
+            name = 'main' if pid == main_pid else f'worker {pid}'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+        # Trace viewers want numeric thread ids, so threads are numbered per process
+        threads = {}
+        for record in self.records:
+            thread = (record['pid'], record['thread'])
+            if thread not in threads:
+                threads[thread] = sum(pid == record['pid'] for pid, _ in threads)
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': record['pid'], 'tid': threads[thread],
+                               'args': {'name': record['thread']}})
+            args = {key: record[key] for key in ('cpu_seconds', 'peak_rss_bytes', 'bytes_read', 'bytes_written')}
+            args.update(record['args'])
+            events.append({'name': record['name'], 'ph': 'X', 'pid': record['pid'], 'tid': threads[thread],
+                           'ts': (record['start'] - origin) * 1e6, 'dur': record['wall_seconds'] * 1e6,
+                           'args': args})
+        with open(filepath, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def print_summary(self):
+        """Prints summary() as a table."""
+        def mb(value):
+            return '-' if value is None else f'{value / 1e6:.1f}'
+
+        print(f"{'stage':<20}{'count':>7}{'wall s':>10}{'cpu s':>10}{'peak RSS MB':>13}"
+              f"{'read MB':>10}{'written MB':>12}")
+        for name, entry in self.summary().items():
+            print(f"{name:<20}{entry['count']:>7}{entry['wall_seconds']:>10.2f}{entry['cpu_seconds']:>10.2f}"
+                  f"{mb(entry['peak_rss_bytes']):>13}{mb(entry['bytes_read']):>10}"
+                  f"{mb(entry['bytes_written']):>12}")
+
+
+# The profiler of this process. Every process has its own; forked workers should clear() it.
+PROFILER = Profiler()
+
+
+def stage(name, **args):
+    """Records a stage in this process's profiler, see Profiler.stage."""
+    return PROFILER.stage(name, **args)
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from scipy import ndimage
+
+from postprocessing.components import UnionFind, connectivity_structure, find_components, label_tile
+from postprocessing.vectorize import polygonize
+
+# 16 x 16 pixel tiles over a 40 x 44 raster, so the last row and column of tiles are partial
+BLOCK = 16
+
+
+def _flood_map():
+    rng = np.random.default_rng(0)
+    flood = (rng.random((40, 44)) < 0.35).astype(np.uint8)
+    # Cleared areas around the seams, for the cases below
+    flood[:20, :20] = 0
+    flood[12:20, 28:36] = 0
+    flood[28:36, 12:20] = 0
+    # Crosses the horizontal seam at row 16 and the vertical seam at column 16
+    flood[10:20, 3] = 1
+    flood[5, 12:20] = 1
+    # Touches only at the corner pixels of diagonal tiles: down-right and down-left
+    flood[15, 15] = flood[16, 16] = 1
+    flood[15, 32] = flood[16, 31] = 1
+    # Spans all four tiles around the corner at (32, 16)
+    flood[31:33, 15:17] = 1
+    return flood
+
+
+@pytest.fixture(scope='module')
+def flood_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp('components') / 'flood.tif'
+    flood = _flood_map()
+    meta = {'driver': 'GTiff', 'height': flood.shape[0], 'width': flood.shape[1], 'count': 1,
+            'dtype': 'uint8', 'transform': from_origin(0, flood.shape[0], 1, 1),
+            'tiled': True, 'blockxsize': BLOCK, 'blockysize': BLOCK}
+    with rasterio.open(path, 'w', **meta) as dst:
+        dst.write(flood, 1)
+    return str(path), flood
+
+
+def _scene_labels(found, input_file, connectivity):
+    # The scene-wide component of every pixel, from the labels of the tiles
+    labels = np.zeros((found.tile_windows[-1].row_off + found.tile_windows[-1].height,
+                       found.tile_windows[-1].col_off + found.tile_windows[-1].width), dtype=np.int64)
+    for index, window in enumerate(found.tile_windows):
+        mask, tile_labels, _ = label_tile(input_file, window, connectivity=connectivity)
+        rows = slice(window.row_off, window.row_off + window.height)
+        cols = slice(window.col_off, window.col_off + window.width)
+        labels[rows, cols][mask] = found.components[tile_labels[mask] - 1 + found.offsets[index]] + 1
+    return labels
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+def test_find_components_matches_ndimage_label(flood_file, connectivity):
+    input_file, flood = flood_file
+    expected, count = ndimage.label(flood, connectivity_structure(connectivity))
+    found = find_components(input_file, connectivity=connectivity, tile_size=BLOCK, n_workers=2)
+    assert len(found.tile_windows) == 9
+    assert any(found.pieces > 1)
+
+    labels = _scene_labels(found, input_file, connectivity)
+    # The same partition of the flood pixels: every component maps to exactly one of ndimage's
+    pairs = np.unique(np.column_stack((labels[flood > 0], expected[flood > 0])), axis=0)
+    assert len(pairs) == count == len(np.unique(labels[flood > 0]))
+
+    is_root = found.components == np.arange(found.components.size)
+    assert is_root.sum() == count
+    assert sorted(found.areas[is_root]) == sorted(np.bincount(expected.ravel())[1:])
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+def test_polygonize_matches_ndimage_label(flood_file, tmp_path, connectivity):
+    input_file, flood = flood_file
+    expected, count = ndimage.label(flood, connectivity_structure(connectivity))
+    output_file = tmp_path / 'flood.geojson'
+    assert polygonize(input_file, str(output_file), connectivity=connectivity, tile_size=BLOCK,
+                      n_workers=2) == count
+    with open(output_file) as f:
+        features = json.load(f)['features']
+    areas = [feature['properties']['area_pixels'] for feature in features]
+    assert sorted(areas) == sorted(np.bincount(expected.ravel())[1:])
+    assert sorted(feature['properties']['id'] for feature in features) == list(range(1, count + 1))
+
+
+def test_union_find_roots_are_the_smallest_ids():
+    union_find = UnionFind(6)
+    for a, b in ((4, 5), (5, 2), (1, 3)):
+        union_find.union(a, b)
+    assert union_find.roots().tolist() == [0, 1, 2, 1, 2, 2]
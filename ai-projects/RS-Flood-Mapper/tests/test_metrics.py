@@ -0,0 +1,27 @@
+import numpy as np
+
+from evaluation.metrics import ConfusionMatrix
+
+
+def test_integer_labels_with_nodata():
+    y_true = np.array([0, 1, 1, 255, 0], dtype=np.uint8)
+    y_pred = np.array([0, 1, 0, 1, 255], dtype=np.uint8)
+    cm = ConfusionMatrix().update(y_true, y_pred)
+    assert cm.matrix.tolist() == [[1, 0], [1, 1]]
+    assert cm.ignored == 2
+
+
+def test_float_nan_and_negative_nodata_are_ignored():
+    y_true = np.array([0, 1, 1, np.nan, -9999, 1, 0.5, 0], dtype=np.float32)
+    y_pred = np.array([0, 1, 0, 1, 1, -1, 1, 2], dtype=np.float32)
+    cm = ConfusionMatrix().update(y_true, y_pred)
+    assert cm.matrix.tolist() == [[1, 0], [1, 1]]
+    assert cm.ignored == 5
+
+
+def test_negative_integer_nodata_is_ignored():
+    y_true = np.array([[1, -1], [0, 1]], dtype=np.int16)
+    y_pred = np.array([[1, 1], [-9999, 1]], dtype=np.int16)
+    cm = ConfusionMatrix().update(y_true, y_pred)
+    assert cm.matrix.tolist() == [[0, 0], [0, 2]]
+    assert cm.ignored == 2
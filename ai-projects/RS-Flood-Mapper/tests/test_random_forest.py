@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from models.random_forest import predict_rf_chunked, quantize_probability
+
+
+@pytest.fixture(scope='module')
+def model_and_features():
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((30, 30, 3))
+    labels = (features[..., 0] + features[..., 1] > 0).astype(np.uint8)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(features.reshape(-1, 3), labels.ravel())
+    return model, features
+
+
+@pytest.mark.parametrize('probability', [False, True])
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_predict_into_window_of_larger_array(model_and_features, probability, n_workers):
+    model, features = model_and_features
+    window = features[5:25, 5:25]
+    if probability:
+        expected = quantize_probability(model.predict_proba(window.reshape(-1, 3))[:, 1])
+    else:
+        expected = model.predict(window.reshape(-1, 3)).astype(np.uint8)
+
+    big = np.zeros((30, 30), dtype=np.uint8)
+    result = predict_rf_chunked(model, window, chunk_pixels=64, probability=probability, n_workers=n_workers,
+                                out=big[5:25, 5:25], verbose=False)
+    np.testing.assert_array_equal(big[5:25, 5:25].ravel(), expected)
+    assert not big[:5].any() and not big[25:].any() and not big[:, :5].any() and not big[:, 25:].any()
+    np.testing.assert_array_equal(result, big[5:25, 5:25])
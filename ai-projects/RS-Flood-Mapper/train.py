@@ -2,94 +2,167 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
 import rasterio
 
 # Import our custom modules
-from preprocessing.data_loader import load_geotiff
-from preprocessing.preprocessor import apply_speckle_filter, normalize_image, calculate_ndwi
-from models.random_forest import prepare_data_for_rf, train_random_forest, predict_with_rf
+from preprocessing.data_loader import read_geotiff_meta, get_tile_windows
+from models.random_forest import train_random_forest
+from models.compiled_forest import compile_forest, save_compiled_forest
 from evaluation.metrics import print_evaluation_metrics
+from preprocessing.statistics import save_statistics, feature_ranges
+from preprocessing.features import FeatureEngine
+from profiling import PROFILER, stage
+from pipeline import (scan_scene, predict_scene, postprocess_scene, required_bands,
+                      DEFAULT_FEATURES, S1_BAND_INDEX, S2_BAND_INDEX)
+
 
 def main():
     """Main function to run the flood mapping workflow."""
-    
+
     # --- 1. Configuration: Update these file paths in the data folder ---
     S1_FILE = 'data/sentinel1.tif'
     S2_FILE = 'data/sentinel2.tif'
     MASK_FILE = 'data/flood_mask.tif'
     OUTPUT_PREDICTION_FILE = 'data/rf_prediction.tif'
+    # Write the flood probability (0-255) instead of 0/1 labels to the prediction map
+    OUTPUT_PROBABILITY = False
+    # The prediction map is written as a Cloud-Optimized GeoTIFF with internal overviews
+    # and this compression (see postprocessing/cog.py and benchmark_cog.py); None writes
+    # a plain GeoTIFF like the inputs
+    OUTPUT_COG = {'codec': 'deflate', 'predictor': 2}
+    # The trained forest is also exported as flat arrays here (see models/compiled_forest.py).
+    # With PREDICT_WITH_COMPILED the workers memory-map it instead of unpickling the model.
+    COMPILED_MODEL_DIR = 'data/rf_compiled'
+    PREDICT_WITH_COMPILED = False
+    # Post-processing: a morphological opening/closing with a MORPHOLOGY_RADIUS disk, then
+    # the minimum mapping unit (flood patches and dry holes below MIN_MAPPING_UNIT pixels
+    # are removed/filled). The cleaned map and one polygon per water body go here.
+    CLEANED_PREDICTION_FILE = 'data/rf_prediction_clean.tif'
+    POLYGONS_FILE = 'data/flood_polygons.geojson'
+    MORPHOLOGY_RADIUS = 1
+    MIN_MAPPING_UNIT = 50
+    # Feature statistics are saved here so inference runs can normalize the same way
+    STATS_FILE = 'data/feature_stats.json'
+
+    # The scene is processed in tiles, so peak memory depends on TILE_SIZE (times the
+    # number of workers) rather than on the scene size. FILTER_SIZE // 2 pixels of halo
+    # are read around each tile so the speckle filter has no seams between tiles.
+    TILE_SIZE = 1024
+    FILTER_SIZE = 3
+    # Features computed for every pixel (see pipeline.py and preprocessing/features.py)
+    FEATURES = DEFAULT_FEATURES
+    # 'median', 'lee', 'refined_lee' or 'frost' (see preprocessing/speckle.py)
+    SPECKLE_FILTER = 'median'
+    # Class-balanced training sample: at most this many pixels of every class
+    SAMPLES_PER_CLASS = 100000
+    # Whole HOLDOUT_BLOCK_SIZE x HOLDOUT_BLOCK_SIZE blocks are held out for evaluation,
+    # so neighbouring pixels never end up in both the training and the test sample
+    HOLDOUT_BLOCK_SIZE = 256
+    HOLDOUT_FRACTION = 0.2
+    # Features are normalized to these scene-wide percentiles rather than the raw
+    # min/max, so a few hot pixels cannot squash the range of every other pixel
+    CLIP_PERCENTILES = (1.0, 99.0)
+    # Worker processes for the tiled passes (None = all CPU cores)
+    N_WORKERS = None
+    # Wall time, CPU time, peak memory and bytes read/written of every stage (see
+    # profiling.py) are saved here, and as a Chrome trace to PROFILE_TRACE_FILE
+    # (open it in chrome://tracing or https://ui.perfetto.dev; None skips it)
+    PROFILE_FILE = 'data/profile.json'
+    PROFILE_TRACE_FILE = 'data/profile_trace.json'
 
-    # --- 2. Load Data ---
-    print("--- Starting Data Loading ---")
-    s1_image, meta = load_geotiff(S1_FILE)
-    s2_image, _ = load_geotiff(S2_FILE)
-    flood_mask, _ = load_geotiff(MASK_FILE)
+    # --- 2. Check Data ---
+    # Only the headers are read here; the pixels are streamed tile by tile below
+    print("--- Checking Data ---")
+    meta = read_geotiff_meta(S1_FILE)
+    s2_meta = read_geotiff_meta(S2_FILE)
+    mask_meta = read_geotiff_meta(MASK_FILE)
 
-    # Basic check to ensure data was loaded and is compatible
-    if s1_image is None or s2_image is None or flood_mask is None:
+    # Basic check to ensure data can be read and is compatible
+    if meta is None or s2_meta is None or mask_meta is None:
         print("Failed to load data. Please check file paths and integrity. Exiting.")
         return
-    if s1_image.shape != flood_mask.shape or s2_image.shape[1:] != flood_mask.shape:
+    shapes = {(m['height'], m['width']) for m in (meta, s2_meta, mask_meta)}
+    if len(shapes) != 1 or mask_meta['count'] != 1:
         print("Image and mask dimensions do not match! Please use co-registered data. Exiting.")
         return
+    s1_bands, s2_bands = required_bands(FEATURES)
+    if (meta['count'] <= max([S1_BAND_INDEX[b] for b in s1_bands], default=-1)
+            or s2_meta['count'] <= max([S2_BAND_INDEX[b] for b in s2_bands], default=-1)):
+        print(f"The input files lack bands needed for the features {FEATURES}. Exiting.")
+        return
+
+    halo = FILTER_SIZE // 2
+    tile_windows = get_tile_windows(S1_FILE, TILE_SIZE, overlap=halo)
+    print(f"Processing {meta['height']}x{meta['width']} scene in {len(tile_windows)} tiles")
 
-    # --- 3. Preprocessing and Feature Engineering ---
+    # --- 3. Preprocessing, Feature Statistics and Training Sample ---
+    # One parallel pass over the scene collects mergeable statistics of every feature,
+    # so all tiles are normalized with the same scene-wide scaling, and draws the training
+    # and hold-out pixels. Normalization is a linear rescale, so the samples can be
+    # normalized afterwards.
     print("\n--- Starting Preprocessing ---")
-    # Process Sentinel-1 data
-    s1_filtered = apply_speckle_filter(s1_image)
-    s1_normalized = normalize_image(s1_filtered)
-    
-    # Process Sentinel-2 data
-    ndwi = calculate_ndwi(s2_image)
-    ndwi_normalized = normalize_image(ndwi)
-    
-    # For this simple project, we'll just use the first 3 bands of S2 for color
-    s2_rgb_normalized = normalize_image(s2_image[:3, :, :])
-
-    # --- 4. Feature Combination ---
-    # Stack all our features into a single array
-    # The shape will be (height, width, num_features)
-    # The order of features is: S1, NDWI, S2_Band1, S2_Band2, S2_Band3
-    print("\n--- Combining Features ---")
-    
-    # Transpose S2 RGB bands to be (height, width, bands)
-    s2_rgb_transposed = np.transpose(s2_rgb_normalized, (1, 2, 0))
-    
-    # Stack features along the last axis (the channel axis)
-    all_features = np.dstack((
-        s1_normalized, 
-        ndwi_normalized,
-        s2_rgb_transposed
-    ))
-    
-    print(f"Final feature array shape: {all_features.shape}")
-
-    # --- 5. Random Forest Model Training and Prediction ---
+    with stage('scan_scene'):
+        stats, train_sampler, holdout_sampler = scan_scene(
+            S1_FILE, S2_FILE, MASK_FILE, tile_windows, FEATURES, FILTER_SIZE, SPECKLE_FILTER,
+            SAMPLES_PER_CLASS, HOLDOUT_BLOCK_SIZE, HOLDOUT_FRACTION, n_workers=N_WORKERS)
+    save_statistics(stats, STATS_FILE)
+    ranges = feature_ranges(stats, CLIP_PERCENTILES)
+    for name, (low, high) in ranges.items():
+        print(f"Feature '{name}': mean {stats[name].mean:.4f}, std {stats[name].std:.4f}, "
+              f"normalized over [{low:.4f}, {high:.4f}]")
+
+    # --- 4. Random Forest Model Training ---
     print("\n--- Starting Random Forest Workflow ---")
-    X, y = prepare_data_for_rf(all_features, flood_mask)
-    
-    # Split data for training and testing to evaluate the model fairly
-    # Using only 10% of pixels for training to speed things up for this example
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.9, random_state=42, stratify=y)
-    
-    rf_model = train_random_forest(X_train, y_train)
-    
-    # Make prediction on the entire image
-    prediction_map = predict_with_rf(rf_model, all_features, flood_mask.shape)
-
-    # --- 6. Evaluation ---
-    print_evaluation_metrics(flood_mask, prediction_map)
-
-    # --- 7. Save the Prediction Map ---
-    print(f"Saving prediction map to {OUTPUT_PREDICTION_FILE}...")
-    # Update metadata for the output file
-    meta.update(dtype=rasterio.uint8, count=1)
-    
-    with rasterio.open(OUTPUT_PREDICTION_FILE, 'w', **meta) as dst:
-        dst.write(prediction_map.astype(rasterio.uint8), 1)
+    engine = FeatureEngine(FEATURES)
+    with stage('sample'):
+        X_train, y_train = train_sampler.sample()
+    with stage('normalize'):
+        engine.normalize(X_train, ranges)
+    print(f"Training sample: {X_train.shape[0]} pixels, {X_train.shape[1]} features "
+          f"(pixels per class available: {train_sampler.seen})")
+
+    with stage('train'):
+        rf_model = train_random_forest(X_train, y_train)
+    del X_train, y_train
+    with stage('write', file=COMPILED_MODEL_DIR):
+        save_compiled_forest(compile_forest(rf_model), COMPILED_MODEL_DIR)
+
+    # Score the model on the held-out blocks it has never seen
+    X_holdout, y_holdout = holdout_sampler.sample()
+    if y_holdout.size:
+        print(f"Hold-out sample: {X_holdout.shape[0]} pixels from held-out blocks")
+        with stage('evaluate', sample='holdout'):
+            print_evaluation_metrics(y_holdout, rf_model.predict(engine.normalize(X_holdout, ranges)))
+    del X_holdout, y_holdout
+
+    # --- 5. Prediction and Evaluation, Tile by Tile ---
+    # Tiles are predicted in parallel and written into the output GeoTIFF as they finish.
+    # Every worker also scores its tile against the mask, and the per-tile confusion
+    # matrices are merged, so the evaluation needs no second pass over the scene.
+    print(f"\n--- Predicting and saving prediction map to {OUTPUT_PREDICTION_FILE} ---")
+    model = COMPILED_MODEL_DIR if PREDICT_WITH_COMPILED else rf_model
+    with stage('predict_scene'):
+        confusion = predict_scene(model, S1_FILE, S2_FILE, OUTPUT_PREDICTION_FILE, meta, tile_windows,
+                                  ranges, FEATURES, FILTER_SIZE, SPECKLE_FILTER, OUTPUT_PROBABILITY,
+                                  n_workers=N_WORKERS, mask_file=MASK_FILE, cog=OUTPUT_COG)
+    confusion.print_report()
+
+    # --- 6. Post-processing ---
+    print(f"\n--- Post-processing the prediction map into {CLEANED_PREDICTION_FILE} ---")
+    with stage('postprocess_scene'):
+        postprocess_scene(OUTPUT_PREDICTION_FILE, CLEANED_PREDICTION_FILE, POLYGONS_FILE,
+                          MORPHOLOGY_RADIUS, min_pixels=MIN_MAPPING_UNIT,
+                          fill_holes_below=MIN_MAPPING_UNIT, probability=OUTPUT_PROBABILITY,
+                          tile_size=TILE_SIZE, n_workers=N_WORKERS)
 
+    # --- 7. Profile ---
+    # Worker stages (load, filter, features, ...) are summed over all tiles and workers
+    print("\n--- Stage profile ---")
+    PROFILER.print_summary()
+    PROFILER.save(PROFILE_FILE)
+    if PROFILE_TRACE_FILE:
+        PROFILER.save_chrome_trace(PROFILE_TRACE_FILE)
     print("\nWorkflow completed successfully!")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,223 @@
+# unet_dataset.py
+
+# Training patches for the U-Net from many co-registered scenes, fed through tf.data.
+# Every scene is cut into patch_size x patch_size patches, grouped into small shards
+# (a run of neighbouring patches from one row of one scene). The first time a shard is
+# needed its features are computed from the GeoTIFFs, normalized and saved as two .npy
+# files; after that the shard is just memory-mapped, so later epochs do no raster
+# decoding, speckle filtering or band math at all.
+# The cache lives in a directory named after a hash of the inputs and settings, so
+# changing the scenes, features, ranges or patch size never reuses stale patches.
+
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+from rasterio.windows import Window
+
+from preprocessing.data_loader import read_geotiff_meta, read_tile
+from preprocessing.features import FeatureEngine
+from pipeline import read_feature_bands, DEFAULT_FEATURES
+from models.unet_inference import patch_origins
+
+# scene: index into the cache's scene list
+# row:   the top row of the shard's patches in the scene
+# cols:  the left column of every patch in the shard
+PatchShard = namedtuple('PatchShard', ['scene', 'row', 'cols'])
+
+
+def _file_signature(filepath):
+    # Path, size and modification time: enough to notice a replaced or rewritten file
+    info = os.stat(filepath)
+    return [os.path.abspath(filepath), info.st_size, int(info.st_mtime)]
+
+
+class PatchCache:
+    """
+    A sharded on-disk cache of normalized training patches from several scenes.
+
+    Args:
+        directory (str): The cache root; the patches go to a subdirectory named after
+            a hash of everything below.
+        scenes (list): (s1_file, s2_file, mask_file) triples of co-registered GeoTIFFs.
+        ranges (dict): Feature name -> (min, max) used to normalize every scene, e.g.
+            from statistics.feature_ranges.
+        features (list, optional): Feature names, see pipeline.DEFAULT_FEATURES. They
+            become the U-Net's input channels, in this order.
+        patch_size (int): The patch height and width.
+        stride (int): Distance between neighbouring patches (< patch_size to overlap).
+        filter_size (int): The size of the speckle filter window.
+        speckle_method (str): The speckle filter, see preprocessing/speckle.py.
+        shard_size (int): Maximum number of patches per shard.
+    """
+
+    def __init__(self, directory, scenes, ranges, features=None, patch_size=256, stride=256,
+                 filter_size=3, speckle_method='median', shard_size=16):
+        self.scenes = [tuple(scene) for scene in scenes]
+        self.features = list(features or DEFAULT_FEATURES)
+        self.ranges = {name: [float(low), float(high)] for name, (low, high) in ranges.items()}
+        self.patch_size = patch_size
+        self.stride = stride
+        self.filter_size = filter_size
+        self.speckle_method = speckle_method
+
+        self.shapes = []
+        self.shards = []
+        for index, (s1_file, _, _) in enumerate(self.scenes):
+            meta = read_geotiff_meta(s1_file)
+            if meta is None:
+                raise ValueError(f"Could not read scene {s1_file}.")
+            height, width = meta['height'], meta['width']
+            self.shapes.append((height, width))
+            if height < patch_size or width < patch_size:
+                print(f"Skipping {s1_file}: {height}x{width} is smaller than one patch.")
+                continue
+            cols = patch_origins(width, patch_size, stride)
+            for row in patch_origins(height, patch_size, stride):
+                for first in range(0, len(cols), shard_size):
+                    self.shards.append(PatchShard(index, row, tuple(cols[first:first + shard_size])))
+
+        settings = {
+            'scenes': [[_file_signature(f) for f in scene] for scene in self.scenes],
+            'features': self.features,
+            'ranges': self.ranges,
+            'patch_size': patch_size,
+            'stride': stride,
+            'filter_size': filter_size,
+            'speckle_method': speckle_method,
+            'shard_size': shard_size,
+        }
+        key = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+        self.directory = os.path.join(directory, key)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'cache.json'), 'w') as f:
+            json.dump(dict(settings, num_shards=len(self.shards), num_patches=self.num_patches), f, indent=2)
+
+    @property
+    def num_patches(self):
+        return sum(len(shard.cols) for shard in self.shards)
+
+    def _paths(self, index):
+        base = os.path.join(self.directory, f'shard-{index:06d}')
+        return base + '.x.npy', base + '.y.npy'
+
+    def is_cached(self, index):
+        # The features file is written last, so its presence means the shard is complete
+        return os.path.exists(self._paths(index)[0])
+
+    def extract_shard(self, index):
+        """
+        Reads and computes the patches of one shard from the GeoTIFFs.
+
+        Returns:
+            tuple: (X, y): (num_patches, patch_size, patch_size, num_features) normalized
+            float32 features and (num_patches, patch_size, patch_size) uint8 labels.
+        """
+        shard = self.shards[index]
+        s1_file, s2_file, mask_file = self.scenes[shard.scene]
+        height, width = self.shapes[shard.scene]
+        size = self.patch_size
+
+        # One read covers all patches of the shard, plus a halo for the speckle filter
+        left = shard.cols[0]
+        window = Window(left, shard.row, shard.cols[-1] + size - left, size)
+        halo = self.filter_size // 2
+        top, bottom = max(0, shard.row - halo), min(height, shard.row + size + halo)
+        read_left, read_right = max(0, left - halo), min(width, left + int(window.width) + halo)
+        read_window = Window(read_left, top, read_right - read_left, bottom - top)
+
+        engine = FeatureEngine(self.features)
+        bands = read_feature_bands(s1_file, s2_file, window, read_window, self.features,
+                                   self.filter_size, self.speckle_method)
+        cube = engine.compute(bands, ranges=self.ranges)
+        labels = read_tile(mask_file, window).data
+
+        X = np.stack([cube[:, col - left:col - left + size] for col in shard.cols])
+        y = np.stack([labels[:, col - left:col - left + size] for col in shard.cols]).astype(np.uint8)
+        return X, y
+
+    def load_shard(self, index, mmap=True):
+        """
+        Returns the (X, y) patches of a shard (see extract_shard), from the cache if it is
+        there, otherwise extracted from the GeoTIFFs and added to the cache.
+        """
+        x_path, y_path = self._paths(index)
+        if self.is_cached(index):
+            mode = 'r' if mmap else None
+            return np.load(x_path, mmap_mode=mode), np.load(y_path, mmap_mode=mode)
+
+        X, y = self.extract_shard(index)
+        # Write under temporary names and rename, so a crash or a concurrent reader
+        # never sees a half written shard
+        suffix = f'.{os.getpid()}-{threading.get_ident()}.tmp'
+        for path, values in ((y_path, y), (x_path, X)):
+            with open(path + suffix, 'wb') as f:
+                np.save(f, values)
+            os.replace(path + suffix, path)
+        return X, y
+
+    def build(self, n_workers=None):
+        """
+        Fills the whole cache ahead of training across a process pool. Optional: the
+        dataset from make_dataset fills it lazily during the first epoch as well.
+        """
+        missing = [index for index in range(len(self.shards)) if not self.is_cached(index)]
+        print(f"Caching {len(missing)} of {len(self.shards)} patch shards in {self.directory}...")
+        with Pool(n_workers or os.cpu_count()) as pool:
+            for done, _ in enumerate(pool.imap_unordered(_build_shard, [(self, i) for i in missing]), 1):
+                if done % 50 == 0 or done == len(missing):
+                    print(f"Cached {done}/{len(missing)} shards")
+
+
+def _build_shard(task):
+    cache, index = task
+    cache.load_shard(index)
+
+
+def make_dataset(cache, batch_size=16, shuffle=True, shuffle_buffer=512, parallel_shards=4, seed=None):
+    """
+    Builds a tf.data pipeline over a PatchCache.
+
+    Shards are loaded by parallel_shards threads at a time (decoded from the GeoTIFFs
+    on first use, memory-mapped afterwards), their patches interleaved, shuffled,
+    batched and prefetched while the model trains on the previous batch.
+
+    Args:
+        cache (PatchCache): The patches to train on.
+        batch_size (int): Number of patches per batch.
+        shuffle (bool): Shuffle the shard order every epoch and the patches in a buffer.
+        shuffle_buffer (int): Number of patches in the shuffle buffer.
+        parallel_shards (int): Number of shards loaded concurrently.
+        seed (int, optional): Seed of the shuffling.
+
+    Returns:
+        tf.data.Dataset: Batches of (features, labels), shapes (batch, patch, patch,
+        num_features) float32 and (batch, patch, patch) uint8, ready for model.fit.
+    """
+    # Only the dataset itself needs TensorFlow; the cache can be built without it
+    import tensorflow as tf
+
+    size, channels = cache.patch_size, len(cache.features)
+
+    def load(index):
+        X, y = cache.load_shard(int(index))
+        return np.ascontiguousarray(X), np.ascontiguousarray(y)
+
+    def shard_patches(index):
+        X, y = tf.numpy_function(load, [index], [tf.float32, tf.uint8])
+        X.set_shape([None, size, size, channels])
+        y.set_shape([None, size, size])
+        return tf.data.Dataset.from_tensor_slices((X, y))
+
+    dataset = tf.data.Dataset.range(len(cache.shards))
+    if shuffle:
+        dataset = dataset.shuffle(len(cache.shards), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(shard_patches, cycle_length=parallel_shards,
+                                 num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
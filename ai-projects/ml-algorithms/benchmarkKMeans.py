@@ -0,0 +1,94 @@
+#Benchmark of the from-scratch K-Means of kmeansclustering.py against scikit-learn
+#Clusters synthetic blobs (1,000,000 points x 32 features by default) with Lloyd's and
+#Hamerly's algorithms, and with scikit-learn's Lloyd and Elkan, each from its own k-means++
+#seeding and then from the seeds of kmeansclustering.py (the same seeds give the same
+#iterations, so those rows compare the speed of the iterations alone). Then mini-batch
+#K-Means: scikit-learn's MiniBatchKMeans on the array in memory against partial_fit on
+#chunks streamed from a .npy file. Inertia is the sum of squared distances of the points to
+#their centroids (lower is better), shown relative to the lowest of all runs.
+#
+#   python benchmarkKMeans.py                                  # 1,000,000 x 32, 64 clusters
+#   python benchmarkKMeans.py --rows 200000 --n-jobs 1         # a quicker run on one thread
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.cluster import KMeans as SklearnKMeans, MiniBatchKMeans
+from sklearn.datasets import make_blobs
+
+from kmeansclustering import KMeans, chunks_from_npy, kmeans_plusplus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the from-scratch K-Means against scikit-learn.")
+    parser.add_argument('--rows', type=int, default=1000000, help="Points of the synthetic dataset.")
+    parser.add_argument('--features', type=int, default=32, help="Features of the synthetic dataset.")
+    parser.add_argument('--clusters', type=int, default=64, help="Clusters to find.")
+    parser.add_argument('--batch-size', type=int, default=1024, help="Points per mini-batch step.")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="Threads of the from-scratch K-Means (default: all cores).")
+    args = parser.parse_args()
+
+    # Overlapping blobs, so the centroids take a while to settle
+    X, _ = make_blobs(n_samples=args.rows, n_features=args.features, centers=args.clusters, cluster_std=4.0,
+                      random_state=0)
+    print(f"{args.rows} x {args.features} points, {args.clusters} clusters, {os.cpu_count()} CPU cores")
+
+    start = time.perf_counter()
+    seeds = kmeans_plusplus(X, args.clusters, np.random.default_rng(0))
+    print(f"k-means++ seeding: {time.perf_counter() - start:.2f}s (included in the KMeans times)")
+
+    results = {}
+    runs = {
+        'scikit-learn lloyd': lambda: SklearnKMeans(args.clusters, algorithm='lloyd', n_init=1, random_state=0),
+        'scikit-learn elkan': lambda: SklearnKMeans(args.clusters, algorithm='elkan', n_init=1, random_state=0),
+        'scikit-learn lloyd, same seeds': lambda: SklearnKMeans(args.clusters, init=seeds, algorithm='lloyd',
+                                                                n_init=1),
+        'scikit-learn elkan, same seeds': lambda: SklearnKMeans(args.clusters, init=seeds, algorithm='elkan',
+                                                                n_init=1),
+        'KMeans lloyd': lambda: KMeans(args.clusters, 'lloyd', n_jobs=args.n_jobs, random_state=0),
+        'KMeans hamerly': lambda: KMeans(args.clusters, 'hamerly', n_jobs=args.n_jobs, random_state=0),
+        'KMeans hamerly, 1 thread': lambda: KMeans(args.clusters, 'hamerly', n_jobs=1, random_state=0),
+    }
+    for name, make_model in runs.items():
+        model = make_model()
+        start = time.perf_counter()
+        model.fit(X)
+        seconds = time.perf_counter() - start
+        if isinstance(model, KMeans):
+            results[name] = (seconds, model.n_iter, model.inertia)
+        else:
+            results[name] = (seconds, model.n_iter_, model.inertia_)
+
+    # Mini-batches: scikit-learn on the array in memory, partial_fit on chunks from disk
+    model = MiniBatchKMeans(args.clusters, batch_size=args.batch_size, n_init=1, random_state=0)
+    start = time.perf_counter()
+    model.fit(X)
+    seconds = time.perf_counter() - start
+    results['scikit-learn MiniBatchKMeans'] = (seconds, model.n_steps_, model.inertia_)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'X.npy')
+        np.save(path, X)
+        model = KMeans(args.clusters, batch_size=args.batch_size, n_jobs=args.n_jobs, random_state=0)
+        start = time.perf_counter()
+        while model.centers is None or not model.converged and model.n_epochs < 20:
+            model.partial_fit(chunks_from_npy(path, chunk_rows=100000))
+        seconds = time.perf_counter() - start
+        # The inertia of the final centroids, like scikit-learn reports
+        labels = model.predict(np.load(path, mmap_mode='r'))
+        inertia = ((X - model.centers[labels]) ** 2).sum()
+        results[f'KMeans partial_fit from disk ({model.n_epochs} epochs)'] = (
+            seconds, model.n_epochs * -(-args.rows // args.batch_size), inertia)
+
+    best = min(inertia for _, _, inertia in results.values())
+    print(f"{'method':<44}{'seconds':>10}{'iterations':>12}{'inertia / best':>16}")
+    for name, (seconds, iterations, inertia) in results.items():
+        print(f"{name:<44}{seconds:>10.2f}{iterations:>12}{inertia / best:>16.4f}")
+    print("(mini-batch iterations are batches)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#Benchmark of the from-scratch PCA of pcaalgorithm.py on data that is read from disk
+#Writes a synthetic low-rank dataset plus noise (1,000,000 rows x 256 features by default)
+#to a .npy file and finds its top components with the covariance, randomized and
+#incremental solvers, reading the file as a memory-mapped array. The covariance is also
+#summed in several processes and merged, and scikit-learn's IncrementalPCA and randomized
+#PCA run on the same file. Every result is scored by the share of the variance along the
+#exact top components that its components miss (0 for the exact components). Last, the
+#rows are projected into a second memory-mapped file.
+#
+#   python benchmarkPCA.py                                 # 1,000,000 x 256
+#   python benchmarkPCA.py --rows 200000 --features 100    # a quicker run
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from sklearn.decomposition import PCA as SklearnPCA, IncrementalPCA
+
+from pcaalgorithm import PCA, CovarianceAccumulator, BLOCK_ROWS
+
+# scikit-learn's PCA copies the data into memory (and centers a second copy), so it only
+# runs on files up to this size
+SKLEARN_PCA_MAX_BYTES = 2 ** 30
+
+
+def write_dataset(path, n_rows, n_features, rank=20, seed=0):
+    # Rows = random mixes of rank directions with decaying scales, plus noise. Written
+    # block by block, so the dataset never has to fit in memory.
+    rng = np.random.default_rng(seed)
+    directions = rng.standard_normal((rank, n_features)) * np.geomspace(10, 0.5, rank)[:, None]
+    offset = rng.normal(0, 5, n_features)
+    X = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n_rows, n_features))
+    for start in range(0, n_rows, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n_rows)
+        X[start:stop] = rng.standard_normal((stop - start, rank)) @ directions + offset
+        X[start:stop] += rng.standard_normal((stop - start, n_features))
+    X.flush()
+
+
+def accumulate_rows(task):
+    # Worker process: the covariance sums of a range of rows of the file
+    path, start, stop = task
+    X = np.load(path, mmap_mode='r')
+    return CovarianceAccumulator(X.shape[1]).update(X[start:stop])
+
+
+def missed_variance(components, covariance, best):
+    # 1 - the variance along the components / the variance along the exact top components
+    # (rounding can make it slightly negative)
+    return max(1 - np.einsum('ij,jk,ik->', components, covariance, components) / best, 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the from-scratch PCA on a memory-mapped dataset.")
+    parser.add_argument('--rows', type=int, default=1000000, help="Rows of the synthetic dataset.")
+    parser.add_argument('--features', type=int, default=256, help="Features of the synthetic dataset.")
+    parser.add_argument('--components', type=int, default=10, help="Components to find.")
+    parser.add_argument('--chunk-rows', type=int, default=10000, help="Rows per chunk of incremental PCA.")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help="Processes of the merged covariance (default: all cores).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'X.npy')
+        start = time.perf_counter()
+        write_dataset(path, args.rows, args.features)
+        print(f"{args.rows} x {args.features} rows ({os.path.getsize(path) / 2 ** 30:.2f} GB) written in "
+              f"{time.perf_counter() - start:.1f}s, {args.components} components, {os.cpu_count()} CPU cores")
+        X = np.load(path, mmap_mode='r')
+        results = {}
+
+        start = time.perf_counter()
+        accumulator = CovarianceAccumulator(args.features).update(X)
+        exact = PCA(args.components).fit_covariance(accumulator)
+        results['PCA covariance'] = (time.perf_counter() - start, exact.components)
+        covariance = accumulator.covariance
+        best = exact.explained_variance.sum()
+
+        for n_power_iterations in (2, 4):
+            model = PCA(args.components, 'randomized', n_power_iterations=n_power_iterations, random_state=0).fit(X)
+            results[f'PCA randomized, {n_power_iterations} power iterations'] = (model.fit_time, model.components)
+
+        start = time.perf_counter()
+        model = PCA(args.components).partial_fit(X[row:row + args.chunk_rows]
+                                                 for row in range(0, args.rows, args.chunk_rows))
+        results[f'PCA partial_fit, {args.chunk_rows} rows per chunk'] = (time.perf_counter() - start, model.components)
+
+        # Every process sums the covariance of its share of the rows; the main process merges them
+        start = time.perf_counter()
+        bounds = np.linspace(0, args.rows, args.processes + 1).astype(int)
+        with Pool(args.processes) as pool:
+            parts = pool.map(accumulate_rows, [(path, bounds[i], bounds[i + 1]) for i in range(args.processes)])
+        merged = parts[0]
+        for part in parts[1:]:
+            merged.merge(part)
+        model = PCA(args.components).fit_covariance(merged)
+        results[f'PCA covariance, merged from {args.processes} processes'] = (time.perf_counter() - start,
+                                                                             model.components)
+
+        start = time.perf_counter()
+        model = IncrementalPCA(args.components, batch_size=args.chunk_rows).fit(X)
+        results[f'scikit-learn IncrementalPCA, {args.chunk_rows} rows'] = (time.perf_counter() - start,
+                                                                          model.components_)
+        if os.path.getsize(path) <= SKLEARN_PCA_MAX_BYTES:
+            start = time.perf_counter()
+            model = SklearnPCA(args.components, svd_solver='randomized', random_state=0).fit(X)
+            results['scikit-learn PCA randomized'] = (time.perf_counter() - start, model.components_)
+        else:
+            print(f"(scikit-learn's PCA skipped: it needs the whole {os.path.getsize(path) / 2 ** 30:.2f} GB "
+                  f"twice in memory)")
+
+        print(f"{'method':<52}{'seconds':>10}{'missed variance':>18}")
+        for name, (seconds, components) in results.items():
+            print(f"{name:<52}{seconds:>10.2f}{missed_variance(components, covariance, best):>18.1e}")
+
+        # Projection from one memory-mapped file into another
+        out = np.lib.format.open_memmap(os.path.join(directory, 'X_reduced.npy'), mode='w+', dtype=np.float64,
+                                        shape=(args.rows, args.components))
+        start = time.perf_counter()
+        exact.transform(X, out=out)
+        out.flush()
+        print(f"\ntransform of the memory-mapped rows into a memory-mapped file: {time.perf_counter() - start:.2f}s")
+        del X, out
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#Convergence benchmark of the gradient descent regressions
+#Compares the original fixed-step loops of linearRegression.py and logisticRegression.py with
+#the estimators of gradientDescent.py: plain, momentum and Adam steps, full-batch and in
+#mini-batches, each stopped early once the loss no longer improves. Every run is timed
+#until its loss is within 0.1% of the best loss possible (the closed-form least squares
+#solution, or scikit-learn's unregularized fit for logistic regression). Then the
+#closed-form (normal equations, Cholesky, QR) and IRLS solvers are timed on the same data,
+#with the solver 'auto' picks. Last, one training epoch over --epoch-rows rows with the fused,
+#in-place loss and gradient of logisticRegression.py against the original formulas, which
+#allocate new arrays every step.
+#
+#   python benchmarkRegression.py                                       # toy data, 1,000,000 x 20 and 10,000,000 x 20 rows
+#   python benchmarkRegression.py --rows 200000 --epoch-rows 1000000    # a quicker run
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression as SklearnLogisticRegression
+
+import linearRegression
+import logisticRegression
+from linearRegression import LinearRegression
+from logisticRegression import LogisticRegression
+
+RELATIVE_TOLERANCE = 1e-3
+
+
+def best_loss(kind, X, y):
+    X = X.reshape(-1, 1) if X.ndim == 1 else X
+    if kind == 'linear':
+        design = np.column_stack([X, np.ones(len(X))])
+        params = np.linalg.lstsq(design, y, rcond=None)[0]
+        return np.mean((design @ params - y) ** 2)
+    reference = SklearnLogisticRegression(C=np.inf, tol=1e-10, max_iter=10000).fit(X, y)
+    p = np.clip(reference.predict_proba(X)[:, 1], 1e-15, 1 - 1e-15)
+    return -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))
+
+
+def model_loss(kind, X, y, weights, bias):
+    X = X.reshape(-1, 1) if X.ndim == 1 else X
+    if kind == 'linear':
+        return np.mean((X @ weights + bias - y) ** 2)
+    p = np.clip(logisticRegression.sigmoid(X @ weights + bias), 1e-15, 1 - 1e-15)
+    return -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))
+
+
+def run_estimator(model, X, y, target):
+    # One epoch per partial_fit call, so the time to reach the target loss can be read off
+    seconds, time_to_target = 0.0, None
+    while model.params is None or not model.converged and model.n_epochs < model.max_epochs:
+        start = time.perf_counter()
+        model.partial_fit([(X, y)])
+        seconds += time.perf_counter() - start
+        if time_to_target is None and model.losses[-1] <= target:
+            time_to_target = seconds
+    return seconds, time_to_target
+
+
+def print_row(name, epochs, seconds, gap, time_to_target):
+    reached = '-' if time_to_target is None else f'{time_to_target:.3f}'
+    print(f"{name:<34}{epochs:>8}{seconds:>10.3f}{gap:>14.2e}{reached:>14}")
+
+
+def compare(kind, X, y, runs, legacy=None):
+    optimum = best_loss(kind, X, y)
+    target = optimum * (1 + RELATIVE_TOLERANCE)
+    print(f"{'method':<34}{'epochs':>8}{'seconds':>10}{'loss - best':>14}{'to 0.1% s':>14}")
+    if legacy is not None:
+        iterations, run = legacy
+        start = time.perf_counter()
+        weights, bias = run()
+        seconds = time.perf_counter() - start
+        gap = model_loss(kind, X, y, np.atleast_1d(weights), bias) - optimum
+        print_row("original loop", iterations, seconds, gap, seconds if gap <= target - optimum else None)
+    for name, model in runs.items():
+        seconds, time_to_target = run_estimator(model, X, y, target)
+        gap = model_loss(kind, X, y, model.weights, model.bias) - optimum
+        print_row(name, model.n_epochs, seconds, gap, time_to_target)
+
+
+def compare_solvers(kind, X, y, models):
+    optimum = best_loss(kind, X, y)
+    print(f"{'solver':<34}{'iterations':>11}{'seconds':>10}{'loss - best':>14}")
+    for model in models:
+        model.fit(X, y)
+        name = model.solver if model.solver_used == model.solver else f"{model.solver} ({model.solver_used})"
+        gap = model_loss(kind, X, y, model.weights, model.bias) - optimum
+        print(f"{name:<34}{model.n_iter:>11}{model.fit_time:>10.3f}{gap:>14.2e}")
+
+
+class UnfusedLogisticRegression(LogisticRegression):
+    """LogisticRegression with the loss and gradient written like the original loop."""
+
+    def _loss_gradient(self, X, y, gradient):
+        n = len(y)
+        y_predicted = 1 / (1 + np.exp(-(X @ self.weights + self.bias)))
+        error = y_predicted - y
+        gradient[:-1] = np.dot(X.T, error) / n
+        gradient[-1] = error.mean()
+        y_predicted = np.clip(y_predicted, 1e-15, 1 - 1e-15)
+        return -np.mean(y * np.log(y_predicted) + (1 - y) * np.log(1 - y_predicted))
+
+
+def time_epoch(model, X, y):
+    # The seconds of one epoch, and the most memory it allocated on top of the first
+    # epoch's buffers. The peak is measured in a second epoch, as tracemalloc slows
+    # allocations down.
+    model._start(X.shape[1])
+    model._epoch(X, y)
+    start = time.perf_counter()
+    loss = model._epoch(X, y)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    model._epoch(X, y)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, loss
+
+
+def chunks_from_disk(X_path, y_path, chunk_rows):
+    # Reads the rows chunk by chunk from .npy files, like data that does not fit in memory
+    X, y = np.load(X_path, mmap_mode='r'), np.load(y_path, mmap_mode='r')
+    for start in range(0, len(y), chunk_rows):
+        yield X[start:start + chunk_rows], y[start:start + chunk_rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gradient descent regressions.")
+    parser.add_argument('--rows', type=int, default=1000000, help="Rows of the large synthetic datasets.")
+    parser.add_argument('--features', type=int, default=20, help="Features of the large synthetic datasets.")
+    parser.add_argument('--batch-size', type=int, default=1024, help="Rows per mini-batch step.")
+    parser.add_argument('--epoch-rows', type=int, default=10000000,
+                        help="Rows of the dataset of the allocation benchmark.")
+    args = parser.parse_args()
+
+    # Full-batch steps, with enough patience for momentum's overshoots on tiny data
+    toy = dict(max_epochs=100000, tol=1e-9, n_iter_no_change=50)
+    print("Linear regression, the 5 point dataset of linearRegression.py")
+    compare('linear', linearRegression.X.astype(float), linearRegression.y.astype(float), {
+        'sgd': LinearRegression('sgd', 0.05, **toy),
+        'momentum': LinearRegression('momentum', 0.01, **toy),
+        'adam': LinearRegression('adam', 0.5, **toy),
+    }, legacy=(1000, lambda: linearRegression.simple_gradient_descent(
+        linearRegression.X, linearRegression.y, 0.01, 1000, verbose=False)))
+
+    print("\nLogistic regression, the 20 point dataset of logisticRegression.py")
+    compare('logistic', logisticRegression.X, logisticRegression.y.astype(float), {
+        'sgd': LogisticRegression('sgd', 0.5, **toy),
+        'momentum': LogisticRegression('momentum', 0.3, **toy),
+        'adam': LogisticRegression('adam', 0.1, **toy),
+    }, legacy=(10000, lambda: logisticRegression.simple_gradient_descent(
+        logisticRegression.X, logisticRegression.y, 0.01, 10000)))
+
+    # Large datasets: the original rule on all rows (what the loops do, with a matrix)
+    # against mini-batches
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((args.rows, args.features))
+    true_weights = rng.standard_normal(args.features)
+    linear_y = X @ true_weights + 0.5 + rng.normal(0, 1, args.rows)
+    logistic_y = (rng.random(args.rows) < 1 / (1 + np.exp(-(X @ true_weights)))).astype(float)
+    # Mini-batch losses are noisy, so an epoch has to improve by more than that noise
+    batch = dict(batch_size=args.batch_size, max_epochs=100, tol=1e-4, n_iter_no_change=3, random_state=0)
+    # Learning rates of: all rows sgd, mini-batch sgd, momentum, adam
+    learning_rates = {'linear': (0.1, 0.01, 0.001, 0.003), 'logistic': (1.0, 0.3, 0.03, 0.003)}
+    for kind, y, model_class in (('linear', linear_y, LinearRegression), ('logistic', logistic_y, LogisticRegression)):
+        print(f"\n{kind.capitalize()} regression, {args.rows} x {args.features} rows")
+        full_rate, sgd_rate, momentum_rate, adam_rate = learning_rates[kind]
+        compare(kind, X, y, {
+            'sgd, all rows per step': model_class('sgd', full_rate, max_epochs=1000, tol=1e-9, n_iter_no_change=10),
+            f'sgd, {args.batch_size} rows per step': model_class('sgd', sgd_rate, **batch),
+            f'momentum, {args.batch_size} rows per step': model_class('momentum', momentum_rate, **batch),
+            f'adam, {args.batch_size} rows per step': model_class('adam', adam_rate, **batch),
+        })
+
+        if kind == 'linear':
+            solvers = [LinearRegression(solver=solver) for solver in ('normal', 'cholesky', 'qr', 'auto')]
+        else:
+            solvers = [LogisticRegression(solver=solver, tol=1e-9) for solver in ('irls', 'auto')]
+        compare_solvers(kind, X, y, solvers)
+
+    # partial_fit on chunks read from disk
+    with tempfile.TemporaryDirectory() as directory:
+        X_path, y_path = os.path.join(directory, 'X.npy'), os.path.join(directory, 'y.npy')
+        np.save(X_path, X)
+        np.save(y_path, logistic_y)
+        model = LogisticRegression('momentum', 0.03, batch_size=args.batch_size, tol=1e-4, n_iter_no_change=3,
+                                   random_state=0)
+        start = time.perf_counter()
+        while model.params is None or not model.converged and model.n_epochs < model.max_epochs:
+            model.partial_fit(chunks_from_disk(X_path, y_path, chunk_rows=100000))
+        print(f"\nLogistic regression with partial_fit on 100000 row chunks from disk: {model.n_epochs} epochs "
+              f"in {time.perf_counter() - start:.2f}s, log loss {model.losses[-1]:.4f}")
+
+    # One epoch of the fused kernel against the original formulas
+    del X, linear_y, logistic_y
+    X = rng.standard_normal((args.epoch_rows, args.features))
+    logistic_y = (rng.random(args.epoch_rows) < logisticRegression.sigmoid(X @ true_weights)).astype(float)
+    print(f"\nOne logistic regression epoch over {args.epoch_rows} x {args.features} rows")
+    print(f"{'kernel':<34}{'seconds':>10}{'peak MB':>10}{'log loss':>12}")
+    for name, batch_size in (('all rows per step', None), (f'{args.batch_size} rows per step', args.batch_size)):
+        for kernel, model_class in (('original', UnfusedLogisticRegression), ('fused', LogisticRegression)):
+            model = model_class('sgd', 0.1, batch_size=batch_size, random_state=0, solver='gd')
+            seconds, peak, loss = time_epoch(model, X, logistic_y)
+            print(f"{f'{kernel}, {name}':<34}{seconds:>10.3f}{peak / 2**20:>10.2f}{loss:>12.6f}")
+
+    # The original sigmoid overflows where the logits are far below 0
+    z = np.array([-1000.0, -30.0, 0.0, 30.0, 1000.0])
+    with np.errstate(over='raise'):
+        try:
+            1 / (1 + np.exp(-z))
+            overflow = "no overflow"
+        except FloatingPointError:
+            overflow = "overflows"
+    probabilities = ', '.join(f'{p:.3g}' for p in logisticRegression.sigmoid(z))
+    print(f"\nsigmoid of {z}: 1 / (1 + exp(-z)) {overflow}, the stable sigmoid gives [{probabilities}]")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@ import pandas as pd
 
 # The core data structure for tree
 class Node:
+    # No per-object __dict__: a deep tree has many nodes
+    __slots__ = ('feature_index', 'threshold', 'left', 'right', 'value')
+
     def __init__(self, feature_index=None, threshold=None, left=None, right=None, value=None):
         # For a decision node
         self.feature_index = feature_index # The feature to split on
@@ -13,28 +16,198 @@ class Node:
         # For a leaf node
         self.value = value                 # The final prediction (e.g., 0 or 1)
 
+# With split_method='auto', data up to this many rows uses the exact splits
+EXACT_MAX_SAMPLES = 10000
+# The histogram quantiles are estimated from at most this many rows
+HISTOGRAM_SAMPLE_SIZE = 200000
+# predict() moves this many rows down the tree at a time
+PREDICT_CHUNK_ROWS = 16384
+
+# Number of equal-width cells of the lookup table in _find_bins
+LOOKUP_CELLS = 65536
+
+def _find_bins(values, edges):
+    # The same as np.searchsorted(edges, values), but faster on unsorted values:
+    # a lookup table over equal-width cells between the first and last edge gives the
+    # bin of every value directly, except in the few cells that contain an edge
+    if edges[-1] == edges[0]:
+        return (values > edges[0]).astype(np.uint16)
+    scale = (LOOKUP_CELLS - 1) / float(edges[-1] - edges[0])
+
+    def cell(x):
+        # Values outside the edges go to the extra cells 0 and LOOKUP_CELLS + 1. In
+        # float, as unsigned integers below edges[0] would wrap around to huge values.
+        position = (np.asarray(x, dtype=np.float64) - edges[0]) * scale
+        np.clip(position, -1, LOOKUP_CELLS, out=position)
+        return position.astype(np.int32) + 1
+
+    # Cells are monotonic in the value, so every edge in an earlier cell is below the
+    # value and every edge in a later cell above it
+    edge_cells = cell(edges)
+    bins_before = np.searchsorted(edge_cells, np.arange(LOOKUP_CELLS + 2), side='left').astype(np.uint16)
+    has_edge = np.zeros(LOOKUP_CELLS + 2, dtype=bool)
+    has_edge[edge_cells] = True
+
+    cells = cell(values)
+    bins = bins_before[cells]
+    unsure = np.flatnonzero(has_edge[cells])
+    bins[unsure] = np.searchsorted(edges, values[unsure])
+    return bins
+
+def bin_features(X, n_bins=256):
+    # The candidate thresholds of every feature are up to n_bins - 1 of its quantiles
+    # (or all its values, if it has fewer). Every value is replaced by its bin: the
+    # number of thresholds below it. So "value <= thresholds[j]" is "bin <= j".
+    # Returns the (n_features, n_samples) bins and the thresholds of every feature.
+    n_samples, n_features = X.shape
+    sample = X
+    if n_samples > HISTOGRAM_SAMPLE_SIZE:
+        rng = np.random.default_rng(0)
+        sample = X[rng.choice(n_samples, HISTOGRAM_SAMPLE_SIZE, replace=False)]
+    levels = np.linspace(0, 1, n_bins + 1)[1:-1]
+
+    binned = np.empty((n_features, n_samples), dtype=np.uint8 if n_bins <= 256 else np.uint16)
+    bin_edges = []
+    for feature_index in range(n_features):
+        values = np.sort(sample[:, feature_index])
+        if np.count_nonzero(values[1:] != values[:-1]) >= n_bins - 1:
+            # Like np.quantile(..., method='lower'): thresholds stay values of the data
+            values = values[np.floor(levels * (len(values) - 1)).astype(np.intp)]
+        edges = np.unique(values)
+        bin_edges.append(edges)
+        binned[feature_index] = _find_bins(X[:, feature_index], edges)
+    return binned, bin_edges
+
 class DecisionTreeClassifier:
-    def __init__(self, max_depth=5):
+    def __init__(self, max_depth=5, split_method='auto', n_bins=256, max_features=None, random_state=None):
         self.max_depth = max_depth # The maximum depth of the tree to prevent overfitting
         self.root = None           # The root node of the tree
 
+        # How the best split of a node is found:
+        # 'exact'     tries every unique value of every feature as a threshold
+        # 'histogram' sorts every feature into n_bins quantile bins once, before training,
+        #             and only tries the bin edges. Much faster on large data.
+        # 'auto'      exact up to EXACT_MAX_SAMPLES rows, histogram above
+        self.split_method = split_method
+        self.n_bins = n_bins
+
+        # Every node only considers a random subset of this many features: an int, a
+        # fraction, 'sqrt' or 'log2' of the number of features, or None for all of them.
+        # This is what makes the trees of a random forest differ from each other.
+        self.max_features = max_features
+        self.random_state = random_state
+
     def fit(self, X, y):
-        # We start building the tree from the root
-        self.root = self._build_tree(X, y, 0)
+        X = np.asarray(X)
+        # Work with class indices 0, 1, ... so class counts are a simple bincount
+        self.classes, y = np.unique(y, return_inverse=True)
+
+        method = self.split_method
+        if method == 'auto':
+            method = 'exact' if X.shape[0] <= EXACT_MAX_SAMPLES else 'histogram'
+        if method == 'exact':
+            self._start(X.shape[1])
+            # We start building the tree from the root
+            self.root = self._build_tree(X, y, 0)
+            self._compile()
+        elif method == 'histogram':
+            binned, bin_edges = bin_features(X, self.n_bins)
+            self.fit_binned(binned, bin_edges, y, self.classes)
+        else:
+            raise ValueError(f"Unknown split_method '{self.split_method}', use 'exact', 'histogram' or 'auto'.")
+
+    def fit_binned(self, binned, bin_edges, y, classes, rows=None):
+        # Histogram mode training on features already binned by bin_features, e.g. once
+        # for all trees of a forest. y holds class indices into classes. rows picks the
+        # training rows and may repeat them (a bootstrap sample); None uses all of them.
+        self.classes, self.bin_edges = classes, bin_edges
+        self._start(binned.shape[0])
+        if rows is None:
+            rows = np.arange(binned.shape[1])
+        # With feature subsampling every node counts its own features instead
+        histogram = None if self._features_per_node < binned.shape[0] else self._histogram(binned, y, rows)
+        self.root = self._build_histogram_tree(binned, y, rows, histogram, 0)
+        self._compile()
+
+    def _start(self, n_features):
+        self._rng = np.random.default_rng(self.random_state)
+        if self.max_features is None:
+            self._features_per_node = n_features
+        elif self.max_features == 'sqrt':
+            self._features_per_node = max(1, int(np.sqrt(n_features)))
+        elif self.max_features == 'log2':
+            self._features_per_node = max(1, int(np.log2(n_features)))
+        elif isinstance(self.max_features, float):
+            self._features_per_node = max(1, int(self.max_features * n_features))
+        else:
+            self._features_per_node = min(n_features, self.max_features)
+
+    def _node_features(self, n_features):
+        # The features one node may split on, in increasing order
+        if self._features_per_node >= n_features:
+            return np.arange(n_features)
+        return np.sort(self._rng.choice(n_features, self._features_per_node, replace=False))
 
     def predict(self, X):
-        # Iterate through each data point and make a prediction
-        return [self._predict(inputs) for inputs in X]
-
-    def _predict(self, inputs):
-        # Walk down the tree until we reach a leaf node
-        node = self.root
-        while node.value is None:
-            if inputs[node.feature_index] <= node.threshold:
-                node = node.left
+        # Every row walks down the tree until it reaches a leaf node. All rows take one
+        # step at a time together, so a tree of depth d needs d vectorized steps.
+        return self._walk(np.asarray(X), self.thresholds)
+
+    def predict_binned(self, binned_rows):
+        # Like predict, for (n_samples, n_features) rows of bins made with the bin_edges
+        # the tree was fitted on (see fit_binned). The thresholds are bin edges, and
+        # "value <= edges[j]" is "bin <= j", so they become bin numbers.
+        bin_thresholds = np.array([np.searchsorted(self.bin_edges[feature_index], threshold)
+                                   for feature_index, threshold in zip(self.features, self.thresholds)])
+        return self._walk(binned_rows, bin_thresholds)
+
+    def _walk(self, X, thresholds):
+        n_samples, n_features = X.shape
+        predictions = np.empty(n_samples, dtype=self.leaf_values.dtype)
+        for start in range(0, n_samples, PREDICT_CHUNK_ROWS):
+            rows = np.ascontiguousarray(X[start:start + PREDICT_CHUNK_ROWS])
+            # Where every row starts in the flattened chunk
+            row_starts = np.arange(rows.shape[0]) * n_features
+            nodes = np.zeros(rows.shape[0], dtype=np.intp)
+            for _ in range(self.depth):
+                values = rows.ravel()[row_starts + self.features[nodes]]
+                goes_left = values <= thresholds[nodes]
+                nodes = self.children[2 * nodes + goes_left]
+            predictions[start:start + PREDICT_CHUNK_ROWS] = self.leaf_values[nodes]
+        return predictions
+
+    def _compile(self):
+        # Stores the tree as parallel arrays, one entry per node (the root is node 0):
+        # the feature and threshold it splits on, its left and right child, and for
+        # leaves the predicted class. Leaves point to themselves, so rows that reach a
+        # leaf early just stay there while the others keep walking.
+        features, thresholds, lefts, rights, leaf_values = [], [], [], [], []
+        nodes, depths = [self.root], [0]
+        # The list grows while we go through it, so the nodes are numbered breadth first
+        for number, node in enumerate(nodes):
+            if node.value is not None:
+                features.append(0)
+                thresholds.append(0.0)
+                lefts.append(number)
+                rights.append(number)
+                leaf_values.append(node.value)
             else:
-                node = node.right
-        return node.value
+                features.append(node.feature_index)
+                thresholds.append(node.threshold)
+                lefts.append(len(nodes))
+                rights.append(len(nodes) + 1)
+                leaf_values.append(self.classes[0])
+                nodes += [node.left, node.right]
+                depths += [depths[number] + 1] * 2
+        self.depth = max(depths)
+        self.features = np.array(features, dtype=np.intp)
+        self.thresholds = np.array(thresholds, dtype=np.float64)
+        self.lefts = np.array(lefts, dtype=np.intp)
+        self.rights = np.array(rights, dtype=np.intp)
+        self.leaf_values = np.array(leaf_values, dtype=self.classes.dtype)
+        # Both children of every node side by side: node n goes to children[2 * n + 1]
+        # if the row goes left, else to children[2 * n]
+        self.children = np.column_stack((self.rights, self.lefts)).ravel()
 
     def _build_tree(self, X, y, current_depth):
         n_samples, n_features = X.shape
@@ -52,7 +225,7 @@ class DecisionTreeClassifier:
         best_split = self._find_best_split(X, y)
         
         # If no split improves the Gini impurity, we stop here
-        if best_split is None or best_split['gini_gain'] == 0:
+        if best_split is None or best_split['gini_gain'] <= 0:
             leaf_value = self._most_common_label(y)
             return Node(value=leaf_value)
 
@@ -68,75 +241,146 @@ class DecisionTreeClassifier:
     def _find_best_split(self, X, y):
         best_split = None
         best_gini_gain = -1
+        total_counts = np.bincount(y, minlength=len(self.classes))
 
-        for feature_index in range(X.shape[1]):
-            thresholds = np.unique(X[:, feature_index])
-            for threshold in thresholds:
-                # Split the data based on the current feature and threshold
-                left_indices = np.where(X[:, feature_index] <= threshold)[0]
-                right_indices = np.where(X[:, feature_index] > threshold)[0]
-                
-                # We can't split if one side is empty
-                if len(left_indices) == 0 or len(right_indices) == 0:
-                    continue
-
-                # Calculate Gini Impurity for the split
-                current_gini = self._gini_impurity(y)
-                gini_gain = current_gini - self._weighted_gini_impurity(y[left_indices], y[right_indices])
-
-                if gini_gain > best_gini_gain:
-                    best_gini_gain = gini_gain
-                    best_split = {
-                        'feature_index': feature_index,
-                        'threshold': threshold,
-                        'left_indices': left_indices,
-                        'right_indices': right_indices,
-                        'gini_gain': gini_gain
-                    }
+        for feature_index in self._node_features(X.shape[1]):
+            # Sorting the feature once gives the class counts left of every threshold
+            # as a running sum, instead of splitting the data again for each threshold
+            order = np.argsort(X[:, feature_index], kind='stable')
+            values = X[order, feature_index]
+            one_hot = np.eye(len(self.classes), dtype=np.int64)[y[order]]
+            left_counts = np.cumsum(one_hot, axis=0)
+
+            # Every unique value is a threshold: split after the last sample of each run
+            # of equal values (the largest value would leave the right side empty)
+            ends = np.flatnonzero(values[1:] != values[:-1])
+            if len(ends) == 0:
+                continue
+            gini_gains = self._gini_gains(left_counts[ends], total_counts)
+            best = np.argmax(gini_gains)
+
+            if gini_gains[best] > best_gini_gain:
+                best_gini_gain = gini_gains[best]
+                threshold = values[ends[best]]
+                best_split = {
+                    'feature_index': feature_index,
+                    'threshold': threshold,
+                    'left_indices': np.where(X[:, feature_index] <= threshold)[0],
+                    'right_indices': np.where(X[:, feature_index] > threshold)[0],
+                    'gini_gain': gini_gains[best]
+                }
         return best_split
 
-    def _gini_impurity(self, y):
+    def _gini_gains(self, left_counts, total_counts):
+        # Gini gain of many candidate splits at once, from the class counts on their left
+        # side (shape (..., n_classes)) and the class counts of the whole node
+        right_counts = total_counts - left_counts
+        n_left = left_counts.sum(axis=-1, keepdims=True)
+        n_right = right_counts.sum(axis=-1, keepdims=True)
+        total_samples = total_counts.sum()
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gini_left = 1 - np.sum((left_counts / n_left)**2, axis=-1)
+            gini_right = 1 - np.sum((right_counts / n_right)**2, axis=-1)
+        weighted_gini = (n_left[..., 0] / total_samples) * gini_left + (n_right[..., 0] / total_samples) * gini_right
+        gini_gains = self._gini_from_counts(total_counts) - weighted_gini
+
+        # We can't split if one side is empty
+        gini_gains[(n_left[..., 0] == 0) | (n_right[..., 0] == 0)] = -np.inf
+        return gini_gains
+
+    def _gini_from_counts(self, counts):
         # Gini Impurity: a measure of how "mixed" the labels are
+        probabilities = counts / counts.sum()
+        return 1 - np.sum(probabilities**2)
+
+    def _gini_impurity(self, y):
         _, counts = np.unique(y, return_counts=True)
-        probabilities = counts / len(y)
-        gini = 1 - np.sum(probabilities**2)
-        return gini
-
-    def _weighted_gini_impurity(self, y_left, y_right):
-        n_left = len(y_left)
-        n_right = len(y_right)
-        total_samples = n_left + n_right
-        
-        gini_left = self._gini_impurity(y_left)
-        gini_right = self._gini_impurity(y_right)
-        
-        weighted_gini = (n_left / total_samples) * gini_left + (n_right / total_samples) * gini_right
-        return weighted_gini
+        return self._gini_from_counts(counts)
 
     def _most_common_label(self, y):
         # Helper function to find the most frequent class in a set of labels
         counts = np.bincount(y)
-        return np.argmax(counts)
+        return self.classes[np.argmax(counts)]
+
+    # --- Histogram mode ---
+
+    def _histogram(self, binned, y, rows, features=None):
+        # Class counts per feature and bin of the given rows: shape (n_features, n_bins, n_classes)
+        if features is None:
+            features = range(binned.shape[0])
+        n_classes = len(self.classes)
+        labels = y[rows]
+        histogram = np.empty((len(features), self.n_bins, n_classes), dtype=np.int64)
+        for position, feature_index in enumerate(features):
+            bins = binned[feature_index, rows].astype(np.intp)
+            histogram[position] = np.bincount(
+                bins * n_classes + labels, minlength=self.n_bins * n_classes).reshape(self.n_bins, n_classes)
+        return histogram
+
+    def _build_histogram_tree(self, binned, y, rows, histogram, current_depth):
+        # Like _build_tree, but a node is a set of row numbers with the class counts of
+        # its rows per feature and bin. Leaves only need their class counts.
+        if histogram is None:
+            class_counts = np.bincount(y[rows], minlength=len(self.classes))
+        else:
+            class_counts = histogram[0].sum(axis=0)
+        if np.count_nonzero(class_counts) == 1 or current_depth >= self.max_depth:
+            return Node(value=self.classes[np.argmax(class_counts)])
+
+        features = self._node_features(binned.shape[0])
+        if histogram is None:
+            histogram = self._histogram(binned, y, rows, features)
+
+        # All thresholds of all features in one sweep: the class counts left of each bin
+        # edge are a running sum over the bins
+        gini_gains = self._gini_gains(np.cumsum(histogram, axis=1), class_counts)
+        for position, feature_index in enumerate(features):
+            gini_gains[position, len(self.bin_edges[feature_index]):] = -np.inf
+        position, bin_index = np.unravel_index(np.argmax(gini_gains), gini_gains.shape)
+        if gini_gains[position, bin_index] <= 0:
+            return Node(value=self.classes[np.argmax(class_counts)])
+        feature_index = features[position]
+
+        goes_left = binned[feature_index, rows] <= bin_index
+        left_rows, right_rows = rows[goes_left], rows[~goes_left]
+
+        # Only the smaller child is counted: the larger one's histogram is the difference.
+        # With feature subsampling the children count their own features instead.
+        left_histogram = right_histogram = None
+        if current_depth + 1 < self.max_depth and self._features_per_node >= binned.shape[0]:
+            if len(left_rows) <= len(right_rows):
+                left_histogram = self._histogram(binned, y, left_rows)
+                right_histogram = histogram - left_histogram
+            else:
+                right_histogram = self._histogram(binned, y, right_rows)
+                left_histogram = histogram - right_histogram
+
+        left_child = self._build_histogram_tree(binned, y, left_rows, left_histogram, current_depth + 1)
+        right_child = self._build_histogram_tree(binned, y, right_rows, right_histogram, current_depth + 1)
+        threshold = self.bin_edges[feature_index][bin_index]
+        return Node(feature_index, threshold, left_child, right_child)
 
 # --- EXAMPLE ---
 
-# Sample data
-data = {'Hours Studied': [2, 3, 4, 5, 6, 7, 8, 9, 10, 1, 2, 3, 4, 5],
-        'Attended Review': [0, 1, 0, 1, 0, 1, 0, 1, 0, 0, 0, 1, 1, 0],
-        'Passed Exam': [0, 0, 0, 1, 1, 1, 1, 1, 1, 0, 0, 0, 1, 0]}
+if __name__ == '__main__':
+    # Sample data
+    data = {'Hours Studied': [2, 3, 4, 5, 6, 7, 8, 9, 10, 1, 2, 3, 4, 5],
+            'Attended Review': [0, 1, 0, 1, 0, 1, 0, 1, 0, 0, 0, 1, 1, 0],
+            'Passed Exam': [0, 0, 0, 1, 1, 1, 1, 1, 1, 0, 0, 0, 1, 0]}
 
-df = pd.DataFrame(data)
+    df = pd.DataFrame(data)
 
-# Convert DataFrame to a NumPy array for our algorithm
-X_data = df[['Hours Studied', 'Attended Review']].values
-y_data = df['Passed Exam'].values
+    # Convert DataFrame to a NumPy array for our algorithm
+    X_data = df[['Hours Studied', 'Attended Review']].values
+    y_data = df['Passed Exam'].values
 
-# Create and train the model
-model = DecisionTreeClassifier(max_depth=3)
-model.fit(X_data, y_data)
+    # Create and train the model
+    model = DecisionTreeClassifier(max_depth=3)
+    model.fit(X_data, y_data)
 
-# Make a prediction for a new student: 5 hours studied, attended review (1)
-new_student = np.array([[5, 1]])
-prediction = model.predict(new_student)
+    # Make a prediction for a new student: 5 hours studied, attended review (1)
+    new_student = np.array([[5, 1]])
+    prediction = model.predict(new_student)
 
-print(f"The model predicts the student will {'Pass' if prediction[0] == 1 else 'Fail'}.")
\ No newline at end of file
+    print(f"The model predicts the student will {'Pass' if prediction[0] == 1 else 'Fail'}.")
@@ -0,0 +1,263 @@
+#Gradient descent for the from-scratch regressions in linearRegression.py and logisticRegression.py
+#Those scripts show the idea with a single feature and a fixed number of full-batch steps.
+#The estimators built on GradientDescentModel run the same loop on feature matrices, with:
+# - mini-batches: every step uses a shuffled slice of the rows instead of all of them
+# - momentum and Adam: step rules that remember earlier gradients, and reach the minimum
+#   in far fewer steps than the plain rule
+# - early stopping: training ends once n_iter_no_change epochs (passes over the rows) in
+#   a row did not lower the loss by more than tol
+# - partial_fit: one epoch over chunks from a generator, for data that does not fit in memory
+# - no allocations: the steps reuse the same buffers, so after the first step an epoch
+#   allocates no arrays, however many rows it covers
+#Subclasses can also offer other solvers (e.g. closed-form least squares) that fit() picks
+#with the solver argument.
+import time
+
+import numpy as np
+
+
+def as_matrix(X):
+    # A single feature may be given as a 1-D array, like in the scripts
+    X = np.asarray(X, dtype=np.float64)
+    return X.reshape(-1, 1) if X.ndim == 1 else X
+
+
+# --- Step rules ---
+# A step rule updates the parameters in place from the gradient. Their buffers are made
+# once in start(), so a step allocates no arrays.
+
+class SGD:
+    """The rule of the scripts: parameters -= learning_rate * gradient."""
+
+    def __init__(self, learning_rate):
+        self.learning_rate = learning_rate
+
+    def start(self, n_params):
+        self._step = np.zeros(n_params)
+
+    def step(self, params, gradient):
+        np.multiply(gradient, self.learning_rate, out=self._step)
+        params -= self._step
+
+
+class Momentum:
+    """
+    Keeps a velocity: a running sum of the past steps that fades by the momentum factor
+    every step. Steps in a direction the gradient keeps pointing to grow, and zig-zags
+    across a narrow valley cancel out.
+    """
+
+    def __init__(self, learning_rate, momentum=0.9):
+        self.learning_rate = learning_rate
+        self.momentum = momentum
+
+    def start(self, n_params):
+        self._velocity = np.zeros(n_params)
+        self._step = np.zeros(n_params)
+
+    def step(self, params, gradient):
+        self._velocity *= self.momentum
+        np.multiply(gradient, self.learning_rate, out=self._step)
+        self._velocity -= self._step
+        params += self._velocity
+
+
+class Adam:
+    """
+    Momentum on the gradient (first moment) divided by a running root mean square of the
+    gradient (second moment), so every parameter gets a step size that suits its own scale.
+    """
+
+    def __init__(self, learning_rate, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def start(self, n_params):
+        self._mean = np.zeros(n_params)
+        self._square = np.zeros(n_params)
+        self._step = np.zeros(n_params)
+        self._t = 0
+
+    def step(self, params, gradient):
+        self._t += 1
+        self._mean *= self.beta1
+        np.multiply(gradient, 1 - self.beta1, out=self._step)
+        self._mean += self._step
+        self._square *= self.beta2
+        np.multiply(gradient, gradient, out=self._step)
+        self._step *= 1 - self.beta2
+        self._square += self._step
+        # Both moments start at 0, which the bias corrections make up for
+        correction = np.sqrt(1 - self.beta2 ** self._t)
+        np.sqrt(self._square, out=self._step)
+        self._step += self.epsilon * correction
+        np.divide(self._mean, self._step, out=self._step)
+        self._step *= self.learning_rate * correction / (1 - self.beta1 ** self._t)
+        params -= self._step
+
+
+OPTIMIZERS = {'sgd': SGD, 'momentum': Momentum, 'adam': Adam}
+
+
+class GradientDescentModel:
+    """
+    Base class of the gradient descent estimators. A subclass computes its loss and
+    gradient in _loss_gradient; the parameters are the weights followed by the bias.
+    A subclass with other solvers lists them in SOLVERS and implements _solve and
+    _choose_solver.
+
+    Args:
+        optimizer (str): 'sgd' (the plain rule), 'momentum' or 'adam'.
+        learning_rate (float): Step size.
+        batch_size (int, optional): Rows per step. None uses all rows in every step.
+        max_epochs (int): Most passes over the rows.
+        tol (float): An epoch improves the loss if it lowers it by more than tol.
+        n_iter_no_change (int): Epochs without improvement before training stops.
+        shuffle (bool): Shuffle the rows every epoch (mini-batches only).
+        random_state (int, optional): Seed of the shuffling.
+        solver (str): 'gd' (gradient descent), one of the subclass's other SOLVERS, or
+            'auto' to pick one from the shape of the data. partial_fit always uses 'gd'.
+    """
+
+    SOLVERS = ('auto', 'gd')
+
+    def __init__(self, optimizer='adam', learning_rate=0.01, batch_size=None, max_epochs=1000, tol=1e-6,
+                 n_iter_no_change=10, shuffle=True, random_state=None, solver='auto'):
+        if optimizer not in OPTIMIZERS:
+            raise ValueError(f"optimizer must be one of {list(OPTIMIZERS)}.")
+        if solver not in self.SOLVERS:
+            raise ValueError(f"solver must be one of {list(self.SOLVERS)}.")
+        self.optimizer = optimizer
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.max_epochs = max_epochs
+        self.tol = tol
+        self.n_iter_no_change = n_iter_no_change
+        self.shuffle = shuffle
+        self.random_state = random_state
+        self.solver = solver
+        self.params = None
+
+    @property
+    def weights(self):
+        return self.params[:-1]
+
+    @property
+    def bias(self):
+        return self.params[-1]
+
+    def _loss_gradient(self, X, y, gradient):
+        # Returns the mean loss over the rows and writes its gradient into gradient
+        raise NotImplementedError
+
+    def _choose_solver(self, n_rows, n_features):
+        return 'gd'
+
+    def _solve(self, X, y, solver):
+        # Sets params with a solver other than 'gd', and n_iter, losses and converged
+        raise NotImplementedError
+
+    def fit(self, X, y):
+        """
+        Trains from zero on all rows. Gradient descent runs until the loss stops
+        improving or max_epochs. Afterwards solver_used is the solver that ran, n_iter its
+        epochs or iterations and fit_time the seconds it took.
+        """
+        start = time.perf_counter()
+        X = as_matrix(X)
+        y = np.asarray(y, dtype=np.float64)
+        self._start(X.shape[1])
+        self.solver_used = self._choose_solver(*X.shape) if self.solver == 'auto' else self.solver
+        if self.solver_used == 'gd':
+            for _ in range(self.max_epochs):
+                if self._end_epoch(self._epoch(X, y)):
+                    break
+            self.n_iter = self.n_epochs
+        else:
+            self._solve(X, y, self.solver_used)
+        self.fit_time = time.perf_counter() - start
+        return self
+
+    def partial_fit(self, chunks):
+        """
+        One epoch over the (X, y) chunks of an iterable, e.g. a generator reading them
+        from disk. Training continues from the current parameters; loop until converged
+        is True, with a new generator every call.
+        """
+        total_loss, n_rows = 0.0, 0
+        for X, y in chunks:
+            X = as_matrix(X)
+            y = np.asarray(y, dtype=np.float64)
+            if self.params is None:
+                self._start(X.shape[1])
+            total_loss += self._epoch(X, y) * len(y)
+            n_rows += len(y)
+        if n_rows:
+            self._end_epoch(total_loss / n_rows)
+        self.solver_used, self.n_iter = 'gd', self.n_epochs
+        return self
+
+    def _start(self, n_features):
+        self.params = np.zeros(n_features + 1)
+        self._gradient = np.zeros(n_features + 1)
+        self._step_rule = OPTIMIZERS[self.optimizer](self.learning_rate)
+        self._step_rule.start(n_features + 1)
+        self._rng = np.random.default_rng(self.random_state)
+        self._order = np.zeros(0, dtype=np.intp)
+        self._X_batch = self._y_batch = np.zeros((0, 0))
+        self._work_buffer = np.zeros((0, 0))
+        self.losses = []        # The loss of every epoch
+        self.n_epochs = 0
+        self.converged = False
+        self._best_loss = np.inf
+        self._no_change = 0
+
+    def _work(self, n_rows, count=1):
+        # count vectors of n_rows for _loss_gradient, reused from step to step
+        if self._work_buffer.shape[0] < count or self._work_buffer.shape[1] < n_rows:
+            self._work_buffer = np.empty((count, n_rows))
+        return self._work_buffer[:count, :n_rows]
+
+    def _epoch(self, X, y):
+        # One pass over the rows. Returns the mean of the losses of the steps.
+        n_rows = len(y)
+        batch_size = min(self.batch_size or n_rows, n_rows)
+        if batch_size == n_rows:
+            loss = self._loss_gradient(X, y, self._gradient)
+            self._step_rule.step(self.params, self._gradient)
+            return loss
+
+        if self.shuffle:
+            # The shuffled row order and the batch buffers are reused from epoch to epoch
+            if len(self._order) != n_rows:
+                self._order = np.arange(n_rows)
+            self._rng.shuffle(self._order)
+            if self._X_batch.shape != (batch_size, X.shape[1]):
+                self._X_batch = np.empty((batch_size, X.shape[1]))
+                self._y_batch = np.empty(batch_size)
+        total_loss = 0.0
+        for start in range(0, n_rows, batch_size):
+            stop = min(start + batch_size, n_rows)
+            if self.shuffle:
+                rows = self._order[start:stop]
+                # mode='clip' writes straight into out ('raise' would buffer the copy)
+                X_batch = np.take(X, rows, axis=0, out=self._X_batch[:stop - start], mode='clip')
+                y_batch = np.take(y, rows, out=self._y_batch[:stop - start], mode='clip')
+            else:
+                X_batch, y_batch = X[start:stop], y[start:stop]
+            total_loss += self._loss_gradient(X_batch, y_batch, self._gradient) * (stop - start)
+            self._step_rule.step(self.params, self._gradient)
+        return total_loss / n_rows
+
+    def _end_epoch(self, loss):
+        self.losses.append(loss)
+        self.n_epochs += 1
+        if loss > self._best_loss - self.tol:
+            self._no_change += 1
+        else:
+            self._no_change = 0
+        self._best_loss = min(self._best_loss, loss)
+        self.converged = self._no_change >= self.n_iter_no_change
+        return self.converged
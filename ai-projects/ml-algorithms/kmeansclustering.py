@@ -1,6 +1,10 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+import scipy.sparse as sp
+from sklearn.cluster import KMeans as SklearnKMeans
 from sklearn.datasets import make_blobs
 
 # --- Step 1: Generate a Sample Dataset ---
@@ -8,37 +12,403 @@ from sklearn.datasets import make_blobs
 # The `make_blobs` function is used for this.
 X, y = make_blobs(n_samples=500, centers=3, random_state=42)
 
-# --- Step 2: Create and Train the K-Means Model ---
-# We instantiate the KMeans model and specify the number of clusters (n_clusters)
-# we want to find. We'll set it to 3 since we know the data has 3 natural groups.
-kmeans = KMeans(n_clusters=3, random_state=42, n_init='auto')
 
-# The `.fit()` method runs the K-Means algorithm, finding the optimal
-# cluster assignments and centroids.
-kmeans.fit(X)
+# --- THE SAME ALGORITHM FROM SCRATCH ---
+# K-Means repeats two steps until the centroids stop moving (Lloyd's algorithm):
+# 1. assign every point to its closest centroid
+# 2. move every centroid to the mean of its points
+# The assignment step computes the distance from every point to every centroid, which
+# is almost all of the work. Below the squared distances come from one matrix product
+# per block of rows: |x - c|^2 = |x|^2 - 2 x.c + |c|^2.
+#
+# Hamerly's algorithm skips most of those distances with the triangle inequality. Every
+# point keeps an upper bound on the distance to its own centroid and a lower bound on the
+# distance to the second closest one. When a centroid moves by s, the bounds grow or
+# shrink by at most s, and a point whose upper bound stays below both its lower bound and
+# half the distance from its centroid to the next centroid cannot change cluster. After
+# the first few iterations the centroids barely move, so only a few points are compared
+# with all centroids. (Elkan's algorithm keeps a lower bound per point and centroid, which
+# skips a few more distances but needs n_points x n_clusters bounds in memory.)
+#
+# Mini-batch K-Means (partial_fit) moves the centroids after every small batch of points
+# instead of after a pass over all of them, so it can learn from data streamed from disk.
+#
+# The blocks of rows are spread over a pool of threads. NumPy releases the GIL inside
+# matrix products and ufuncs, so the threads run on all cores.
+
+# Rows per block of the assignment step
+BLOCK_ROWS = 16384
+
+
+def float_rows(X, start, stop):
+    """
+    The rows start:stop of X as float64. Only these rows are converted, so a float32 or
+    memory-mapped X is never copied into memory as a whole.
+    """
+    return np.asarray(X[start:stop], dtype=np.float64)
+
+
+def squared_distances(X, centers, centers_squared=None, X_squared=None):
+    """
+    The squared distances from every row of X to every center, as a (rows, centers)
+    array. The squared norms of the centers and rows can be passed in when known.
+    """
+    if centers_squared is None:
+        centers_squared = np.einsum('ij,ij->i', centers, centers)
+    if X_squared is None:
+        X_squared = np.einsum('ij,ij->i', X, X)
+    distances = X @ centers.T
+    distances *= -2
+    distances += X_squared[:, None]
+    distances += centers_squared
+    # Rounding can make distances of (nearly) 0 slightly negative
+    return np.maximum(distances, 0, out=distances)
+
+
+def cluster_sums(X, labels, n_clusters):
+    """The sum of the rows of X in every cluster, as a (clusters, features) array."""
+    # A (clusters, rows) matrix with a 1 for every row in its cluster's row: one entry
+    # per column, so the column pointers are just 0, 1, 2, ...
+    members = sp.csc_matrix((np.ones(len(labels)), labels, np.arange(len(labels) + 1)),
+                            shape=(n_clusters, len(labels)))
+    return members @ X
+
+
+def kmeans_plusplus(X, n_clusters, rng, n_local_trials=None):
+    """
+    Picks n_clusters rows of X as initial centers with k-means++: every next center is
+    drawn with a probability proportional to the squared distance to the closest center
+    so far, so the centers spread over the data. Like scikit-learn, it draws
+    n_local_trials candidates per center and keeps the one that lowers the total squared
+    distance most.
+
+    Args:
+        X (np.ndarray): The points, one per row (e.g. a memory-mapped .npy file, which is
+            read block by block).
+        n_clusters (int): The number of centers.
+        rng (np.random.Generator): The random generator.
+        n_local_trials (int, optional): Candidates per center, 2 + log(n_clusters) by default.
+
+    Returns:
+        np.ndarray: The centers, one per row.
+    """
+    n_rows = len(X)
+    if n_local_trials is None:
+        n_local_trials = 2 + int(np.log(n_clusters))
+    starts = range(0, n_rows, BLOCK_ROWS)
+    X_squared = np.empty(n_rows)
+    for start in starts:
+        block = float_rows(X, start, start + BLOCK_ROWS)
+        X_squared[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+
+    def distances_to(points, points_squared):
+        # One row per point, so the sums below run along contiguous memory
+        distances = np.empty((len(points), n_rows))
+        for start in starts:
+            stop = min(start + BLOCK_ROWS, n_rows)
+            distances[:, start:stop] = squared_distances(points, float_rows(X, start, stop),
+                                                         X_squared[start:stop], points_squared)
+        return distances
+
+    centers = np.empty((n_clusters, X.shape[1]))
+    first = rng.integers(n_rows)
+    centers[0] = X[first]
+    closest = distances_to(centers[:1], X_squared[first:first + 1])[0]
+    potential = closest.sum()
+    for c in range(1, n_clusters):
+        # Candidates drawn with probability closest / potential
+        thresholds = rng.random(n_local_trials) * potential
+        candidates = np.minimum(np.searchsorted(np.cumsum(closest), thresholds), n_rows - 1)
+        candidate_closest = distances_to(np.asarray(X[candidates], dtype=np.float64), X_squared[candidates])
+        np.minimum(candidate_closest, closest, out=candidate_closest)
+        best = np.argmin(candidate_closest.sum(axis=1))
+        centers[c] = X[candidates[best]]
+        closest = candidate_closest[best]
+        potential = closest.sum()
+    return centers
+
+
+def chunks_from_npy(path, chunk_rows=100000):
+    """Reads the rows of a .npy file chunk by chunk, without loading the whole file."""
+    X = np.load(path, mmap_mode='r')
+    for start in range(0, len(X), chunk_rows):
+        yield X[start:start + chunk_rows]
+
+
+class KMeans:
+    """
+    K-Means clustering with k-means++ seeding.
+
+    Args:
+        n_clusters (int): The number of clusters.
+        algorithm (str): 'lloyd' (all distances every iteration) or 'hamerly' (skips the
+            distances the triangle inequality rules out, for the same clusters). 'auto'
+            is 'hamerly'.
+        max_iter (int): Most iterations of fit.
+        tol (float): Training stops once the centroids moved less than this in an
+            iteration (in squared distance, relative to the mean variance of the features).
+        batch_size (int): Points per step of partial_fit.
+        n_jobs (int, optional): Threads of the assignment step (None = all CPU cores).
+        random_state (int, optional): Seed of the seeding and of the mini-batch order.
+    """
+
+    def __init__(self, n_clusters=8, algorithm='auto', max_iter=300, tol=1e-4, batch_size=1024, n_jobs=None,
+                 random_state=None):
+        if algorithm not in ('auto', 'lloyd', 'hamerly'):
+            raise ValueError("algorithm must be 'auto', 'lloyd' or 'hamerly'.")
+        self.n_clusters = n_clusters
+        self.algorithm = algorithm
+        self.max_iter = max_iter
+        self.tol = tol
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.centers = None
+
+    def _map_blocks(self, function, n_rows):
+        # function(start, stop) for every block of rows, on the thread pool
+        starts = range(0, n_rows, BLOCK_ROWS)
+        stops = [min(start + BLOCK_ROWS, n_rows) for start in starts]
+        if len(stops) == 1:
+            return [function(0, n_rows)]
+        return list(self._pool.map(function, starts, stops))
+
+    def _start(self, X):
+        # Seeds the centers from the rows of X
+        self._rng = np.random.default_rng(self.random_state)
+        self.centers = kmeans_plusplus(X, self.n_clusters, self._rng)
+        self.counts = np.zeros(self.n_clusters)
+        # The variance of the features in two passes over the blocks
+        mean = sum(self._map_blocks(lambda start, stop: float_rows(X, start, stop).sum(axis=0), len(X))) / len(X)
+        squares = sum(self._map_blocks(lambda start, stop: ((float_rows(X, start, stop) - mean) ** 2).sum(axis=0),
+                                       len(X)))
+        self._tol = self.tol * (squares / len(X)).mean()
+        self.n_epochs = 0
+        self.converged = False
+
+    def fit(self, X):
+        """
+        Clusters the rows of X (an array or a memory-mapped .npy file) from k-means++
+        seeds. Afterwards labels are the clusters of the rows, inertia the sum of squared
+        distances to their centroids, n_iter the iterations and fit_time the seconds.
+        """
+        start = time.perf_counter()
+        # A memory-mapped X stays on disk; the blocks are converted to float64 as they are read
+        if not isinstance(X, np.ndarray):
+            X = np.asarray(X, dtype=np.float64)
+        with ThreadPoolExecutor(self.n_jobs or os.cpu_count()) as self._pool:
+            self._start(X)
+            # With one cluster there is no second closest center to bound
+            if self.algorithm == 'lloyd' or self.n_clusters == 1:
+                self._lloyd(X)
+            else:
+                self._hamerly(X)
+            # The inertia and labels of the final centers
+            self.labels, distances = self._assign(X)
+            self.inertia = distances.sum()
+        self.fit_time = time.perf_counter() - start
+        return self
+
+    def _assign(self, X):
+        # The closest center of every row and the squared distance to it
+        centers_squared = np.einsum('ij,ij->i', self.centers, self.centers)
+
+        def assign_block(start, stop):
+            distances = squared_distances(float_rows(X, start, stop), self.centers, centers_squared)
+            labels = np.argmin(distances, axis=1)
+            return labels, distances[np.arange(len(labels)), labels]
+
+        blocks = self._map_blocks(assign_block, len(X))
+        return np.concatenate([labels for labels, _ in blocks]), np.concatenate([d for _, d in blocks])
+
+    def _lloyd(self, X):
+        for self.n_iter in range(1, self.max_iter + 1):
+            def sum_block(start, stop):
+                # The closest center minimizes |c|^2 - 2 x.c, as |x|^2 is the same for all
+                block = float_rows(X, start, stop)
+                scores = block @ scaled_centers
+                scores += centers_squared
+                labels = np.argmin(scores, axis=1)
+                return (cluster_sums(block, labels, self.n_clusters),
+                        np.bincount(labels, minlength=self.n_clusters))
+
+            centers_squared = np.einsum('ij,ij->i', self.centers, self.centers)
+            scaled_centers = -2 * self.centers.T
+            blocks = self._map_blocks(sum_block, len(X))
+            sums = sum(block_sums for block_sums, _ in blocks)
+            self.counts = sum(counts for _, counts in blocks)
+            if self._move_centers(sums, self.counts) <= self._tol:
+                self.converged = True
+                break
+
+    def _move_centers(self, sums, counts):
+        # Moves every center to the mean of its points (an empty cluster keeps its center)
+        # and returns how far they moved in total, in squared distance
+        new_centers = self.centers.copy()
+        filled = counts > 0
+        new_centers[filled] = sums[filled] / counts[filled, None]
+        shift = ((new_centers - self.centers) ** 2).sum()
+        self.centers = new_centers
+        return shift
+
+    def _hamerly(self, X):
+        n_rows, k = len(X), self.n_clusters
+        labels = np.zeros(n_rows, dtype=np.intp)
+        upper = np.full(n_rows, np.inf)   # Bound on the distance to the own center
+        lower = np.zeros(n_rows)          # Bound on the distance to the second closest center
+
+        def update_block(start, stop):
+            # Reassigns the rows whose bounds allow a change and returns the change in the
+            # sums and counts of the clusters
+            block_labels, block_upper, block_lower = labels[start:stop], upper[start:stop], lower[start:stop]
+            bound = np.maximum(half_gaps[block_labels], block_lower)
+            rows = np.flatnonzero(block_upper > bound)
+            if len(rows) == 0:
+                return None
+            # Tighten the upper bound to the exact distance, and check again
+            points = float_rows(X, start, stop)[rows]
+            difference = points - self.centers[block_labels[rows]]
+            block_upper[rows] = np.sqrt(np.einsum('ij,ij->i', difference, difference))
+            still = block_upper[rows] > bound[rows]
+            rows, points = rows[still], points[still]
+            if len(rows) == 0:
+                return None
+            # The closest and second closest centers, with their exact bounds
+            distances = squared_distances(points, self.centers, centers_squared)
+            nearest = np.argpartition(distances, 1, axis=1)[:, :2]
+            first, second = np.take_along_axis(distances, nearest, axis=1).T
+            closest = nearest[:, 0]
+            old_labels = block_labels[rows]
+            block_upper[rows] = np.sqrt(first)
+            block_lower[rows] = np.sqrt(second)
+            block_labels[rows] = closest
+            changed = np.flatnonzero(closest != old_labels)
+            if len(changed) == 0:
+                return None
+            # The moved points leave the sums of their old clusters for those of the new
+            moved, new, old = points[changed], closest[changed], old_labels[changed]
+            sums = cluster_sums(moved, new, k) - cluster_sums(moved, old, k)
+            counts = np.bincount(new, minlength=k) - np.bincount(old, minlength=k)
+            return sums, counts
+
+        # Every point starts in cluster 0 with bounds that make the first assignment
+        # compare it with every center
+        centers_squared = np.einsum('ij,ij->i', self.centers, self.centers)
+        half_gaps = np.zeros(k)
+        sums, counts = np.zeros_like(self.centers), np.zeros(k)
+        sums[0] = sum(self._map_blocks(lambda start, stop: float_rows(X, start, stop).sum(axis=0), n_rows))
+        counts[0] = n_rows
+        for block in self._map_blocks(update_block, n_rows):
+            if block is not None:
+                sums += block[0]
+                counts += block[1]
+        for self.n_iter in range(1, self.max_iter + 1):
+            old_centers = self.centers
+            shift = self._move_centers(sums, counts)
+            if shift <= self._tol:
+                self.converged = True
+                break
+            # Widen the bounds by how far the centers moved: the own center for the upper
+            # bound, and the farthest moving other center for the lower bound
+            moves = np.sqrt(((self.centers - old_centers) ** 2).sum(axis=1))
+            upper += moves[labels]
+            farthest = np.argmax(moves)
+            others = np.delete(moves, farthest).max()
+            lower -= np.where(labels == farthest, others, moves[farthest])
+            # Half the distance from every center to its closest other center
+            gaps = squared_distances(self.centers, self.centers)
+            np.fill_diagonal(gaps, np.inf)
+            half_gaps = np.sqrt(gaps.min(axis=1)) / 2
+            centers_squared = np.einsum('ij,ij->i', self.centers, self.centers)
+            for block in self._map_blocks(update_block, n_rows):
+                if block is not None:
+                    sums += block[0]
+                    counts += block[1]
+        self.counts = counts
+
+    def partial_fit(self, chunks):
+        """
+        Mini-batch K-Means: one epoch over the chunks of an iterable (e.g.
+        chunks_from_npy), moving the centers after every batch_size points. The first
+        chunk seeds the centers. Every center moves towards its new points by the share
+        they have of all points it got so far, so the steps shrink as training goes on.
+        Training continues from the current centers; loop until converged is True, with a
+        new iterable every call. Afterwards inertia is the epoch's sum of squared distances.
+        """
+        old_centers = None if self.centers is None else self.centers.copy()
+        inertia = 0.0
+        with ThreadPoolExecutor(self.n_jobs or os.cpu_count()) as self._pool:
+            for X in chunks:
+                X = np.asarray(X, dtype=np.float64)
+                if self.centers is None:
+                    self._start(X)
+                    old_centers = self.centers.copy()
+                # Batches of random rows, as the chunks may be sorted
+                order = self._rng.permutation(len(X))
+                for start in range(0, len(X), self.batch_size):
+                    batch = X[np.sort(order[start:start + self.batch_size])]
+                    labels, distances = self._assign(batch)
+                    inertia += distances.sum()
+                    counts = np.bincount(labels, minlength=self.n_clusters)
+                    self.counts += counts
+                    filled = counts > 0
+                    sums = cluster_sums(batch, labels, self.n_clusters)
+                    self.centers[filled] += ((sums[filled] - counts[filled, None] * self.centers[filled])
+                                             / self.counts[filled, None])
+        if old_centers is not None:
+            self.n_epochs += 1
+            self.n_iter = self.n_epochs
+            self.inertia = inertia
+            self.converged = ((self.centers - old_centers) ** 2).sum() <= self._tol
+        return self
+
+    def predict(self, X):
+        """The closest centroid of every row of X (an array or a memory-mapped .npy file)."""
+        with ThreadPoolExecutor(self.n_jobs or os.cpu_count()) as self._pool:
+            if not isinstance(X, np.ndarray):
+                X = np.asarray(X, dtype=np.float64)
+            return self._assign(X)[0]
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    # --- Step 2: Create and Train the K-Means Model ---
+    # We instantiate the KMeans model and specify the number of clusters (n_clusters)
+    # we want to find. We'll set it to 3 since we know the data has 3 natural groups.
+    kmeans = SklearnKMeans(n_clusters=3, random_state=42, n_init='auto')
+
+    # The `.fit()` method runs the K-Means algorithm, finding the optimal
+    # cluster assignments and centroids.
+    kmeans.fit(X)
+
+    # --- Step 3: Get the Results ---
+    # The model's `.labels_` attribute gives us the cluster assignment for each point.
+    cluster_labels = kmeans.labels_
 
-# --- Step 3: Get the Results ---
-# The model's `.labels_` attribute gives us the cluster assignment for each point.
-cluster_labels = kmeans.labels_
+    # The `.cluster_centers_` attribute gives us the final coordinates of each centroid.
+    centroids = kmeans.cluster_centers_
 
-# The `.cluster_centers_` attribute gives us the final coordinates of each centroid.
-centroids = kmeans.cluster_centers_
+    print("Final Centroids:\n", centroids)
 
-print("Final Centroids:\n", centroids)
+    # The from-scratch KMeans finds the same clusters
+    model = KMeans(n_clusters=3, random_state=42).fit(X)
+    print(f"KMeans: inertia = {model.inertia:.2f} "
+          f"(scikit-learn: {kmeans.inertia_:.2f}) after {model.n_iter} iterations\n", model.centers)
 
-# --- Step 4: Visualize the Clusters ---
-# Create a scatter plot of the data points. The `c=cluster_labels` part
-# colors each point according to its assigned cluster.
-plt.scatter(X[:, 0], X[:, 1], c=cluster_labels, cmap='viridis', s=50, alpha=0.7)
+    # --- Step 4: Visualize the Clusters ---
+    # Create a scatter plot of the data points. The `c=cluster_labels` part
+    # colors each point according to its assigned cluster.
+    plt.scatter(X[:, 0], X[:, 1], c=cluster_labels, cmap='viridis', s=50, alpha=0.7)
 
-# Plot the centroids on top of the data points.
-# The red 'X' markers stand out to clearly show their location.
-plt.scatter(centroids[:, 0], centroids[:, 1], c='red', marker='X', s=200, label='Centroids')
+    # Plot the centroids on top of the data points.
+    # The red 'X' markers stand out to clearly show their location.
+    plt.scatter(centroids[:, 0], centroids[:, 1], c='red', marker='X', s=200, label='Centroids')
 
-# Add titles and labels for clarity
-plt.title('K-Means Clustering Result')
-plt.xlabel('Feature 1')
-plt.ylabel('Feature 2')
-plt.legend()
-plt.grid(True)
-plt.show()
\ No newline at end of file
+    # Add titles and labels for clarity
+    plt.title('K-Means Clustering Result')
+    plt.xlabel('Feature 1')
+    plt.ylabel('Feature 2')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
@@ -1,9 +1,14 @@
 #movie recommendation system using k-nearest neighbours and eucleadian distance (rt of the diff of lengts)
+import time
+
 import numpy as np
+import scipy.sparse as sp
+
+# The movies, in the order of the ratings below
+movies = ["Inception", "Dune", "The Matrix", "Blade Runner"]
 
 # A dictionary representing users and their movie ratings (1-5 stars)
 # The value 0 means the user has not rated that movie
-# The order of movies is: "Inception", "Dune", "The Matrix", "Blade Runner"
 ratings = {
     'User A': [5, 4, 0, 0],
     'User B': [4, 5, 0, 0],
@@ -54,7 +59,7 @@ def get_recommendation(target_user, ratings_data, k=2):
         for i, rating in enumerate(neighbor_ratings):
             # Check if the neighbor liked the movie and the target user hasn't seen it
             if rating > 3 and target_ratings[i] == 0:
-                movie_name = list(ratings_data['User A'].keys())[i]
+                movie_name = movies[i]
                 recommendations[movie_name] = recommendations.get(movie_name, 0) + 1
     
     # 4. Recommend the most frequently recommended movie
@@ -63,12 +68,315 @@ def get_recommendation(target_user, ratings_data, k=2):
     else:
         return "No new recommendations found."
 
+# --- THE SAME IDEA FOR MANY USERS: A RECOMMENDER ENGINE ---
+# get_recommendation compares the target user with every other user in Python, one
+# rating at a time. With thousands of users and movies that is far too slow, so the
+# engine below keeps all ratings in one sparse user x movie matrix (CSR: only the
+# ratings that exist are stored) and scores many users against all others with
+# sparse matrix products.
+
+def ratings_matrix(ratings_data):
+    """Turns a ratings dictionary like the one above into (user names, sparse ratings matrix)."""
+    names = list(ratings_data)
+    return names, sp.csr_matrix(np.array([ratings_data[name] for name in names], dtype=np.float32))
+
+
+class KNNRecommender:
+    """
+    Recommends movies from the ratings of the most similar users, for many users at once.
+
+    Args:
+        n_neighbors (int): How many similar users are asked.
+        metric (str): 'cosine' (the angle between two users' rating vectors) or
+            'euclidean' (like euclidean_distance: only movies both users rated count,
+            but users with no movie in common are never neighbours).
+        index (str): 'brute' scores every user exactly. 'lsh' (cosine only) first looks
+            up candidates in random projection hash tables and scores only those, which
+            is much faster with many users but may miss a few true neighbours.
+        like_threshold (float): A neighbour likes a movie rated above this.
+        n_tables (int): Number of hash tables of the 'lsh' index. More tables find more
+            true neighbours, at the cost of more candidates to score.
+        n_bits (int): Bits per hash. More bits make smaller buckets (fewer candidates).
+        random_state (int): Seed of the random projections.
+    """
+
+    def __init__(self, n_neighbors=2, metric='cosine', index='brute', like_threshold=3,
+                 n_tables=8, n_bits=12, random_state=0):
+        if metric not in ('cosine', 'euclidean'):
+            raise ValueError("metric must be 'cosine' or 'euclidean'.")
+        if index not in ('brute', 'lsh'):
+            raise ValueError("index must be 'brute' or 'lsh'.")
+        if index == 'lsh' and metric != 'cosine':
+            raise ValueError("The 'lsh' index only supports the cosine metric.")
+        self.n_neighbors = n_neighbors
+        self.metric = metric
+        self.index = index
+        self.like_threshold = like_threshold
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.random_state = random_state
+
+    def fit(self, ratings):
+        """
+        Stores the ratings and builds the index.
+
+        Args:
+            ratings: A (users x movies) matrix, sparse or dense. 0 means not rated.
+        """
+        self._set_ratings(ratings)
+        if self.index == 'lsh':
+            self._build_hash_tables()
+        return self
+
+    def _set_ratings(self, ratings):
+        self.ratings = sp.csr_matrix(ratings, dtype=np.float32)
+        self.ratings.sum_duplicates()
+        self.ratings.eliminate_zeros()
+        # Matrices with the same stored entries as the ratings: their squares, a 1 for
+        # every rating and a 1 for every rating above like_threshold
+        structure = (self.ratings.indices, self.ratings.indptr)
+        self.squares = sp.csr_matrix((self.ratings.data ** 2, *structure), shape=self.ratings.shape)
+        self.rated = sp.csr_matrix((np.ones_like(self.ratings.data), *structure), shape=self.ratings.shape)
+        self.liked = sp.csr_matrix(((self.ratings.data > self.like_threshold).astype(np.float32), *structure),
+                                   shape=self.ratings.shape)
+        self.norms = np.sqrt(np.asarray(self.squares.sum(axis=1), dtype=np.float64).ravel())
+
+    # --- Access to the matrices ---
+    # Everything below reads the ratings through these three methods, so a subclass can
+    # keep its ratings in another form (see ratingsStore.py).
+
+    def _rows(self, users, name='ratings'):
+        # The rows of some users of the 'ratings', 'squares', 'rated' or 'liked' matrix
+        return getattr(self, name)[users]
+
+    def _dot(self, rows, name):
+        # rows times every user's row of a matrix: (len(rows), n_users), dense
+        return (rows @ getattr(self, name).T).toarray()
+
+    def _sum_rows(self, weights, name):
+        # The users' rows of a matrix added up with weights (one row of weights per sum)
+        return (weights @ getattr(self, name)).toarray()
+
+    # --- Exact scores ---
+
+    def _scores(self, users):
+        # Similarity of the given users to all users, higher is more similar: (len(users), n_users)
+        products = self._dot(self._rows(users), 'ratings')
+        if self.metric == 'cosine':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = products / np.outer(self.norms[users], self.norms)
+            scores[~np.isfinite(scores)] = -np.inf
+            return scores
+
+        # Over the movies both users rated: sum (a - b)^2 = sum a^2 + sum b^2 - 2 sum a * b
+        rated = self._rows(users, 'rated')
+        squared_distances = (self._dot(self._rows(users, 'squares'), 'rated') + self._dot(rated, 'squares')
+                             - 2 * products)
+        in_common = self._dot(rated, 'rated')
+        scores = -np.sqrt(np.maximum(squared_distances, 0))
+        scores[in_common == 0] = -np.inf
+        return scores
+
+    def _brute_neighbors(self, users, k):
+        return self._top_k(self._scores(users), users, k)
+
+    def _top_k(self, scores, users, k):
+        # The k best scores of every row, best first, leaving out the user itself
+        scores[np.arange(len(users)), users] = -np.inf
+        if scores.shape[1] < k:
+            # Fewer users than neighbours asked for: the missing ones come out as -1
+            scores = np.pad(scores, ((0, 0), (0, k - scores.shape[1])), constant_values=-np.inf)
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        neighbors = np.take_along_axis(best, order, axis=1)
+        neighbor_scores = np.take_along_axis(best_scores, order, axis=1)
+        neighbors[neighbor_scores == -np.inf] = -1
+        return neighbors, neighbor_scores
+
+    # --- Random projection hashing ---
+
+    def _build_hash_tables(self):
+        # Every bit says on which side of a random hyperplane a user's rating vector lies.
+        # Users with a small angle between them end up on the same side of most planes,
+        # so they often share a whole n_bits hash: a bucket of likely neighbours.
+        rng = np.random.default_rng(self.random_state)
+        self.planes = rng.standard_normal((self.ratings.shape[1], self.n_tables * self.n_bits)).astype(np.float32)
+        self.codes = self._hash(self.ratings)
+        self._sort_hash_tables()
+
+    def _sort_hash_tables(self):
+        # Each table is the users sorted by their hash, so a bucket is a contiguous slice
+        self.tables = []
+        for table in range(self.n_tables):
+            order = np.argsort(self.codes[:, table], kind='stable')
+            self.tables.append((self.codes[order, table], order))
+
+    def _hash(self, rows):
+        bits = np.asarray(rows @ self.planes) > 0
+        bits = bits.reshape(rows.shape[0], self.n_tables, self.n_bits)
+        return (bits * (1 << np.arange(self.n_bits))).sum(axis=2, dtype=np.int32)
+
+    def _lsh_candidates(self, codes):
+        # Every user sharing a bucket with a query hash in any table, as (query row,
+        # candidate) pairs. A bucket is the slice of a table between the two
+        # searchsorted positions of the query's hash.
+        query_rows, candidates = [], []
+        for table, (keys, order) in enumerate(self.tables):
+            starts = np.searchsorted(keys, codes[:, table], 'left')
+            sizes = np.searchsorted(keys, codes[:, table], 'right') - starts
+            offsets = np.cumsum(sizes) - sizes
+            positions = np.arange(sizes.sum()) + np.repeat(starts - offsets, sizes)
+            query_rows.append(np.repeat(np.arange(len(codes)), sizes))
+            candidates.append(order[positions])
+        return np.concatenate(query_rows), np.concatenate(candidates)
+
+    def _lsh_neighbors(self, users, k):
+        query_rows, candidates = self._lsh_candidates(self._hash(self._rows(users)))
+        # A candidate found in several tables is scored once
+        n_users = len(self.norms)
+        pairs = np.sort(query_rows * n_users + candidates)
+        pairs = pairs[np.append(True, pairs[1:] != pairs[:-1])]
+        query_rows, candidates = np.divmod(pairs, n_users)
+        keep = candidates != users[query_rows]
+        query_rows, candidates = query_rows[keep], candidates[keep]
+
+        # Only the candidates are scored exactly: every stored rating of a candidate is
+        # multiplied with the query user's rating of the same movie
+        queries = self._rows(users).toarray()
+        rows = self._rows(candidates)
+        products = rows.data * queries[np.repeat(query_rows, np.diff(rows.indptr)), rows.indices]
+        products = np.add.reduceat(np.append(products, 0), rows.indptr[:-1]) * (np.diff(rows.indptr) > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = products / (self.norms[candidates] * self.norms[users][query_rows])
+        scores[~np.isfinite(scores)] = -np.inf
+
+        # The k best of every query: sorted by query, then best first; a candidate's
+        # place is its position minus where its query's candidates start
+        order = np.lexsort((-scores, query_rows))
+        query_rows, candidates, scores = query_rows[order], candidates[order], scores[order]
+        first = np.searchsorted(query_rows, query_rows, 'left')
+        place = np.arange(len(query_rows)) - first
+        best = (place < k) & (scores > -np.inf)
+        neighbors = np.full((len(users), k), -1)
+        neighbor_scores = np.full((len(users), k), -np.inf, dtype=np.float32)
+        neighbors[query_rows[best], place[best]] = candidates[best]
+        neighbor_scores[query_rows[best], place[best]] = scores[best]
+        return neighbors, neighbor_scores
+
+    # --- Batch queries ---
+
+    def kneighbors(self, users, k=None):
+        """
+        Finds the most similar users of many users at once.
+
+        Args:
+            users (array-like): Row numbers of the users in the ratings matrix.
+            k (int, optional): Neighbours per user. Defaults to n_neighbors.
+
+        Returns:
+            tuple: (neighbors, scores), both (len(users), k), best first. Cosine
+            similarities, or minus the euclidean distances. -1 / -inf where a user has
+            fewer than k neighbours.
+        """
+        users = np.asarray(users, dtype=np.intp)
+        k = k or self.n_neighbors
+        if self.index == 'lsh':
+            # Bounds the candidate pairs held at once
+            search, chunk = self._lsh_neighbors, 256
+        else:
+            # The dense scores of a chunk of users stay below about 64 MB
+            search, chunk = self._brute_neighbors, max(1, 2**24 // len(self.norms))
+        results = [search(users[start:start + chunk], k) for start in range(0, len(users), chunk)]
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def recommend(self, users, n=1):
+        """
+        Recommends the movies most of a user's neighbours liked and the user has not
+        rated yet, like get_recommendation, for many users at once.
+
+        Returns:
+            tuple: (movies, votes), both (len(users), n): movie column numbers, best
+            first (ties go to the lower column), and how many neighbours liked each.
+            -1 / 0 where there are fewer than n recommendations.
+        """
+        users = np.asarray(users, dtype=np.intp)
+        neighbors, _ = self.kneighbors(users)
+        # A (users x all users) matrix with a 1 for every neighbour: times the liked
+        # matrix it counts, per movie, the neighbours who liked it
+        rows, columns = np.nonzero(neighbors >= 0)
+        asked = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, neighbors[rows, columns])),
+                              shape=(len(users), len(self.norms)))
+        votes = self._sum_rows(asked, 'liked')
+        votes[self._rows(users, 'rated').toarray() > 0] = 0
+
+        n = min(n, votes.shape[1])
+        movies = np.argsort(-votes, axis=1, kind='stable')[:, :n]
+        movie_votes = np.take_along_axis(votes, movies, axis=1).astype(np.int64)
+        movies[movie_votes == 0] = -1
+        return movies, movie_votes
+
+
+def random_ratings(n_users, n_movies, ratings_per_user=40, n_tastes=2000, movies_per_taste=20, seed=0):
+    """
+    Makes a sparse ratings matrix where users come in n_tastes groups. Most of a user's
+    ratings are high ratings of their group's movies, so there are real neighbours to
+    find; the rest are lower ratings of random movies.
+    """
+    rng = np.random.default_rng(seed)
+    taste = rng.integers(0, n_tastes, n_users)
+    favourites = rng.integers(0, n_movies, (n_tastes, movies_per_taste))
+    rows = np.repeat(np.arange(n_users), ratings_per_user)
+    from_taste = rng.random(len(rows)) < 0.8
+    columns = np.where(from_taste, favourites[taste[rows], rng.integers(0, movies_per_taste, len(rows))],
+                       rng.integers(0, n_movies, len(rows)))
+    stars = np.where(from_taste, rng.integers(4, 6, len(rows)), rng.integers(1, 4, len(rows)))
+    # A movie drawn twice for the same user keeps its first rating
+    _, first = np.unique(rows * n_movies + columns, return_index=True)
+    return sp.csr_matrix((stars[first].astype(np.float32), (rows[first], columns[first])),
+                         shape=(n_users, n_movies))
+
+
 # --- EXAMPLE USAGE ---
 
-# The user we want to make a recommendation for
-target_user = 'User E'
+if __name__ == '__main__':
+    # The user we want to make a recommendation for
+    target_user = 'User E'
+
+    # Get the recommendation
+    recommended_movie = get_recommendation(target_user, ratings, k=2)
+
+    print(f"Based on your ratings, we recommend: {recommended_movie}")
+
+    # The engine, on the same users. With cosine similarity, users who rated none of
+    # User E's movies are not similar at all, while euclidean_distance above gives
+    # them a distance of 0, the closest possible
+    names, matrix = ratings_matrix(ratings)
+    engine = KNNRecommender(n_neighbors=2, metric='cosine').fit(matrix)
+    recommended, _ = engine.recommend([names.index(target_user)])
+    print(f"The engine recommends: {movies[recommended[0, 0]] if recommended[0, 0] >= 0 else 'nothing new'}")
+
+    # Many users at once: 2000 users against 200000 users and 20000 movies, exact and
+    # with the hash index
+    matrix = random_ratings(200000, 20000)
+    queries = np.arange(2000)
+    exact = KNNRecommender(n_neighbors=10).fit(matrix)
+    start = time.perf_counter()
+    _, true_scores = exact.kneighbors(queries)
+    print(f"\nExact search: {len(queries)} users in {time.perf_counter() - start:.2f}s")
 
-# Get the recommendation
-recommended_movie = get_recommendation(target_user, ratings, k=2)
+    start = time.perf_counter()
+    approximate = KNNRecommender(n_neighbors=10, index='lsh', n_tables=48, n_bits=14).fit(matrix)
+    print(f"Hash index built in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    _, found_scores = approximate.kneighbors(queries)
+    seconds = time.perf_counter() - start
+    # Many users have the same score, so a neighbour counts as found when it is as
+    # similar as the exact k-th neighbour
+    recall = np.mean(found_scores >= true_scores[:, -1:] - 1e-6)
+    print(f"Hash index search: {len(queries)} users in {seconds:.2f}s, "
+          f"{recall:.0%} of the exact neighbours found")
 
-print(f"Based on your ratings, we recommend: {recommended_movie}")
\ No newline at end of file
+    start = time.perf_counter()
+    recommended, votes = approximate.recommend(queries, n=5)
+    print(f"Top 5 recommendations for {len(queries)} users in {time.perf_counter() - start:.2f}s")
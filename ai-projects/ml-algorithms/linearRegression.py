@@ -1,7 +1,11 @@
 #Understanding Linear regression using gradient descent
 #Used in predicting values that deviate from an expected linear behavior model
+import warnings
+
 import numpy as np  #to handle large arrays and matrices of data much more efficiently than lists
-import matplotlib.pyplot as plt  # Import the visualization library 
+from scipy import linalg
+
+from gradientDescent import GradientDescentModel, as_matrix
 
 
 # A simple dataset for demonstration
@@ -15,61 +19,187 @@ learning_rate = 0.01  # Controls the size of the "steps" down the gradient
 iterations = 1000     # The number of times the parameters will be updated
 
 
-# Initialize the models parameters (slope and intercept)
-# We start with random or zero values and let the algorithm find the best ones
-m = 0
-b = 0
-n = len(X) # Number of data points
-
-# The core of the algorithm: the Gradient Descent loop
-for i in range(iterations):
-    # Step 1: Calculate the predictions for the current m and b
-    # This is our line equation: y = mx + b
-    y_predicted = m * X + b
-
-    # Step 2: Calculate the gradients
-    # Gradients are the partial derivatives of the Mean Squared Error (MSE) cost function
-    # They tell us the direction and magnitude of the steepest ascent of the error
-    
-    # Derivative with respect to m (slope)
-    # The -2/n part is from the derivative of the MSE formula
-    D_m = (-2/n) * np.sum(X * (y - y_predicted))
-    
-    # Derivative with respect to b (intercept)
-    D_b = (-2/n) * np.sum(y - y_predicted)
-
-    # Step 3: Update the parameters
-    # We move in the opposite direction of the gradient (downhill)
-    # The learning rate controls how big each step is
-    m = m - learning_rate * D_m
-    b = b - learning_rate * D_b
-
-    #Print the progress every 100 iterations to see the values change
-    if i % 100 == 0:
-        print(f"Iteration {i}: m = {m:.4f}, b = {b:.4f}, loss = {np.mean((y - y_predicted)**2):.4f}")
-
-# After the loop, the algorithm has found the optimal values for m and b
-print("\nTraining complete!")
-print(f"Final parameters: m = {m:.4f}, b = {b:.4f}")
-
-# ---VISUALIZATION ---
-
-# 1. Create a scatter plot of the actual data points
-plt.scatter(X, y, color='blue', label='Actual Data Points')
-
-# 2. Plot the line of best fit
-# We use the final, optimized m and b to draw our line
-y_final = m * X + b
-plt.plot(X, y_final, color='red', label='Line of Best Fit')
-
-plt.title('Linear Regression with Gradient Descent')
-plt.xlabel('X (Independent Variable)')
-plt.ylabel('y (Dependent Variable)')
-plt.legend()
-plt.grid(True)
-plt.show() # Display the plot
-
-# Now you can use the trained model to make a prediction: eg
-new_x = 6
-prediction = m * new_x + b
-print(f"For an input of {new_x}, the model predicts a value of {prediction:.4f}"
\ No newline at end of file
+def simple_gradient_descent(X, y, learning_rate=0.01, iterations=1000, verbose=True):
+    """Fits the line y = mx + b to one feature with a fixed number of gradient descent steps."""
+    # Initialize the models parameters (slope and intercept)
+    # We start with random or zero values and let the algorithm find the best ones
+    m = 0
+    b = 0
+    n = len(X) # Number of data points
+
+    # The core of the algorithm: the Gradient Descent loop
+    for i in range(iterations):
+        # Step 1: Calculate the predictions for the current m and b
+        # This is our line equation: y = mx + b
+        y_predicted = m * X + b
+
+        # Step 2: Calculate the gradients
+        # Gradients are the partial derivatives of the Mean Squared Error (MSE) cost function
+        # They tell us the direction and magnitude of the steepest ascent of the error
+
+        # Derivative with respect to m (slope)
+        # The -2/n part is from the derivative of the MSE formula
+        D_m = (-2/n) * np.sum(X * (y - y_predicted))
+
+        # Derivative with respect to b (intercept)
+        D_b = (-2/n) * np.sum(y - y_predicted)
+
+        # Step 3: Update the parameters
+        # We move in the opposite direction of the gradient (downhill)
+        # The learning rate controls how big each step is
+        m = m - learning_rate * D_m
+        b = b - learning_rate * D_b
+
+        #Print the progress every 100 iterations to see the values change
+        if verbose and i % 100 == 0:
+            print(f"Iteration {i}: m = {m:.4f}, b = {b:.4f}, loss = {np.mean((y - y_predicted)**2):.4f}")
+    return m, b
+
+
+# --- THE SAME MODEL FOR MANY FEATURES ---
+# With several features the line becomes y = X @ weights + bias, one weight per column
+# of X. The class below trains it with the loop of gradientDescent.py: mini-batches,
+# momentum or Adam steps, early stopping and partial_fit on chunks of data.
+#
+# Gradient descent only approaches the best weights, while the mean squared error has a
+# closed-form minimum: the weights w that solve the normal equations (X.T @ X) w = X.T @ y.
+# The class can also solve them directly:
+# - 'normal': a general linear solve of the normal equations
+# - 'cholesky': X.T @ X is symmetric positive definite, so it factors as L @ L.T and two
+#   triangular solves give w, about twice as fast as a general solve
+# - 'qr': X = Q @ R with orthonormal Q and triangular R, then R w = Q.T @ y. Slower, but
+#   X.T @ X squares the condition number of X and QR does not, so it is the most
+#   accurate when columns are close to dependent
+# All three first subtract the column means, which takes the bias out of the system
+# (bias = mean of y - mean of X @ w) and improves the conditioning.
+
+# Up to this many features a closed-form solve (about n_rows * n_features^2 work) beats
+# many passes of gradient descent
+CLOSED_FORM_MAX_FEATURES = 2000
+# With fewer rows per feature than this, 'auto' prefers the more accurate QR
+QR_ROWS_PER_FEATURE = 10
+
+
+class LinearRegression(GradientDescentModel):
+    """
+    Linear regression on the mean squared error. The arguments are those of
+    GradientDescentModel (gradientDescent.py); solver can also be 'normal', 'cholesky'
+    or 'qr'. 'auto' picks gradient descent for more than CLOSED_FORM_MAX_FEATURES
+    features, 'qr' for fewer than QR_ROWS_PER_FEATURE rows per feature and 'cholesky'
+    otherwise. A closed-form solve that fails on dependent columns falls back to the
+    least-squares solution with the smallest weights (solver_used = 'lstsq').
+    """
+
+    SOLVERS = ('auto', 'gd', 'normal', 'cholesky', 'qr')
+
+    def _choose_solver(self, n_rows, n_features):
+        if n_features > CLOSED_FORM_MAX_FEATURES:
+            return 'gd'
+        return 'qr' if n_rows < QR_ROWS_PER_FEATURE * n_features else 'cholesky'
+
+    def _solve(self, X, y, solver):
+        x_mean, y_mean = X.mean(axis=0), y.mean()
+        X_centered, y_centered = X - x_mean, y - y_mean
+        try:
+            if solver == 'qr':
+                if X.shape[0] < X.shape[1]:
+                    raise np.linalg.LinAlgError("fewer rows than features")
+                Q, R = np.linalg.qr(X_centered)
+                # Dependent columns give pivots that are zero up to rounding, which
+                # solve_triangular would divide by without complaint
+                pivots = np.abs(np.diag(R))
+                if pivots.min() <= max(R.shape) * np.finfo(R.dtype).eps * pivots.max():
+                    raise np.linalg.LinAlgError("dependent columns")
+                weights = linalg.solve_triangular(R, Q.T @ y_centered)
+            else:
+                gram = X_centered.T @ X_centered
+                right_side = X_centered.T @ y_centered
+                if solver == 'cholesky':
+                    factor = linalg.cho_factor(gram)
+                    # The same check on the factor of X.T @ X, whose rounding errors are
+                    # those of the squared pivots
+                    pivots = np.abs(np.diag(factor[0]))
+                    if pivots.min() <= np.sqrt(max(X.shape) * np.finfo(gram.dtype).eps) * pivots.max():
+                        raise np.linalg.LinAlgError("dependent columns")
+                    weights = linalg.cho_solve(factor, right_side)
+                else:
+                    # The pivots of the LU factors are those of X.T @ X as well, so they get
+                    # the check of the squared pivots without the square root. A pivot of
+                    # exactly 0 is caught here, so lu_factor's warning about it is not needed.
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', linalg.LinAlgWarning)
+                        factor = linalg.lu_factor(gram, check_finite=False)
+                    pivots = np.abs(np.diag(factor[0]))
+                    if pivots.min() <= max(X.shape) * np.finfo(gram.dtype).eps * pivots.max():
+                        raise np.linalg.LinAlgError("dependent columns")
+                    weights = linalg.lu_solve(factor, right_side, check_finite=False)
+            if not np.all(np.isfinite(weights)):
+                raise np.linalg.LinAlgError("singular system")
+        except (np.linalg.LinAlgError, linalg.LinAlgError):
+            weights = np.linalg.lstsq(X_centered, y_centered, rcond=None)[0]
+            self.solver_used = 'lstsq'
+        self.params[:-1] = weights
+        self.params[-1] = y_mean - x_mean @ weights
+        residual = X_centered @ weights - y_centered
+        self.losses = [residual @ residual / len(y)]
+        self.n_iter = 1
+        self.converged = True
+
+    def _loss_gradient(self, X, y, gradient):
+        n = len(y)
+        # The same derivatives as above, for every weight at once. The residuals go into
+        # a reused work array, so a step allocates no arrays.
+        residual = self._work(n)[0]
+        np.dot(X, self.weights, out=residual)
+        residual += self.bias
+        residual -= y
+        np.dot(residual, X, out=gradient[:-1])
+        gradient[-1] = residual.sum()
+        gradient *= 2 / n
+        return residual @ residual / n
+
+    def predict(self, X):
+        return as_matrix(X) @ self.weights + self.bias
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt  # Import the visualization library
+
+    m, b = simple_gradient_descent(X, y, learning_rate, iterations)
+
+    # After the loop, the algorithm has found the optimal values for m and b
+    print("\nTraining complete!")
+    print(f"Final parameters: m = {m:.4f}, b = {b:.4f}")
+
+    # The estimator on the same data: momentum steps until the loss no longer improves
+    model = LinearRegression(optimizer='momentum', learning_rate=0.01, max_epochs=100000, tol=1e-9,
+                             n_iter_no_change=50, solver='gd').fit(X, y)
+    print(f"LinearRegression: m = {model.weights[0]:.4f}, b = {model.bias:.4f} "
+          f"after {model.n_epochs} epochs, loss = {model.losses[-1]:.4f}")
+
+    # And in one step with the closed-form solution, which 'auto' picks for so few features
+    model = LinearRegression().fit(X, y)
+    print(f"LinearRegression ({model.solver_used}): m = {model.weights[0]:.4f}, b = {model.bias:.4f} "
+          f"in {model.fit_time * 1000:.2f} ms, loss = {model.losses[-1]:.4f}")
+
+    # ---VISUALIZATION ---
+
+    # 1. Create a scatter plot of the actual data points
+    plt.scatter(X, y, color='blue', label='Actual Data Points')
+
+    # 2. Plot the line of best fit
+    # We use the final, optimized m and b to draw our line
+    y_final = m * X + b
+    plt.plot(X, y_final, color='red', label='Line of Best Fit')
+
+    plt.title('Linear Regression with Gradient Descent')
+    plt.xlabel('X (Independent Variable)')
+    plt.ylabel('y (Dependent Variable)')
+    plt.legend()
+    plt.grid(True)
+    plt.show() # Display the plot
+
+    # Now you can use the trained model to make a prediction: eg
+    new_x = 6
+    prediction = m * new_x + b
+    print(f"For an input of {new_x}, the model predicts a value of {prediction:.4f}")
@@ -1,7 +1,9 @@
-#to predict a categorical outcome (like "yes" or "no") 
+#to predict a categorical outcome (like "yes" or "no")
 #we model the probability of that outcome using an S-shaped curve (sigmoid function)
 import numpy as np
-import matplotlib.pyplot as plt
+from scipy import linalg
+
+from gradientDescent import GradientDescentModel, as_matrix
 
 # A simple dataset for demonstration
 X = np.array([0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 2.75, 3.0, 3.25, 3.5, 3.75, 4.0, 4.25, 4.5, 4.75, 5.0, 5.5])
@@ -14,61 +16,222 @@ X = X.reshape(-1, 1)
 learning_rate = 0.01
 iterations = 10000
 
-# Initialize the model's parameters (weights)
-weights = np.zeros(1)
-bias = 0
-n = len(X)
-
 # The Sigmoid function
-def sigmoid(x):
-    return 1 / (1 + np.exp(-x))
-
-# The core of the algorithm: the Gradient Descent loop
-for i in range(iterations):
-    linear_output = np.dot(X, weights) + bias
-    y_predicted = sigmoid(linear_output)
-
-    dw = (1/n) * np.dot(X.T, (y_predicted - y))
-    db = (1/n) * np.sum(y_predicted - y)
-
-    weights = weights - learning_rate * dw
-    bias = bias - learning_rate * db
-    
-print("\nTraining complete!")
-print(f"Final weights: {weights[0]:.4f}, Final bias: {bias:.4f}")
-
-# --- VISUALIZATION---
-
-# Create a range of x values to plot the sigmoid curve
-x_plot = np.linspace(0, 6, 100).reshape(-1, 1)
-
-# Calculate the predicted probabilities for the plot range
-linear_output_plot = np.dot(x_plot, weights) + bias
-y_predicted_plot = sigmoid(linear_output_plot)
-
-# 1. Create a scatter plot of the actual data points
-plt.scatter(X, y, color='blue', label='Actual Data Points (0=Fail, 1=Pass)')
-
-# 2. Plot the sigmoid curve
-plt.plot(x_plot, y_predicted_plot, color='red', label='Logistic Regression Curve')
-
-# 3. Add a horizontal line at 0.5 to show the decision boundary
-plt.axhline(y=0.5, color='green', linestyle='--', label='Decision Boundary')
-
-# Add titles and labels for clarity
-plt.title('Logistic Regression with Gradient Descent')
-plt.xlabel('Hours Studied')
-plt.ylabel('Probability of Passing')
-plt.legend()
-plt.grid(True)
-plt.show()
-
-
-# Make a prediction with the trained model
-new_x = np.array([[2.8]])
-final_linear_output = np.dot(new_x, weights) + bias
-final_prediction_prob = sigmoid(final_linear_output)
-final_prediction_class = 1 if final_prediction_prob[0][0] >= 0.5 else 0
-
-print(f"\nProbability of passing for a student who studied 2.8 hours: {final_prediction_prob[0][0]:.4f}")
-print(f"Predicted class: {'Pass' if final_prediction_class == 1 else 'Fail'}")
\ No newline at end of file
+# 1 / (1 + np.exp(-x)) overflows in np.exp for x below about -709. Written as
+# e^-log(1 + e^-x) nothing overflows: np.logaddexp(0, -x) computes log(e^0 + e^-x)
+# as max(0, -x) + log(1 + e^-|x|). With out, the result is written into that array
+# (which may be x itself) instead of a new one; every step only reads what the step
+# before wrote, so x is not needed after the first. Integers and scalars are turned into
+# float64 first, as the steps write their float results in place; a scalar in gives a
+# scalar out, like 1 / (1 + np.exp(-x)).
+def sigmoid(x, out=None):
+    x = np.asarray(x, dtype=np.float64)
+    scalar = out is None and x.ndim == 0
+    if out is None:
+        out = np.empty_like(x)
+    np.negative(x, out=out)
+    np.logaddexp(0, out, out=out)
+    np.negative(out, out=out)
+    np.exp(out, out=out)
+    return out[()] if scalar else out
+
+
+# The log loss: -log p for y = 1 and -log(1 - p) for y = 0, with p = sigmoid(z). In terms
+# of z that is log(1 + e^z) - y * z, which stays exact where p rounds to 0 or 1.
+# work is an optional array like z for the intermediate values.
+def log_loss_from_logits(z, y, work=None):
+    work = np.logaddexp(0, z, out=work)
+    return (work.sum() - y @ z) / len(y)
+
+
+def simple_gradient_descent(X, y, learning_rate=0.01, iterations=10000):
+    """Fits the weights and bias with a fixed number of full-batch gradient descent steps."""
+    # Initialize the model's parameters (weights)
+    weights = np.zeros(X.shape[1])
+    bias = 0
+    n = len(X)
+
+    # The core of the algorithm: the Gradient Descent loop
+    for i in range(iterations):
+        linear_output = np.dot(X, weights) + bias
+        y_predicted = sigmoid(linear_output)
+
+        dw = (1/n) * np.dot(X.T, (y_predicted - y))
+        db = (1/n) * np.sum(y_predicted - y)
+
+        weights = weights - learning_rate * dw
+        bias = bias - learning_rate * db
+    return weights, bias
+
+
+# --- THE SAME MODEL FOR MANY FEATURES ---
+# LogisticRegression trains the weights and bias with the loop of gradientDescent.py:
+# mini-batches, momentum or Adam steps, early stopping and partial_fit on chunks of data.
+#
+# Or with Newton's method, which in logistic regression is called IRLS (iteratively
+# reweighted least squares): every iteration solves H @ step = gradient, where the
+# Hessian H = X.T @ diag(p * (1 - p)) @ X / n describes the curvature of the log loss.
+# Close to the minimum every iteration doubles the correct digits, so a handful of
+# iterations replace thousands of gradient steps. A full Newton step can overshoot far
+# from the minimum, so a backtracking line search halves it until the loss drops enough.
+
+# Up to this many features the Hessian (n_features^2 numbers, n_rows * n_features^2 work
+# per iteration) is cheap enough for IRLS
+IRLS_MAX_FEATURES = 2000
+
+
+class LogisticRegression(GradientDescentModel):
+    """
+    Logistic regression for 0/1 labels on the log loss (the mean of -log of the
+    probability given to the true label). The arguments are those of
+    GradientDescentModel (gradientDescent.py); solver can also be 'irls', which 'auto'
+    picks for up to IRLS_MAX_FEATURES features. IRLS stops once an iteration lowers the
+    loss by less than tol, or after max_epochs iterations.
+    """
+
+    SOLVERS = ('auto', 'gd', 'irls')
+
+    def _choose_solver(self, n_rows, n_features):
+        return 'irls' if n_features <= IRLS_MAX_FEATURES else 'gd'
+
+    def _solve(self, X, y, solver):
+        n = len(y)
+        params = self.params
+        z = X @ params[:-1] + params[-1]
+        work = self._work(n)[0]
+        loss = log_loss_from_logits(z, y, work)
+        self.losses = [loss]
+        self.converged = False
+        for self.n_iter in range(1, self.max_epochs + 1):
+            p = sigmoid(z)
+            error = p - y
+            gradient = np.append(error @ X, error.sum()) / n
+            # The Hessian in blocks: weights x weights, weights x bias and bias x bias
+            curvature = p * (1 - p)
+            hessian = np.empty((len(params), len(params)))
+            weighted = X * curvature[:, None]
+            hessian[:-1, :-1] = weighted.T @ X
+            hessian[:-1, -1] = hessian[-1, :-1] = weighted.sum(axis=0)
+            hessian[-1, -1] = curvature.sum()
+            hessian /= n
+            # A tiny ridge keeps the solve possible when the curvature vanishes (e.g.
+            # separable data, where the probabilities all go to 0 or 1)
+            hessian[np.diag_indices_from(hessian)] += 1e-10
+            step = linalg.solve(hessian, gradient, assume_a='pos')
+
+            # Backtracking line search: the step size halves until the loss drops by at
+            # least a small share of what the gradient promises (the Armijo condition)
+            decrease = gradient @ step
+            size = 1.0
+            for _ in range(30):
+                new_params = params - size * step
+                new_z = X @ new_params[:-1] + new_params[-1]
+                new_loss = log_loss_from_logits(new_z, y, work)
+                if new_loss <= loss - 1e-4 * size * decrease:
+                    break
+                size /= 2
+            else:
+                # No step lowers the loss any more: the minimum is reached
+                self.converged = True
+                break
+            params[:] = new_params
+            z = new_z
+            improvement, loss = loss - new_loss, new_loss
+            self.losses.append(loss)
+            if improvement < self.tol:
+                self.converged = True
+                break
+
+    def _loss_gradient(self, X, y, gradient):
+        # The loss and gradient in one pass over two work arrays, so a step allocates no
+        # arrays. With z = X @ weights + bias and e = exp(-|z|), which cannot overflow:
+        # - the loss log(1 + e^z) - y * z is max(z, 0) + log(1 + e) - y * z, and the sum
+        #   of max(z, 0) is (sum of z + sum of |z|) / 2
+        # - sigmoid(z) is exp(min(z, 0)) / (1 + e)
+        # np.logaddexp would do the same in fewer lines, at about twice the time.
+        n = len(y)
+        z, e = self._work(n, 2)
+        np.dot(X, self.weights, out=z)
+        z += self.bias
+        y_dot_z = y @ z
+        z_sum = z.sum()
+        np.abs(z, out=e)
+        abs_sum = e.sum()
+        np.negative(e, out=e)
+        np.exp(e, out=e)
+        e += 1
+        # z becomes the error sigmoid(z) - y, and e the log(1 + e) of the loss
+        np.minimum(z, 0, out=z)
+        np.exp(z, out=z)
+        z /= e
+        z -= y
+        np.log(e, out=e)
+        loss = ((z_sum + abs_sum) / 2 + e.sum() - y_dot_z) / n
+        # The gradient has the same form as the loop above: X.T @ (y_predicted - y) / n
+        np.dot(z, X, out=gradient[:-1])
+        gradient[-1] = z.sum()
+        gradient /= n
+        return loss
+
+    def predict_proba(self, X):
+        """The probability of label 1 for every row."""
+        return sigmoid(as_matrix(X) @ self.weights + self.bias)
+
+    def predict(self, X):
+        return (self.predict_proba(X) >= 0.5).astype(int)
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    weights, bias = simple_gradient_descent(X, y, learning_rate, iterations)
+
+    print("\nTraining complete!")
+    print(f"Final weights: {weights[0]:.4f}, Final bias: {bias:.4f}")
+
+    # The estimator on the same data: momentum steps until the loss no longer improves
+    model = LogisticRegression(optimizer='momentum', learning_rate=0.3, max_epochs=100000, tol=1e-9,
+                               n_iter_no_change=50, solver='gd').fit(X, y)
+    print(f"LogisticRegression: weights = {model.weights[0]:.4f}, bias = {model.bias:.4f} "
+          f"after {model.n_epochs} epochs, log loss = {model.losses[-1]:.4f}")
+
+    # And with IRLS, which 'auto' picks for so few features
+    model = LogisticRegression(tol=1e-9).fit(X, y)
+    print(f"LogisticRegression ({model.solver_used}): weights = {model.weights[0]:.4f}, bias = {model.bias:.4f} "
+          f"after {model.n_iter} iterations in {model.fit_time * 1000:.1f} ms, log loss = {model.losses[-1]:.4f}")
+
+    # --- VISUALIZATION---
+
+    # Create a range of x values to plot the sigmoid curve
+    x_plot = np.linspace(0, 6, 100).reshape(-1, 1)
+
+    # Calculate the predicted probabilities for the plot range
+    linear_output_plot = np.dot(x_plot, weights) + bias
+    y_predicted_plot = sigmoid(linear_output_plot)
+
+    # 1. Create a scatter plot of the actual data points
+    plt.scatter(X, y, color='blue', label='Actual Data Points (0=Fail, 1=Pass)')
+
+    # 2. Plot the sigmoid curve
+    plt.plot(x_plot, y_predicted_plot, color='red', label='Logistic Regression Curve')
+
+    # 3. Add a horizontal line at 0.5 to show the decision boundary
+    plt.axhline(y=0.5, color='green', linestyle='--', label='Decision Boundary')
+
+    # Add titles and labels for clarity
+    plt.title('Logistic Regression with Gradient Descent')
+    plt.xlabel('Hours Studied')
+    plt.ylabel('Probability of Passing')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+
+    # Make a prediction with the trained model
+    new_x = np.array([[2.8]])
+    final_linear_output = np.dot(new_x, weights) + bias
+    final_prediction_prob = sigmoid(final_linear_output)
+    final_prediction_class = 1 if final_prediction_prob[0] >= 0.5 else 0
+
+    print(f"\nProbability of passing for a student who studied 2.8 hours: {final_prediction_prob[0]:.4f}")
+    print(f"Predicted class: {'Pass' if final_prediction_class == 1 else 'Fail'}")
@@ -1,34 +1,308 @@
 # To transform a high-dimensional dataset into a lower-dimensional one while preserving as much variance as possible
 # useful for data visualization, reducing noise, and speeding up machine learning models
+import time
+
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA as SklearnPCA
 from sklearn.datasets import make_blobs
 
 # Generate a sample dataset with 3 features and 3 distinct clusters.
 # In a real-world scenario, you would load your own data here.
 X, y = make_blobs(n_samples=500, n_features=3, centers=3, random_state=42)
 
-# Print the original shape to see the number of dimensions.
-print(f"Original data shape: {X.shape}")
 
-# Instantiate the PCA model. We want to reduce to 2 principal components.
-pca = PCA(n_components=2)
+# --- THE SAME ALGORITHM FROM SCRATCH, FOR DATA THAT DOES NOT FIT IN MEMORY ---
+# The principal components are the directions in which the data varies most: the
+# eigenvectors of the covariance matrix, or equivalently the right singular vectors of
+# the centered data. A full SVD of a matrix with millions of rows needs it in memory (and
+# a centered copy), so the PCA below reads the rows block by block and offers:
+# - 'covariance': sums up the d x d covariance matrix in one pass and takes its
+#   eigenvectors. Exact, and cheap for up to a few thousand features. The sums are kept
+#   in a CovarianceAccumulator, which can be filled in several processes and merged.
+# - 'randomized': finds the top components without the d x d matrix. It starts from a few
+#   random directions and multiplies them by the covariance (one pass over the rows)
+#   a few times, which turns them towards the directions of largest variance, then solves
+#   a small eigenproblem in the space they span (Halko, Martinsson and Tropp).
+# - partial_fit: incremental PCA, which updates the components chunk by chunk with an SVD
+#   of the current components stacked on the new rows (Ross et al.), so it can follow a
+#   stream that is read once.
+# transform also works block by block, on memory-mapped arrays, and can write the result
+# into one.
+
+# Rows per block of a pass over the data
+BLOCK_ROWS = 65536
+# 'auto' uses a full SVD for data up to this many numbers
+FULL_SVD_MAX_SIZE = 10 ** 6
+# and the covariance matrix up to this many features; above, the randomized solver
+COVARIANCE_MAX_FEATURES = 2000
+
+
+def row_blocks(X):
+    """Yields the rows of X (e.g. a memory-mapped .npy file) in blocks of BLOCK_ROWS, as float64."""
+    for start in range(0, len(X), BLOCK_ROWS):
+        yield np.asarray(X[start:start + BLOCK_ROWS], dtype=np.float64)
+
+
+def flip_signs(components):
+    # An eigenvector times -1 is an eigenvector too. Making the largest entry of every
+    # component positive gives the same signs whichever way they were computed.
+    largest = np.argmax(np.abs(components), axis=1)
+    components *= np.sign(components[np.arange(len(components)), largest])[:, None]
+    return components
+
+
+class CovarianceAccumulator:
+    """
+    The number of rows, mean and scatter matrix (the sum of the outer products of the
+    deviations from the mean) of the rows seen so far. Accumulators over different parts
+    of the data, e.g. filled in different processes (they pickle as a few arrays), merge
+    into the one of all the rows.
+
+    Args:
+        n_features (int): The number of columns.
+    """
+
+    def __init__(self, n_features):
+        self.n_samples = 0
+        self.mean = np.zeros(n_features)
+        self.scatter = np.zeros((n_features, n_features))
+
+    def update(self, X):
+        """Adds the rows of X (an array or a memory-mapped .npy file), block by block."""
+        for block in row_blocks(X):
+            block_mean = block.mean(axis=0)
+            # A new array: the block may be a view of the caller's data
+            block = block - block_mean
+            self._add(len(block), block_mean, block.T @ block)
+        return self
+
+    def merge(self, other):
+        """Adds the rows of another accumulator."""
+        self._add(other.n_samples, other.mean, other.scatter)
+        return self
+
+    def _add(self, n_samples, mean, scatter):
+        # Chan et al.'s parallel formula: the scatters add up, plus the scatter of the two
+        # means around the common one. It works on the deviations, which stay small where
+        # sums of squares of raw values would lose precision.
+        if n_samples == 0:
+            return
+        total = self.n_samples + n_samples
+        delta = mean - self.mean
+        self.scatter += scatter + np.outer(delta, delta) * (self.n_samples * n_samples / total)
+        self.mean += delta * (n_samples / total)
+        self.n_samples = total
+
+    @property
+    def covariance(self):
+        return self.scatter / max(self.n_samples - 1, 1)
+
+
+class PCA:
+    """
+    Principal component analysis.
+
+    Args:
+        n_components (int): The number of components to keep.
+        solver (str): 'full' (SVD of all rows in memory), 'covariance', 'randomized', or
+            'auto' to pick one from the shape of the data. partial_fit always runs
+            incremental PCA.
+        n_oversamples (int): Extra random directions of 'randomized', which make the top
+            components more accurate.
+        n_power_iterations (int): Passes of 'randomized' that turn the random directions
+            towards the components.
+        random_state (int, optional): Seed of the random directions.
+    """
+
+    SOLVERS = ('auto', 'full', 'covariance', 'randomized')
+
+    def __init__(self, n_components=2, solver='auto', n_oversamples=10, n_power_iterations=4, random_state=None):
+        if solver not in self.SOLVERS:
+            raise ValueError(f"solver must be one of {list(self.SOLVERS)}.")
+        self.n_components = n_components
+        self.solver = solver
+        self.n_oversamples = n_oversamples
+        self.n_power_iterations = n_power_iterations
+        self.random_state = random_state
+        self.components = None
+
+    def fit(self, X):
+        """
+        Finds the components of the rows of X (an array or a memory-mapped .npy file).
+        Afterwards components holds them (one per row), explained_variance their
+        variances and explained_variance_ratio their shares of the total variance;
+        solver_used is the solver that ran and fit_time the seconds it took.
+        """
+        start = time.perf_counter()
+        n_rows, n_features = X.shape
+        if self.solver != 'auto':
+            self.solver_used = self.solver
+        elif n_rows * n_features <= FULL_SVD_MAX_SIZE:
+            self.solver_used = 'full'
+        elif n_features <= COVARIANCE_MAX_FEATURES:
+            self.solver_used = 'covariance'
+        else:
+            self.solver_used = 'randomized'
+
+        self.n_samples = n_rows
+        if self.solver_used == 'full':
+            X = np.asarray(X, dtype=np.float64)
+            self.mean = X.mean(axis=0)
+            _, singular_values, components = np.linalg.svd(X - self.mean, full_matrices=False)
+            variances = singular_values ** 2 / max(n_rows - 1, 1)
+            self._set_components(components[:self.n_components], variances[:self.n_components], variances.sum())
+        elif self.solver_used == 'covariance':
+            self.fit_covariance(CovarianceAccumulator(n_features).update(X))
+        else:
+            self._fit_randomized(X)
+        self.fit_time = time.perf_counter() - start
+        return self
+
+    def fit_covariance(self, accumulator):
+        """Takes the components from a (merged) CovarianceAccumulator."""
+        covariance = accumulator.covariance
+        variances, vectors = np.linalg.eigh(covariance)
+        top = np.argsort(variances)[::-1][:self.n_components]
+        self.mean = accumulator.mean.copy()
+        self.n_samples = accumulator.n_samples
+        self._set_components(vectors[:, top].T, np.maximum(variances[top], 0), np.trace(covariance))
+        return self
+
+    def _set_components(self, components, variances, total_variance):
+        self.components = flip_signs(np.ascontiguousarray(components))
+        self.explained_variance = variances
+        self.explained_variance_ratio = variances / total_variance if total_variance > 0 else np.zeros_like(variances)
+        # What partial_fit needs to continue from here
+        divisor = max(self.n_samples - 1, 1)
+        self._singular_values = np.sqrt(variances * divisor)
+        self._total_scatter = total_variance * divisor
+
+    def _fit_randomized(self, X):
+        n_rows, n_features = X.shape
+        rng = np.random.default_rng(self.random_state)
+        # One pass for the mean
+        column_sums, square_sum = np.zeros(n_features), 0.0
+        for block in row_blocks(X):
+            column_sums += block.sum(axis=0)
+        self.mean = column_sums / n_rows
+
+        def covariance_times(Q):
+            # scatter @ Q, from the centered blocks: sum of block.T @ (block @ Q)
+            product = np.zeros_like(Q)
+            for block in row_blocks(X):
+                block = block - self.mean
+                product += block.T @ (block @ Q)
+            return product
+
+        n_directions = min(self.n_components + self.n_oversamples, n_features)
+        Q = np.linalg.qr(rng.standard_normal((n_features, n_directions)))[0]
+        for _ in range(self.n_power_iterations):
+            # Orthonormalized after every pass, so the directions do not all collapse onto
+            # the first component
+            Q = np.linalg.qr(covariance_times(Q))[0]
+        # The eigenproblem of the covariance restricted to the span of Q, and in the same
+        # pass the total variance (the sum of the squared deviations)
+        product = np.zeros_like(Q)
+        for block in row_blocks(X):
+            block = block - self.mean
+            square_sum += np.einsum('ij,ij->', block, block)
+            product += block.T @ (block @ Q)
+        variances, vectors = np.linalg.eigh(Q.T @ product)
+        top = np.argsort(variances)[::-1][:self.n_components]
+        divisor = max(n_rows - 1, 1)
+        self._set_components((Q @ vectors[:, top]).T, np.maximum(variances[top], 0) / divisor, square_sum / divisor)
+
+    def partial_fit(self, chunks):
+        """
+        Incremental PCA over the chunks of an iterable (e.g. memory-mapped slices read
+        from disk). Every chunk needs at least n_components rows. Training continues from
+        the current components (also those of fit), so it can be called again with new
+        chunks.
+        """
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype=np.float64)
+            n_new = len(chunk)
+            chunk_mean = chunk.mean(axis=0)
+            if self.components is None:
+                self.n_samples, self.mean = 0, np.zeros(chunk.shape[1])
+                self._singular_values = np.zeros(0)
+                self.components = np.zeros((0, chunk.shape[1]))
+                self._total_scatter = 0.0
+            n_total = self.n_samples + n_new
+            centered = chunk - chunk_mean
+            # The rows seen so far are summarized by singular values x components. The
+            # last row makes up for the difference between the old mean and the chunk's.
+            correction = np.sqrt(self.n_samples * n_new / n_total) * (self.mean - chunk_mean)
+            stacked = np.vstack([self._singular_values[:, None] * self.components, centered, correction])
+            _, singular_values, components = np.linalg.svd(stacked, full_matrices=False)
+            self._singular_values = singular_values[:self.n_components]
+            self.components = flip_signs(components[:self.n_components])
+            self._total_scatter += np.einsum('ij,ij->', centered, centered) + correction @ correction
+            self.mean = self.mean + (chunk_mean - self.mean) * (n_new / n_total)
+            self.n_samples = n_total
+        divisor = max(self.n_samples - 1, 1)
+        self.explained_variance = self._singular_values ** 2 / divisor
+        self.explained_variance_ratio = self.explained_variance / (self._total_scatter / divisor)
+        self.solver_used = 'incremental'
+        return self
+
+    def transform(self, X, out=None):
+        """
+        Projects the rows of X (an array or a memory-mapped .npy file) onto the
+        components, block by block. out can be an array of (rows, n_components) to write
+        into, e.g. a .npy file opened with np.lib.format.open_memmap.
+        """
+        if out is None:
+            out = np.empty((len(X), len(self.components)))
+        offset = self.mean @ self.components.T
+        for start in range(0, len(X), BLOCK_ROWS):
+            block = np.asarray(X[start:start + BLOCK_ROWS], dtype=np.float64)
+            # (x - mean) @ components.T, without a centered copy of the block
+            projected = block @ self.components.T
+            projected -= offset
+            out[start:start + len(block)] = projected
+        return out
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def inverse_transform(self, X_reduced):
+        """Maps projected rows back to the original features."""
+        return np.asarray(X_reduced) @ self.components + self.mean
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    # Print the original shape to see the number of dimensions.
+    print(f"Original data shape: {X.shape}")
+
+    # Instantiate the PCA model. We want to reduce to 2 principal components.
+    pca = SklearnPCA(n_components=2)
+
+    # Fit the model to the data and transform the data simultaneously.
+    X_reduced = pca.fit_transform(X)
 
-# Fit the model to the data and transform the data simultaneously.
-X_reduced = pca.fit_transform(X)
+    # The new shape confirms the reduction.
+    print(f"Reduced data shape: {X_reduced.shape}")
 
-# The new shape confirms the reduction.
-print(f"Reduced data shape: {X_reduced.shape}")
+    # The from-scratch PCA finds the same components with every solver
+    for solver in ('full', 'covariance', 'randomized'):
+        model = PCA(n_components=2, solver=solver, random_state=0).fit(X)
+        print(f"PCA ({solver}): explained variance ratio {np.round(model.explained_variance_ratio, 4)}, "
+              f"largest difference to scikit-learn {np.abs(np.abs(model.transform(X)) - np.abs(X_reduced)).max():.1e}")
+    model = PCA(n_components=2).partial_fit(X[start:start + 100] for start in range(0, len(X), 100))
+    print(f"PCA (incremental, 100 rows per chunk): explained variance ratio "
+          f"{np.round(model.explained_variance_ratio, 4)}")
 
-# Create a scatter plot of the new, 2-dimensional data.
-plt.figure(figsize=(8, 6))
-# We color the points using the original labels 'y' to see the clusters clearly.
-plt.scatter(X_reduced[:, 0], X_reduced[:, 1], c=y, cmap='viridis', s=50, alpha=0.7)
+    # Create a scatter plot of the new, 2-dimensional data.
+    plt.figure(figsize=(8, 6))
+    # We color the points using the original labels 'y' to see the clusters clearly.
+    plt.scatter(X_reduced[:, 0], X_reduced[:, 1], c=y, cmap='viridis', s=50, alpha=0.7)
 
-# Add clear titles and labels.
-plt.title('2D PCA Projection of a 3D Dataset')
-plt.xlabel('Principal Component 1')
-plt.ylabel('Principal Component 2')
-plt.grid(True)
-plt.show()
\ No newline at end of file
+    # Add clear titles and labels.
+    plt.title('2D PCA Projection of a 3D Dataset')
+    plt.xlabel('Principal Component 1')
+    plt.ylabel('Principal Component 2')
+    plt.grid(True)
+    plt.show()
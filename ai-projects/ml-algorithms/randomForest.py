@@ -0,0 +1,168 @@
+#Random forest: a bagged ensemble of the decision trees from decisionTree.py
+#Every tree learns from a bootstrap sample of the rows (drawn with replacement) and
+#every node only looks at a random subset of the features, so the trees make different
+#mistakes and their majority vote is more accurate than any single tree.
+import os
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from decisionTree import DecisionTreeClassifier, bin_features, EXACT_MAX_SAMPLES
+
+
+# --- Worker side ---
+# The training data is put into shared memory once, and every worker process maps it
+# instead of receiving its own pickled copy. A worker builds one tree per task.
+_worker = {}
+
+
+def _init_worker(shared, settings):
+    for key, (name, shape, dtype) in shared.items():
+        block = shared_memory.SharedMemory(name=name)
+        _worker[key + '_block'] = block
+        _worker[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    _worker.update(settings)
+
+
+def _build_tree(seed):
+    # Everything random about a tree comes from its own seed, so the forest is the same
+    # whichever worker builds which tree
+    rng = np.random.default_rng(seed)
+    y, classes = _worker['y'], _worker['classes']
+    n_samples = y.shape[0]
+    rows = rng.integers(0, n_samples, n_samples)
+
+    tree = DecisionTreeClassifier(_worker['max_depth'], _worker['split_method'], _worker['n_bins'],
+                                  _worker['max_features'], random_state=rng)
+    # The rows left out of the bootstrap sample (about a third) are the tree's out-of-bag rows
+    in_bag = np.zeros(n_samples, dtype=bool)
+    in_bag[rows] = True
+    oob_rows = np.flatnonzero(~in_bag)
+
+    if _worker['split_method'] == 'histogram':
+        binned = _worker['binned']
+        tree.fit_binned(binned, _worker['bin_edges'], y, classes, rows)
+        oob_predictions = tree.predict_binned(binned[:, oob_rows].T)
+        tree.bin_edges = None
+    else:
+        X = _worker['X']
+        tree.fit(X[rows], classes[y[rows]])
+        oob_predictions = tree.predict(X[oob_rows])
+    # The main process only needs the flat arrays to predict, so the node objects and the
+    # random generator are not pickled back with the tree
+    tree.root = tree._rng = tree.random_state = None
+    return tree, oob_rows, np.searchsorted(classes, oob_predictions)
+
+
+class RandomForestClassifier:
+    def __init__(self, n_estimators=100, max_depth=10, max_features='sqrt', split_method='auto',
+                 n_bins=256, n_jobs=None, random_state=None):
+        self.n_estimators = n_estimators   # The number of trees
+        self.max_depth = max_depth         # The maximum depth of every tree
+        self.max_features = max_features   # Features per node, see DecisionTreeClassifier
+        self.split_method = split_method   # 'exact', 'histogram' or 'auto', see DecisionTreeClassifier
+        self.n_bins = n_bins
+        self.n_jobs = n_jobs               # Worker processes building trees (None = all CPU cores)
+        self.random_state = random_state
+        self.trees = []
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        self.classes, y = np.unique(y, return_inverse=True)
+        n_samples = X.shape[0]
+
+        split_method = self.split_method
+        if split_method == 'auto':
+            split_method = 'exact' if n_samples <= EXACT_MAX_SAMPLES else 'histogram'
+        settings = {'classes': self.classes, 'max_depth': self.max_depth, 'split_method': split_method,
+                    'n_bins': self.n_bins, 'max_features': self.max_features}
+        arrays = {'y': y}
+        if split_method == 'histogram':
+            # Binned once for all trees: one byte per value instead of four or eight
+            arrays['binned'], settings['bin_edges'] = bin_features(X, self.n_bins)
+        else:
+            arrays['X'] = X
+
+        blocks = []
+        try:
+            shared = {}
+            for key, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                shared[key] = (block.name, array.shape, array.dtype)
+
+            seeds = np.random.SeedSequence(self.random_state).spawn(self.n_estimators)
+            # Votes of the trees for the rows they did not see in training
+            oob_votes = np.zeros((n_samples, len(self.classes)), dtype=np.int32)
+            self.trees = []
+            with Pool(self.n_jobs or os.cpu_count(), initializer=_init_worker,
+                      initargs=(shared, settings)) as pool:
+                for tree, oob_rows, oob_predictions in pool.imap(_build_tree, seeds):
+                    self.trees.append(tree)
+                    oob_votes[oob_rows, oob_predictions] += 1
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        # The out-of-bag error estimates the test error without a separate test set:
+        # every row is predicted only by the trees that never saw it
+        has_votes = oob_votes.sum(axis=1) > 0
+        oob_correct = np.argmax(oob_votes[has_votes], axis=1) == y[has_votes]
+        self.oob_score = oob_correct.mean() if has_votes.any() else np.nan
+        self.oob_error = 1 - self.oob_score
+        return self
+
+    def predict_proba(self, X):
+        # The share of the trees voting for every class
+        X = np.asarray(X)
+        votes = np.zeros((X.shape[0], len(self.classes)), dtype=np.int32)
+        row_numbers = np.arange(X.shape[0])
+        for tree in self.trees:
+            votes[row_numbers, np.searchsorted(self.classes, tree.predict(X))] += 1
+        return votes / len(self.trees)
+
+    def predict(self, X):
+        # The majority vote of the trees
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+# --- EXAMPLE: compared with scikit-learn's random forest on the same data ---
+
+if __name__ == '__main__':
+    from sklearn.datasets import make_classification
+    from sklearn.ensemble import RandomForestClassifier as SklearnRandomForest
+    from sklearn.model_selection import train_test_split
+
+    N_SAMPLES = 200000
+    N_FEATURES = 20
+    N_TREES = 50
+    MAX_DEPTH = 10
+
+    # A synthetic problem where 10 of the 20 features carry information
+    X, y = make_classification(n_samples=N_SAMPLES, n_features=N_FEATURES, n_informative=10,
+                               random_state=42)
+    X = X.astype(np.float32)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, random_state=42)
+
+    models = {
+        'ours': RandomForestClassifier(n_estimators=N_TREES, max_depth=MAX_DEPTH, random_state=42),
+        'scikit-learn': SklearnRandomForest(n_estimators=N_TREES, max_depth=MAX_DEPTH, max_features='sqrt',
+                                            oob_score=True, n_jobs=-1, random_state=42),
+    }
+    print(f"{N_TREES} trees of depth {MAX_DEPTH} on {X_train.shape[0]} x {N_FEATURES} training rows, "
+          f"{os.cpu_count()} CPU cores")
+    print(f"{'forest':<14}{'fit s':>8}{'predict s':>11}{'test accuracy':>15}{'OOB accuracy':>14}")
+    for name, model in models.items():
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        accuracy = np.mean(model.predict(X_test) == y_test)
+        predict_seconds = time.perf_counter() - start
+
+        oob_score = model.oob_score if name == 'ours' else model.oob_score_
+        print(f"{name:<14}{fit_seconds:>8.2f}{predict_seconds:>11.2f}{accuracy:>15.4f}{oob_score:>14.4f}")
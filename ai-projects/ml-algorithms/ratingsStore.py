@@ -0,0 +1,344 @@
+#Ratings store: the KNN recommender of knearestneighbours.py, kept up to date while rating
+#events keep arriving, without building it again for every new rating.
+# - New ratings go to a small table of pending changes next to the big sparse matrix.
+#   Every product with the ratings is the product with the matrix plus the product with
+#   the changes, so the matrix is only merged with the changes once they have grown to a
+#   few percent of it.
+# - Only the users who rated something get their norm and hash codes updated.
+# - Found neighbours are cached, and a new rating only clears the cached neighbours of
+#   users whose neighbours it can change.
+# - save() writes the store as .npy files that load() maps into memory, so a restart
+#   reads nothing until it is used.
+import json
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from knearestneighbours import KNNRecommender, random_ratings
+
+# The pending changes are merged into the matrix when they pass this share of its
+# ratings (and this many changes)
+MERGE_FRACTION = 0.05
+MIN_MERGE_CHANGES = 10000
+# The hash tables are sorted again when this many users have a new hash
+MAX_MOVED_USERS = 1024
+
+MATRICES = ('ratings', 'squares', 'rated', 'liked')
+
+
+class RatingsStore(KNNRecommender):
+    """
+    A KNNRecommender that ratings can be added to one at a time or in batches.
+
+    Args:
+        n_movies (int): Number of movies. Users are added as their first ratings arrive.
+        The other arguments are those of KNNRecommender.
+    """
+
+    def __init__(self, n_movies, n_neighbors=10, metric='cosine', index='brute', like_threshold=3,
+                 n_tables=8, n_bits=12, random_state=0):
+        super().__init__(n_neighbors, metric, index, like_threshold, n_tables, n_bits, random_state)
+        self.n_movies = n_movies
+        self.fit(sp.csr_matrix((0, n_movies), dtype=np.float32))
+
+    def fit(self, ratings):
+        """Replaces all ratings with a (users x movies) matrix and forgets the cache."""
+        super().fit(ratings)
+        self.n_movies = self.ratings.shape[1]
+        self.squared_norms = self.norms ** 2
+        # Pending changes: user * n_movies + movie, sorted, and the new rating (0 = removed)
+        self.change_keys = np.zeros(0, dtype=np.int64)
+        self.change_values = np.zeros(0, dtype=np.float32)
+        self._deltas = None
+        # Users whose hash changed since the hash tables were sorted
+        self.moved = np.zeros(0, dtype=np.intp)
+        n_users = self.ratings.shape[0]
+        self.cached = np.zeros(n_users, dtype=bool)
+        self.cached_neighbors = np.full((n_users, self.n_neighbors), -1, dtype=np.intp)
+        self.cached_scores = np.full((n_users, self.n_neighbors), -np.inf, dtype=np.float32)
+        return self
+
+    @property
+    def n_users(self):
+        return self.ratings.shape[0]
+
+    # --- Adding ratings ---
+
+    def add_rating(self, user, movie, rating):
+        """Adds or changes one rating, see add_ratings."""
+        return self.add_ratings([user], [movie], [rating])
+
+    def add_ratings(self, users, movies, ratings):
+        """
+        Adds or changes ratings. A rating of 0 removes the user's rating of the movie.
+        When a user rates the same movie more than once, the last rating counts.
+
+        Returns:
+            numpy.ndarray: The users whose cached neighbours were cleared.
+        """
+        users = np.asarray(users, dtype=np.int64)
+        movies = np.asarray(movies, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float32)
+        if len(users) == 0:
+            return np.zeros(0, dtype=np.intp)
+        if users.min() < 0 or movies.min() < 0 or movies.max() >= self.n_movies:
+            raise ValueError(f"Users must be 0 or more and movies between 0 and {self.n_movies - 1}.")
+
+        # The last rating of every (user, movie): np.unique keeps the first of the reversed events
+        keys, last = np.unique((users * self.n_movies + movies)[::-1], return_index=True)
+        new = ratings[::-1][last]
+        users = keys // self.n_movies
+        self._add_users(users.max() + 1)
+        old = self._current(keys)
+
+        # Norms: only the changed ratings are added and taken away
+        changed = np.unique(users)
+        np.add.at(self.squared_norms, users, new.astype(np.float64) ** 2 - old.astype(np.float64) ** 2)
+        self.norms[changed] = np.sqrt(np.maximum(self.squared_norms[changed], 0))
+
+        # The new ratings replace older pending changes of the same (user, movie)
+        self.change_keys, first = np.unique(np.concatenate([keys, self.change_keys]), return_index=True)
+        self.change_values = np.concatenate([new, self.change_values])[first]
+        self._deltas = None
+        if len(self.change_keys) > max(MIN_MERGE_CHANGES, MERGE_FRACTION * self.ratings.nnz):
+            self._merge()
+
+        if self.index == 'lsh':
+            self._rehash(changed)
+        return self._invalidate(changed)
+
+    def _add_users(self, n_users):
+        added = n_users - self.n_users
+        if added <= 0:
+            return
+        for name in MATRICES:
+            getattr(self, name).resize((n_users, self.n_movies))
+        self.squared_norms = np.concatenate([self.squared_norms, np.zeros(added)])
+        self.norms = np.concatenate([self.norms, np.zeros(added)])
+        self.cached = np.concatenate([self.cached, np.zeros(added, dtype=bool)])
+        self.cached_neighbors = np.concatenate([self.cached_neighbors,
+                                                np.full((added, self.n_neighbors), -1, dtype=np.intp)])
+        self.cached_scores = np.concatenate([self.cached_scores,
+                                             np.full((added, self.n_neighbors), -np.inf, dtype=np.float32)])
+        if self.index == 'lsh':
+            # The new users are not in the sorted tables yet
+            self.codes = np.concatenate([self.codes, np.zeros((added, self.n_tables), dtype=self.codes.dtype)])
+            self.moved = np.union1d(self.moved, np.arange(n_users - added, n_users))
+
+    def _current(self, keys):
+        # The current ratings of (user * n_movies + movie) keys: pending, else in the matrix
+        users, movies = np.divmod(keys, self.n_movies)
+        values = np.asarray(self.ratings[users, movies], dtype=np.float32).ravel()
+        positions = np.minimum(np.searchsorted(self.change_keys, keys), len(self.change_keys) - 1)
+        if len(self.change_keys):
+            pending = self.change_keys[positions] == keys
+            values[pending] = self.change_values[positions[pending]]
+        return values
+
+    def _merge(self):
+        # One pass over all ratings that makes the pending changes part of the matrix
+        self._set_ratings(self.ratings + self._delta('ratings'))
+        self.squared_norms = self.norms ** 2
+        self.change_keys = self.change_keys[:0]
+        self.change_values = self.change_values[:0]
+        self._deltas = None
+
+    def _rehash(self, users):
+        codes = self._hash(self._rows(users))
+        self.moved = np.union1d(self.moved, users[(codes != self.codes[users]).any(axis=1)])
+        self.codes[users] = codes
+        if len(self.moved) > MAX_MOVED_USERS:
+            self._sort_hash_tables()
+            self.moved = self.moved[:0]
+
+    def _invalidate(self, users):
+        # Only the scores with the changed users have changed. So the cached neighbours
+        # that can be out of date are those of the changed users themselves, those that
+        # include a changed user, and those whose worst neighbour a changed user now beats.
+        affected = [users, np.flatnonzero(self.cached & np.isin(self.cached_neighbors, users).any(axis=1))]
+        worst = self.cached_scores[:, -1]
+        chunk = max(1, 2**24 // self.n_users)
+        for start in range(0, len(users), chunk):
+            scores = self._scores(users[start:start + chunk])
+            affected.append(np.flatnonzero(((scores > worst) & (scores > -np.inf)).any(axis=0)))
+        affected = np.unique(np.concatenate(affected))
+        affected = affected[self.cached[affected]]
+        self.cached[affected] = False
+        return affected
+
+    # --- The matrices: the merged ratings plus the pending changes ---
+
+    def _delta(self, name):
+        # The pending changes as differences to add to a matrix
+        if self._deltas is None:
+            users, movies = np.divmod(self.change_keys, self.n_movies)
+            new = self.change_values
+            old = np.asarray(self.ratings[users, movies], dtype=np.float32).ravel() if len(users) else new
+            differences = {
+                'ratings': new - old,
+                'squares': new ** 2 - old ** 2,
+                'rated': (new != 0).astype(np.float32) - (old != 0),
+                'liked': (new > self.like_threshold).astype(np.float32) - (old > self.like_threshold),
+            }
+            self._deltas = {key: sp.csr_matrix((value, (users, movies)), shape=self.ratings.shape)
+                            for key, value in differences.items()}
+        return self._deltas[name]
+
+    def _rows(self, users, name='ratings'):
+        rows = super()._rows(users, name)
+        return rows + self._delta(name)[users] if len(self.change_keys) else rows
+
+    def _dot(self, rows, name):
+        products = super()._dot(rows, name)
+        if len(self.change_keys):
+            products += (rows @ self._delta(name).T).toarray()
+        return products
+
+    def _sum_rows(self, weights, name):
+        sums = super()._sum_rows(weights, name)
+        if len(self.change_keys):
+            sums += (weights @ self._delta(name)).toarray()
+        return sums
+
+    def _lsh_candidates(self, codes):
+        query_rows, candidates = super()._lsh_candidates(codes)
+        if len(self.moved) == 0:
+            return query_rows, candidates
+        # Users whose hash changed since the tables were sorted are compared with the
+        # queries directly (in their old bucket they are only an extra candidate)
+        matches = (codes[:, None, :] == self.codes[self.moved][None, :, :]).any(axis=2)
+        rows, columns = np.nonzero(matches)
+        return np.concatenate([query_rows, rows]), np.concatenate([candidates, self.moved[columns]])
+
+    # --- Cached queries ---
+
+    def kneighbors(self, users, k=None):
+        """KNNRecommender.kneighbors, searching only for users whose neighbours are not cached."""
+        if k not in (None, self.n_neighbors):
+            return super().kneighbors(users, k)
+        users = np.asarray(users, dtype=np.intp)
+        missing = np.unique(users[~self.cached[users]])
+        if len(missing):
+            neighbors, scores = super().kneighbors(missing)
+            self.cached_neighbors[missing] = neighbors
+            self.cached_scores[missing] = scores
+            self.cached[missing] = True
+        return self.cached_neighbors[users], self.cached_scores[users]
+
+    # --- Snapshots ---
+
+    def save(self, directory):
+        """Writes the store to a directory of .npy files, for load()."""
+        if len(self.change_keys):
+            self._merge()
+        arrays = {'indptr': self.ratings.indptr, 'indices': self.ratings.indices,
+                  'squared_norms': self.squared_norms, 'cached': self.cached,
+                  'cached_neighbors': self.cached_neighbors, 'cached_scores': self.cached_scores}
+        arrays.update({name: getattr(self, name).data for name in MATRICES})
+        if self.index == 'lsh':
+            if len(self.moved):
+                self._sort_hash_tables()
+                self.moved = self.moved[:0]
+            arrays['codes'] = self.codes
+            arrays['table_keys'] = np.stack([keys for keys, _ in self.tables])
+            arrays['table_orders'] = np.stack([order for _, order in self.tables])
+        settings = {'n_movies': self.n_movies, 'n_neighbors': self.n_neighbors, 'metric': self.metric,
+                    'index': self.index, 'like_threshold': self.like_threshold, 'n_tables': self.n_tables,
+                    'n_bits': self.n_bits, 'random_state': self.random_state}
+
+        os.makedirs(directory, exist_ok=True)
+        # Written next to the old files and renamed over them, so a store loaded from the
+        # same directory keeps its memory maps of the old files
+        for name, array in arrays.items():
+            path = os.path.join(directory, f'{name}.npy')
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+        with open(os.path.join(directory, 'settings.json'), 'w') as f:
+            json.dump({'n_users': self.n_users, **settings}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Opens a store written by save(). The arrays are memory-mapped copy-on-write:
+        pages are read from disk when first used, and changes stay in memory.
+        """
+        with open(os.path.join(directory, 'settings.json')) as f:
+            settings = json.load(f)
+        n_users = settings.pop('n_users')
+        store = cls(**settings)
+
+        def array(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='c')
+
+        structure = (array('indices'), array('indptr'))
+        for name in MATRICES:
+            setattr(store, name, sp.csr_matrix((array(name), *structure), shape=(n_users, store.n_movies)))
+        store.squared_norms = array('squared_norms')
+        store.norms = np.sqrt(store.squared_norms)
+        store.cached = array('cached')
+        store.cached_neighbors = array('cached_neighbors')
+        store.cached_scores = array('cached_scores')
+        if store.index == 'lsh':
+            store.codes = array('codes')
+            store.tables = list(zip(array('table_keys'), array('table_orders')))
+        return store
+
+
+# --- EXAMPLE: a stream of new ratings ---
+
+if __name__ == '__main__':
+    import tempfile
+
+    N_USERS = 20000
+    N_MOVIES = 5000
+    N_EVENTS = 2000
+    BATCH_SIZE = 100
+
+    matrix = random_ratings(N_USERS, N_MOVIES)
+    store = RatingsStore(N_MOVIES, n_neighbors=10)
+    start = time.perf_counter()
+    store.fit(matrix)
+    print(f"Store built from {matrix.nnz} ratings of {N_USERS} users in {time.perf_counter() - start:.2f}s")
+
+    # Everyone's neighbours, cached
+    start = time.perf_counter()
+    store.kneighbors(np.arange(N_USERS))
+    print(f"Neighbours of all {N_USERS} users found in {time.perf_counter() - start:.2f}s")
+
+    # Rating events: existing users rate movies, and some new users arrive
+    rng = np.random.default_rng(1)
+    users = rng.integers(0, N_USERS + 100, N_EVENTS)
+    movies = rng.integers(0, N_MOVIES, N_EVENTS)
+    stars = rng.integers(1, 6, N_EVENTS)
+    cleared = 0
+    start = time.perf_counter()
+    for batch in range(0, N_EVENTS, BATCH_SIZE):
+        events = slice(batch, batch + BATCH_SIZE)
+        cleared += len(store.add_ratings(users[events], movies[events], stars[events]))
+    seconds = time.perf_counter() - start
+    print(f"{N_EVENTS} ratings added in {seconds:.2f}s ({seconds / N_EVENTS * 1000:.2f} ms each), "
+          f"{cleared} cached neighbour lists cleared ({cleared / store.n_users:.1%} of the users)")
+
+    start = time.perf_counter()
+    neighbors, scores = store.kneighbors(np.arange(store.n_users))
+    print(f"Neighbours of all {store.n_users} users brought up to date in {time.perf_counter() - start:.2f}s")
+
+    # The store gives the same neighbours as a recommender built from all ratings at once
+    final = matrix.copy()
+    final.resize((store.n_users, N_MOVIES))
+    final = final.tolil()
+    final[users, movies] = stars
+    rebuilt = KNNRecommender(n_neighbors=10).fit(final.tocsr())
+    _, rebuilt_scores = rebuilt.kneighbors(np.arange(store.n_users))
+    print(f"Same neighbour scores as a full rebuild: {np.allclose(scores, rebuilt_scores, atol=1e-5)}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store.save(directory)
+        start = time.perf_counter()
+        restarted = RatingsStore.load(directory)
+        print(f"Store loaded from its snapshot in {(time.perf_counter() - start) * 1000:.1f} ms")
+        recommended, _ = restarted.recommend(np.arange(5), n=3)
+        print(f"Recommendations for the first 5 users after the restart:\n{recommended}")
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from decisionTree import _find_bins
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.int16, np.float32])
+def test_find_bins_matches_searchsorted(dtype):
+    # Edges from a sample that misses the smallest and largest values, like the quantiles
+    # of bin_features
+    values = np.random.default_rng(0).integers(0, 256, 10000).astype(dtype)
+    edges = np.unique(values[(values >= 20) & (values <= 230)][:50])
+    np.testing.assert_array_equal(_find_bins(values, edges), np.searchsorted(edges, values))
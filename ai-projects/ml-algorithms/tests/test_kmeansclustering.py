@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_blobs
+
+import kmeansclustering
+from kmeansclustering import KMeans
+
+
+@pytest.mark.parametrize('algorithm', ['lloyd', 'hamerly'])
+def test_float32_memmap_matches_array(tmp_path, monkeypatch, algorithm):
+    # Small blocks, so the memory-mapped rows are read over several blocks
+    monkeypatch.setattr(kmeansclustering, 'BLOCK_ROWS', 300)
+    X, _ = make_blobs(n_samples=2000, n_features=4, centers=5, random_state=0)
+    X = X.astype(np.float32)
+    np.save(tmp_path / 'X.npy', X)
+    X_mapped = np.load(tmp_path / 'X.npy', mmap_mode='r')
+
+    in_memory = KMeans(5, algorithm, n_jobs=2, random_state=0).fit(X.astype(np.float64))
+    mapped = KMeans(5, algorithm, n_jobs=2, random_state=0).fit(X_mapped)
+    np.testing.assert_allclose(mapped.centers, in_memory.centers)
+    np.testing.assert_array_equal(mapped.labels, in_memory.labels)
+    np.testing.assert_array_equal(mapped.predict(X_mapped), in_memory.labels)
+    assert mapped.inertia == pytest.approx(in_memory.inertia)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from linearRegression import LinearRegression
+
+
+@pytest.mark.parametrize('n_rows', [100, 15])
+@pytest.mark.parametrize('solver', ['auto', 'normal', 'qr', 'cholesky'])
+def test_dependent_columns_fall_back_to_lstsq(solver, n_rows):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((n_rows, 3))
+    X = np.column_stack([X, X[:, 0]])
+    y = X @ [1.0, 2.0, 3.0, 1.0] + 0.1 * rng.standard_normal(n_rows)
+    model = LinearRegression(solver=solver).fit(X, y)
+    assert model.solver_used == 'lstsq'
+    # The smallest weights split the duplicated column's weight evenly
+    assert model.weights[0] == pytest.approx(model.weights[3])
+
+
+@pytest.mark.parametrize('solver', ['normal', 'cholesky'])
+def test_nearly_dependent_columns_fall_back_to_lstsq(solver):
+    # Columns 1e-9 apart are still independent for QR, but X.T @ X squares that to about
+    # 1e-18, below what float64 resolves
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((100, 3))
+    X = np.column_stack([X, X[:, 0] + 1e-9 * rng.standard_normal(100)])
+    y = X @ [1.0, 2.0, 3.0, 1.0] + 0.1 * rng.standard_normal(100)
+    model = LinearRegression(solver=solver).fit(X, y)
+    assert model.solver_used == 'lstsq'
+    lstsq = LinearRegression(solver='qr').fit(X, y)
+    np.testing.assert_allclose(model.predict(X), lstsq.predict(X), atol=1e-6)
+
+
+@pytest.mark.parametrize('solver', ['normal', 'qr', 'cholesky'])
+def test_independent_columns_use_the_solver(solver):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((100, 4))
+    y = X @ [1.0, 2.0, 3.0, 4.0] + 0.5
+    model = LinearRegression(solver=solver).fit(X, y)
+    assert model.solver_used == solver
+    np.testing.assert_allclose(model.weights, [1.0, 2.0, 3.0, 4.0])
+    assert model.bias == pytest.approx(0.5)
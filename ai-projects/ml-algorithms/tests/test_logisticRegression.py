@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from scipy.special import expit
+
+from logisticRegression import sigmoid
+
+LOGITS = np.array([-800.0, -40.0, -2.0, 0.0, 3.0, 40.0, 800.0])
+
+
+def test_sigmoid_matches_expit():
+    np.testing.assert_allclose(sigmoid(LOGITS), expit(LOGITS), rtol=1e-12, atol=0)
+
+
+def test_sigmoid_in_place():
+    x = LOGITS.copy()
+    result = sigmoid(x, out=x)
+    assert result is x
+    np.testing.assert_allclose(x, expit(LOGITS), rtol=1e-12, atol=0)
+
+
+def test_sigmoid_into_buffer():
+    out = np.empty_like(LOGITS)
+    sigmoid(LOGITS, out=out)
+    np.testing.assert_allclose(out, expit(LOGITS), rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize('x', [0.5, 3, -800, np.float32(2), np.int64(-4)])
+def test_sigmoid_scalar(x):
+    result = sigmoid(x)
+    assert np.ndim(result) == 0
+    np.testing.assert_allclose(result, expit(float(x)), rtol=1e-12, atol=0)
+
+
+def test_sigmoid_integers():
+    x = np.array([-3, 0, 1, 2])
+    np.testing.assert_allclose(sigmoid(x), expit(x.astype(np.float64)), rtol=1e-12, atol=0)
+    np.testing.assert_allclose(sigmoid([1, 2]), expit([1.0, 2.0]), rtol=1e-12, atol=0)